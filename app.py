@@ -1,9 +1,39 @@
 # app.py
-from flask import Flask, render_template, request, redirect, session, url_for, g
+from flask import (Flask, Response, render_template, stream_template, request, redirect, session, url_for, g,
+                   jsonify, has_app_context, has_request_context, before_render_template, template_rendered)
+import time
+import datetime
+import functools
+import decimal
+import threading
+import uuid
+import atexit
+import itertools
+import smtplib
+import click
 import mysql.connector
 import logging
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+
+from db_pool import get_pool, get_replica_pools, PoolTimeout
+from pagination import KeysetSort, fetch_page, get_per_page, stream_page
+import search_index
+import counters
+from query_cache import QueryCache, cached_query
+from passwords import PasswordHasher, PasswordQueueFull
+import migrate
+import catalog_import
+import datagen
+import exports
+import circulation
+import table_versions
+import overdue_fines
+import fines_ledger
+import loan_archive
+import reminders
+import waitlist
+import metrics
+from query_inspector import QueryInspector, RequestLog
 
 try:
     from config import Config
@@ -16,37 +46,211 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__, template_folder='templates')
 app.secret_key = Config.SECRET_KEY
 
+query_cache = QueryCache(max_entries=Config.QUERY_CACHE_MAX_ENTRIES, ttl=Config.QUERY_CACHE_TTL)
+password_hasher = PasswordHasher(
+    Config.PASSWORD_HASH_METHOD,
+    salt_length=Config.PASSWORD_SALT_LENGTH,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+    timeout=Config.PASSWORD_HASH_TIMEOUT,
+)
+
+query_inspector = None
+if Config.QUERY_INSPECTOR:
+    query_inspector = QueryInspector(slow_ms=Config.SLOW_QUERY_MS, n_plus_one=Config.N_PLUS_ONE_THRESHOLD)
+    if Config.QUERY_REPORT_PATH:
+        atexit.register(query_inspector.write_summary, Config.QUERY_REPORT_PATH)
+
 # -------------------------
 # Database connection
 # -------------------------
 def get_db():
     if 'db' not in g:
         try:
-            if not Config.DB_PASSWORD:
+            if Config.DB_BACKEND == 'mysql' and not Config.DB_PASSWORD:
                 raise RuntimeError("DB_PASSWORD not configured in config.py or environment.")
-            g.db = mysql.connector.connect(
-                host=Config.DB_HOST,
-                user=Config.DB_USER,
-                password=Config.DB_PASSWORD,
-                database=Config.DB_NAME,
-                port=Config.DB_PORT,
-                autocommit=False
-            )
-            logger.debug("Database connection established.")
+            started = time.perf_counter()
+            conn = get_pool(Config).acquire()
+            metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started)
+            g.db = metrics.InstrumentedConnection(conn, _observe_query)
+        except PoolTimeout:
+            logger.exception("Database pool exhausted.")
+            raise
         except mysql.connector.Error as err:
             logger.exception("Database connection failed.")
             raise RuntimeError(f"Database connection failed: {err}")
     return g.db
 
+REPLICA_RETRY_SECONDS = 5  # a replica that failed to connect is skipped this long
+_replica_turn = itertools.count()
+_replica_down_until = {}
+
+def _reads_may_use_replica():
+    return (has_request_context() and request.method in ('GET', 'HEAD')
+            and session.get('wrote_until', 0) <= time.time())
+
+def get_read_db():
+    """
+    Connection for queries that only read: a replica when ``DB_REPLICAS``
+    is configured, otherwise (and whenever a replica could be stale for
+    this user) the primary from ``get_db()``.
+
+    Only GET/HEAD requests are sent to a replica, never once the request
+    has used the primary, and not while the session is pinned by a recent
+    write (``_mark_wrote``), so users always read their own writes.
+    Replicas are used in turn; one that cannot be reached is skipped for
+    ``REPLICA_RETRY_SECONDS`` and the read falls back to the primary.
+    """
+    if 'read_db' in g:
+        return g.read_db
+    pools = get_replica_pools(Config)
+    if not pools or 'db' in g or not _reads_may_use_replica():
+        return get_db()
+    turn = next(_replica_turn)
+    for i in range(len(pools)):
+        index = (turn + i) % len(pools)
+        if _replica_down_until.get(index, 0) > time.monotonic():
+            continue
+        pool = pools[index]
+        started = time.perf_counter()
+        try:
+            conn = pool.acquire()
+        except PoolTimeout:
+            logger.warning("Replica %s pool exhausted; trying the next.", index)
+            continue
+        except mysql.connector.Error:
+            logger.exception("Replica %s unreachable; skipping it for %ss.", index, REPLICA_RETRY_SECONDS)
+            _replica_down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+            continue
+        metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started)
+        g.read_pool = pool
+        g.read_db = metrics.InstrumentedConnection(conn, _observe_query)
+        return g.read_db
+    return get_db()
+
+def _mark_wrote():
+    """Pins this session's reads to the primary until replicas have caught up with its write"""
+    if has_request_context() and get_replica_pools(Config):
+        session['wrote_until'] = time.time() + Config.READ_YOUR_WRITES_SECONDS
+
 @app.teardown_appcontext
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
         try:
-            db.close()
-            logger.debug("Database connection closed.")
+            get_pool(Config).release(metrics.unwrap(db))
+        except Exception:
+            logger.exception("Error returning connection to pool.")
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        try:
+            g.pop('read_pool').release(metrics.unwrap(read_db))
+        except Exception:
+            logger.exception("Error returning replica connection to pool.")
+
+def _pool_connection():
+    """(connection, release) pair for work done outside a request, e.g. index builds"""
+    pool = get_pool(Config)
+    started = time.perf_counter()
+    conn = pool.acquire()
+    metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started)
+    return metrics.InstrumentedConnection(conn), lambda c: pool.release(metrics.unwrap(c))
+
+# -------------------------
+# Metrics (Prometheus text format at /metrics) and the query inspector
+# -------------------------
+def _observe_query(sql, params, elapsed, failed):
+    metrics.observe_query(sql, params, elapsed, failed)
+    log = g.get('query_log')
+    if log is not None:
+        log.record(sql, params, elapsed, failed)
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if query_inspector:
+        g.query_log = RequestLog()
+
+@app.after_request
+def _record_request_latency(response):
+    started = g.pop('request_started', None)
+    log = g.get('query_log')
+    labels = (request.endpoint or 'unmatched', request.method, response.status_code)
+    path = request.full_path
+
+    def record():
+        if started is not None:
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, *labels)
+        if query_inspector and log is not None:
+            _report_queries(log, labels[0], labels[1], path, None if response.is_streamed else response)
+
+    if response.is_streamed:
+        # The body (and the queries behind it) is produced after this hook returns;
+        # record once it has been sent in full.
+        response.call_on_close(record)
+    else:
+        record()
+    if get_replica_pools(Config):
+        response.headers['X-DB-Read'] = 'replica' if 'read_db' in g else 'primary'
+    return response
+
+def _report_queries(log, endpoint, method, path, response=None):
+    """Logs the request's query findings; ``response`` gets them as headers unless already sent"""
+    findings = query_inspector.analyze(log)
+    if findings['slow']:
+        try:
+            # A separate connection: the request's own may still have a result pending.
+            conn, release = _pool_connection()
+            try:
+                query_inspector.explain(conn, findings['slow'])
+            finally:
+                release(conn)
         except Exception:
-            pass
+            logger.exception("Could not EXPLAIN slow queries")
+    query_inspector.report(endpoint, method, path, findings)
+    if response is not None:
+        response.headers['X-Query-Count'] = str(findings['queries'])
+        response.headers['X-Query-Time-Ms'] = str(findings['time_ms'])
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_timers', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _record_template_render(sender, template, context, **extra):
+    timers = g.get('template_timers')
+    if timers:
+        metrics.TEMPLATE_RENDER.observe(time.perf_counter() - timers.pop(), template.name or 'string')
+
+def _runtime_stats():
+    pool = get_pool(Config).stats()
+    cache = query_cache.stats()
+    return [
+        ('library_db_pool_connections', 'gauge', 'Pooled connections by state.',
+         [({'state': state}, pool[state]) for state in ('in_use', 'idle')]),
+        ('library_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.',
+         [({}, pool['timeouts'])]),
+        ('library_db_replica_pool_connections', 'gauge', 'Pooled replica connections by replica and state.',
+         [({'replica': str(i), 'state': state}, stats[state])
+          for i, stats in enumerate(p.stats() for p in get_replica_pools(Config))
+          for state in ('in_use', 'idle')]),
+        ('library_query_cache_requests_total', 'counter', 'Query cache lookups by result.',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+    ]
+
+metrics.registry.add_collector(_runtime_stats)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def warm_search_index():
+    # Kicks off the initial build (and periodic rebuilds) in the background
+    # so catalog edits made by other worker processes are picked up.
+    search_index.refresh_async(_pool_connection, Config.SEARCH_INDEX_MAX_AGE)
 
 # -------------------------
 # Helpers
@@ -54,6 +258,130 @@ def close_db(e=None):
 def is_admin_or_employee():
     return session.get('role') in ['admin', 'employee']
 
+def _start_session(user, role):
+    """Stores the authenticated principal in the (signed) session cookie"""
+    session.clear()
+    session['user_id'] = user['id']
+    session['username'] = user['username']
+    session['role'] = role
+
+def _session_member_id():
+    """
+    Returns the logged-in member's id without a database round trip.
+
+    Sessions created before ids were stored fall back to one lookup by
+    username, after which the id is cached in the session.
+    """
+    member_id = session.get('user_id')
+    if member_id is None and session.get('role') == 'member' and session.get('username'):
+        cursor = get_read_db().cursor()
+        cursor.execute("SELECT id FROM Member WHERE username=%s", (session['username'],))
+        row = cursor.fetchone()
+        cursor.close()
+        if row:
+            member_id = session['user_id'] = row[0]
+    return member_id
+
+def _prefix_pattern(value):
+    """LIKE pattern for an index-friendly prefix match on user input"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+def _list_page(base_sql, sorts, default_sort, where=None, params=None, cache_tables=None):
+    """
+    Fetches one keyset page for a listing route using the request's sort/cursor args.
+
+    With ``cache_tables`` the page goes through the query cache and is
+    invalidated by writes to any of those tables.
+    """
+    sort_name = request.args.get('sort', default_sort)
+    sort = sorts.get(sort_name) or sorts[default_sort]
+    per_page = get_per_page(request.args, Config.PAGE_SIZE, Config.PAGE_SIZE_MAX)
+
+    def load():
+        cursor = get_read_db().cursor(dictionary=True)
+        try:
+            return fetch_page(cursor, base_sql, sort, request.args, request.path,
+                              where=where, params=params, per_page=per_page)
+        finally:
+            cursor.close()
+
+    if not cache_tables:
+        return load()
+    return query_cache.get_or_load(_page_cache_key(base_sql, where, params), cache_tables, load)
+
+def _stream_list_page(base_sql, sorts, default_sort, where=None, params=None, cache_tables=None):
+    """
+    ``_list_page`` for streamed templates: rows come off an unbuffered
+    cursor as the template renders them. A cached page is served as is; on
+    a miss the page is cached once it has been rendered in full.
+    """
+    sort_name = request.args.get('sort', default_sort)
+    sort = sorts.get(sort_name) or sorts[default_sort]
+    per_page = get_per_page(request.args, Config.PAGE_SIZE, Config.PAGE_SIZE_MAX)
+
+    on_complete = None
+    if cache_tables:
+        hit, value = query_cache.lookup(_page_cache_key(base_sql, where, params), cache_tables)
+        if hit:
+            return value
+        on_complete = functools.partial(query_cache.store, value)
+    cursor = get_read_db().cursor(dictionary=True, buffered=False)
+    return stream_page(cursor, base_sql, sort, request.args, request.path,
+                       where=where, params=params, per_page=per_page, on_complete=on_complete)
+
+def _page_cache_key(base_sql, where, params):
+    return ('page', request.path, base_sql, tuple(where or ()), tuple(params or ()),
+            tuple(sorted(request.args.items(multi=True))))
+
+STREAM_CHUNK = 8192
+
+def _render_stream(template_name, **context):
+    """
+    Streams a template as it renders. The first chunk (the document head)
+    goes out at once so the browser can start on styles; after that output
+    is sent in chunks of about ``STREAM_CHUNK`` bytes.
+    """
+    rendered = stream_template(template_name, **context)  # binds the request context now
+
+    def chunks():
+        pending, size = [], 0
+        for i, piece in enumerate(rendered):
+            pending.append(piece)
+            size += len(piece)
+            if i == 0 or size >= STREAM_CHUNK:
+                yield ''.join(pending)
+                pending, size = [], 0
+        if pending:
+            yield ''.join(pending)
+
+    response = Response(chunks(), mimetype='text/html')
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return response
+
+def _cached_rows(sql, params=(), tables=()):
+    """Reference-data SELECT served from the query cache (dictionary rows)"""
+    return cached_query(query_cache, get_read_db, sql, params, tables)
+
+def _tables_changed(*tables):
+    """Invalidates cached reads and API ETags of ``tables``; call after the write commits"""
+    query_cache.invalidate(*tables)
+    _mark_wrote()
+    if not (has_app_context() and 'db' in g):
+        return  # background jobs bump Table_Version inside their own transactions
+    try:
+        cursor = g.db.cursor()
+        table_versions.bump(cursor, *tables)
+        g.db.commit()
+        cursor.close()
+    except Exception:
+        logger.exception("Could not bump table versions for %s", tables)
+
+def _busy_response():
+    response = app.make_response(("Server busy, please try again in a moment.", 503))
+    response.headers['Retry-After'] = '2'
+    return response
+
 def _add_no_cache_headers(response):
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
@@ -82,31 +410,30 @@ def login():
         try:
             # Use dictionary cursor for select to keep key access consistent
             cursor = db.cursor(dictionary=True)
-            cursor.execute(f"SELECT * FROM {table} WHERE username=%s", (username,))
+            cursor.execute(f"SELECT id, username, password FROM {table} WHERE username=%s", (username,))
             user = cursor.fetchone()
             cursor.close()
 
-            if not user:
+            matches, needs_rehash = password_hasher.verify(user['password'] if user else None, password)
+            if not matches:
                 return "Login Failed: Invalid username or password.", 401
 
-            stored = user.get('password', '')
-
-            # If the stored password looks like a werkzeug hash (starts with algo:)
-            if stored.startswith(('pbkdf2:', 'scrypt:', 'argon2:')):
-                if check_password_hash(stored, password):
-                    session['username'] = user['username']
-                    session['role'] = role
-                    return redirect(url_for(f'{role}_dashboard'))
-                else:
-                    return "Login Failed: Invalid username or password.", 401
-            else:
-                # Plaintext stored (not recommended). Compare directly.
-                if stored == password:
-                    session['username'] = user['username']
-                    session['role'] = role
-                    return redirect(url_for(f'{role}_dashboard'))
-                else:
-                    return "Login Failed: Invalid username or password.", 401
+            if needs_rehash:
+                # Upgrade plaintext / outdated hashes now that we know the password.
+                try:
+                    new_hash = password_hasher.hash(password)
+                    cursor = db.cursor()
+                    cursor.execute(f"UPDATE {table} SET password=%s WHERE id=%s", (new_hash, user['id']))
+                    db.commit()
+                    cursor.close()
+                except Exception:
+                    db.rollback()
+                    logger.exception("Password rehash failed; keeping the existing value")
+
+            _start_session(user, role)
+            return redirect(url_for(f'{role}_dashboard'))
+        except PasswordQueueFull:
+            return _busy_response()
         except Exception as e:
             logger.exception("Login Error")
             return f"Login Error: {str(e)}", 500
@@ -128,13 +455,18 @@ def register():
         if not (username and email and raw_password):
             return "All fields are required.", 400
 
-        hashed_password = generate_password_hash(raw_password)
+        try:
+            hashed_password = password_hasher.hash(raw_password)
+        except PasswordQueueFull:
+            return _busy_response()
         db = get_db()
         try:
             cursor = db.cursor()
             cursor.execute("INSERT INTO Member (username, email, password) VALUES (%s, %s, %s)",
                            (username, email, hashed_password))
+            counters.bump(cursor, counters.MEMBERS)
             db.commit()
+            _tables_changed('Member')
             cursor.close()
             return redirect(url_for('login'))
         except mysql.connector.Error as e:
@@ -147,35 +479,37 @@ def register():
 # -------------------------
 # Dashboard helpers & routes
 # -------------------------
-def _get_dashboard_stats(role, username=None):
+MEMBER_STATS_SQL = """
+    SELECT (SELECT value FROM Stat_Counter WHERE name=%s),
+           COALESCE(mc.reservations, 0), COALESCE(mc.fines, 0)
+    FROM Member m
+    LEFT JOIN Member_Counter mc ON mc.member_id = m.id
+    WHERE m.id=%s"""
+
+def _get_dashboard_stats(role, member_id=None):
     stats = {'books_count': 0, 'reservations_count': 0, 'fines_count': 0, 'members_count': 0}
-    db = get_db()
+    db = get_read_db()
     try:
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT COUNT(*) AS count FROM Book")
-        stats['books_count'] = cursor.fetchone()['count'] or 0
-
-        if role == 'admin':
-            cursor.execute("SELECT COUNT(*) AS count FROM Member")
-            stats['members_count'] = cursor.fetchone()['count'] or 0
-            cursor.execute("SELECT COUNT(*) AS count FROM Reservation")
-            stats['reservations_count'] = cursor.fetchone()['count'] or 0
-            cursor.execute("SELECT COUNT(*) AS count FROM Fine")
-            stats['fines_count'] = cursor.fetchone()['count'] or 0
-        elif role == 'employee':
-            cursor.execute("SELECT COUNT(*) AS count FROM Reservation")
-            stats['reservations_count'] = cursor.fetchone()['count'] or 0
-            cursor.execute("SELECT COUNT(*) AS count FROM Fine")
-            stats['fines_count'] = cursor.fetchone()['count'] or 0
-        elif role == 'member' and username:
-            cursor.execute("SELECT id FROM Member WHERE username=%s", (username,))
-            member = cursor.fetchone()
-            if member:
-                member_id = member['id']
-                cursor.execute("SELECT COUNT(*) AS count FROM Reservation WHERE member_id=%s", (member_id,))
-                stats['reservations_count'] = cursor.fetchone()['count'] or 0
-                cursor.execute("SELECT COUNT(*) AS count FROM Fine WHERE member_id=%s", (member_id,))
-                stats['fines_count'] = cursor.fetchone()['count'] or 0
+        # Counts come from the Stat_Counter/Member_Counter tables kept up to
+        # date by the write routes (see counters.py), not COUNT(*) scans.
+        cursor = db.cursor()
+        if role in ['admin', 'employee']:
+            totals = counters.read_totals(cursor)
+            stats['books_count'] = totals[counters.BOOKS]
+            stats['reservations_count'] = totals[counters.RESERVATIONS]
+            stats['fines_count'] = totals[counters.FINES]
+            if role == 'admin':
+                stats['members_count'] = totals[counters.MEMBERS]
+        elif role == 'member' and member_id:
+            cursor.execute(MEMBER_STATS_SQL, (counters.BOOKS, member_id))
+            row = cursor.fetchone()
+            if not row:
+                # The account was deleted after this session was issued.
+                cursor.close()
+                return None
+            stats['books_count'] = row[0] or 0
+            stats['reservations_count'] = row[1]
+            stats['fines_count'] = row[2]
 
         cursor.close()
     except Exception:
@@ -202,10 +536,19 @@ def employee_dashboard():
 def member_dashboard():
     if session.get('role') != 'member':
         return redirect(url_for('login'))
-    stats = _get_dashboard_stats('member', session.get('username'))
+    stats = _get_dashboard_stats('member', _session_member_id())
+    if stats is None:
+        session.clear()
+        return redirect(url_for('login'))
     response = app.make_response(render_template('member_dashboard.html', **stats))
     return _add_no_cache_headers(response)
 
+@app.route('/admin/db-pool')
+def db_pool_stats():
+    if session.get('role') != 'admin':
+        return redirect(url_for('login'))
+    return jsonify(get_pool(Config).stats())
+
 # -------------------------
 # Book management
 # -------------------------
@@ -214,14 +557,8 @@ def add_book():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
 
-    db = get_db()
-    # Use dictionary cursor for read operations
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM Author")
-    authors = cursor.fetchall()
-    cursor.execute("SELECT id, name FROM Publisher")
-    publishers = cursor.fetchall()
-    cursor.close()
+    authors = _cached_rows("SELECT id, name FROM Author", tables=('Author',))
+    publishers = _cached_rows("SELECT id, name FROM Publisher", tables=('Publisher',))
 
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
@@ -242,6 +579,7 @@ def add_book():
             return render_template('add_book.html', authors=authors, publishers=publishers,
                                    error="Quantity must be an integer.")
 
+        db = get_db()
         try:
             cursor = db.cursor()
             # Insert new author if provided
@@ -249,6 +587,8 @@ def add_book():
                 cursor.execute("INSERT INTO Author (name) VALUES (%s)", (new_author_name,))
                 db.commit()
                 author_id = cursor.lastrowid
+                _tables_changed('Author')
+                search_index.add_author(author_id, new_author_name)
             else:
                 # allow author_id empty -> set None
                 author_id = int(author_id) if author_id else None
@@ -258,12 +598,18 @@ def add_book():
                 cursor.execute("INSERT INTO Publisher (name) VALUES (%s)", (new_publisher_name,))
                 db.commit()
                 publisher_id = cursor.lastrowid
+                _tables_changed('Publisher')
+                search_index.add_publisher(publisher_id, new_publisher_name)
             else:
                 publisher_id = int(publisher_id) if publisher_id else None
 
             cursor.execute("INSERT INTO Book (title, author_id, publisher_id, quantity) VALUES (%s, %s, %s, %s)",
                            (title, author_id, publisher_id, q_int))
+            book_id = cursor.lastrowid
+            counters.bump(cursor, counters.BOOKS)
             db.commit()
+            _tables_changed('Book')
+            search_index.upsert_book(book_id, title, author_id, publisher_id)
             cursor.close()
             return redirect(url_for('manage_books'))
         except Exception as e:
@@ -273,31 +619,45 @@ def add_book():
 
     return render_template('add_book.html', authors=authors, publishers=publishers)
 
+BOOK_LIST_SQL = """SELECT Book.id, Book.title, Author.name AS author, Publisher.name AS publisher, Book.quantity
+                   FROM Book
+                   LEFT JOIN Author ON Book.author_id = Author.id
+                   LEFT JOIN Publisher ON Book.publisher_id = Publisher.id"""
+
+BOOK_SORTS = {
+    'title': KeysetSort('Book.title', 'title', 'Book.id'),
+    'id': KeysetSort('Book.id', 'id', 'Book.id'),
+    'newest': KeysetSort('Book.id', 'id', 'Book.id', descending=True),
+}
+
+def _book_filters():
+    where, params = [], []
+    q = request.args.get('q', '').strip()
+    if q:
+        where.append("Book.title LIKE %s")
+        params.append(_prefix_pattern(q))
+    if request.args.get('in_stock'):
+        where.append("Book.quantity > 0")
+    return where, params
+
 @app.route('/manage-books')
 def manage_books():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""SELECT Book.id, Book.title, Author.name AS author, Publisher.name AS publisher, Book.quantity 
-                      FROM Book
-                      LEFT JOIN Author ON Book.author_id = Author.id 
-                      LEFT JOIN Publisher ON Book.publisher_id = Publisher.id""")
-    books = cursor.fetchall()
-    cursor.close()
-    return render_template('manage_books.html', books=books)
+    where, params = _book_filters()
+    page = _stream_list_page(BOOK_LIST_SQL, BOOK_SORTS, 'title', where, params,
+                             cache_tables=('Book', 'Author', 'Publisher'))
+    return _render_stream('manage_books.html', books=page, page=page)
 
 @app.route('/edit-book/<int:book_id>', methods=['GET', 'POST'])
 def edit_book(book_id):
     if not is_admin_or_employee():
         return redirect(url_for('login'))
 
+    authors = _cached_rows("SELECT id, name FROM Author", tables=('Author',))
+    publishers = _cached_rows("SELECT id, name FROM Publisher", tables=('Publisher',))
     db = get_db()
     cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM Author")
-    authors = cursor.fetchall()
-    cursor.execute("SELECT id, name FROM Publisher")
-    publishers = cursor.fetchall()
     cursor.execute("SELECT * FROM Book WHERE id=%s", (book_id,))
     book = cursor.fetchone()
     cursor.close()
@@ -323,7 +683,13 @@ def edit_book(book_id):
 
             cursor.execute("UPDATE Book SET title=%s, author_id=%s, publisher_id=%s, quantity=%s WHERE id=%s",
                            (title, author_id, publisher_id, q_int, book_id))
+            # New copies on the shelf go to the waitlist first.
+            served = waitlist.promote(cursor, book_id, q_int, Config.FINE_BLOCK_THRESHOLD)
+            if served:
+                cursor.execute("UPDATE Book SET quantity = quantity - %s WHERE id=%s", (len(served), book_id))
             db.commit()
+            _tables_changed('Book', *(('Reservation', 'Waitlist') if served else ()))
+            search_index.upsert_book(book_id, title, author_id, publisher_id)
             cursor.close()
             return redirect(url_for('manage_books'))
         except Exception as e:
@@ -339,37 +705,178 @@ def delete_book(book_id):
         return redirect(url_for('login'))
     db = get_db()
     cursor = db.cursor()
+    counters.forget_book_reservations(cursor, book_id)
     cursor.execute("DELETE FROM Book WHERE id=%s", (book_id,))
+    if cursor.rowcount:
+        counters.bump(cursor, counters.BOOKS, -1)
     db.commit()
+    _tables_changed('Book', 'Reservation', 'Issued_Books')
+    search_index.remove_book(book_id)
     cursor.close()
     return redirect(url_for('manage_books'))
 
+# -------------------------
+# Catalog search
+# -------------------------
+@app.route('/search')
+def search_catalog():
+    if session.get('role') not in ['admin', 'employee', 'member']:
+        return redirect(url_for('login'))
+    query = request.args.get('q', '').strip()
+    results = []
+    elapsed_ms = None
+    if query:
+        index = search_index.ensure_built(_pool_connection)
+        started = time.perf_counter()
+        ranked = index.search(query, limit=Config.SEARCH_RESULTS_LIMIT)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if ranked:
+            # Titles and names come from the index; only live stock needs the database.
+            ids = [book_id for book_id, _ in ranked]
+            db = get_db()
+            cursor = db.cursor(dictionary=True)
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"SELECT id, quantity FROM Book WHERE id IN ({placeholders})", tuple(ids))
+            quantities = {row['id']: row['quantity'] for row in cursor.fetchall()}
+            cursor.close()
+            for book_id, score in ranked:
+                if book_id not in quantities:
+                    continue
+                title, author, publisher = index.describe(book_id)
+                results.append({'id': book_id, 'title': title, 'author': author, 'publisher': publisher,
+                                'quantity': quantities[book_id], 'score': round(score, 3)})
+    return render_template('search.html', query=query, results=results, elapsed_ms=elapsed_ms)
+
+@app.route('/admin/password-stats')
+def password_stats():
+    if session.get('role') != 'admin':
+        return redirect(url_for('login'))
+    return jsonify(password_hasher.stats())
+
+@app.route('/admin/cache-stats')
+def cache_stats():
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    return jsonify(query_cache.stats())
+
+@app.route('/admin/query-report')
+def query_report():
+    if session.get('role') != 'admin':
+        return redirect(url_for('login'))
+    if not query_inspector:
+        return "Query inspector is disabled (set QUERY_INSPECTOR=1).", 404
+    return jsonify(query_inspector.summary())
+
+@app.route('/admin/search-stats')
+def search_stats():
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    return jsonify(search_index.get_index().stats())
+
+# -------------------------
+# Bulk catalog import
+# -------------------------
+_running_imports = set()
+
+def _catalog_changed():
+    """Refreshes derived catalog state after a bulk change"""
+    _tables_changed('Book', 'Author', 'Publisher')
+    search_index.refresh_async(_pool_connection, force=True)
+
+def _run_import_job(job_id, path):
+    conn, release = _pool_connection()
+    try:
+        with open(path, 'rb') as raw:
+            catalog_import.run_import(conn, job_id, catalog_import.open_text(raw),
+                                      chunk_size=Config.IMPORT_CHUNK_SIZE)
+    except Exception:
+        logger.exception("Catalog import job %s stopped", job_id)
+    finally:
+        release(conn)
+        _running_imports.discard(job_id)
+        _catalog_changed()
+
+def _start_import_job(job_id, path):
+    _running_imports.add(job_id)
+    threading.Thread(target=_run_import_job, args=(job_id, path),
+                     name=f'catalog-import-{job_id}', daemon=True).start()
+
+@app.route('/admin/import-catalog', methods=['GET', 'POST'])
+def import_catalog():
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    db = get_db()
+    if request.method == 'POST':
+        upload = request.files.get('feed')
+        if not upload or not upload.filename:
+            return "Please choose a CSV or JSONL file.", 400
+        try:
+            fmt = request.form.get('format') or catalog_import.detect_format(upload.filename)
+            if fmt not in catalog_import.FORMATS:
+                raise catalog_import.CatalogImportError(f"Unsupported format {fmt!r}")
+        except catalog_import.CatalogImportError as e:
+            return str(e), 400
+        os.makedirs(Config.IMPORT_FOLDER, exist_ok=True)
+        path = os.path.join(Config.IMPORT_FOLDER, f"{uuid.uuid4().hex}.{fmt}")
+        upload.save(path)  # streamed to disk in chunks by werkzeug
+        job_id = catalog_import.create_job(db, path, fmt)
+        _start_import_job(job_id, path)
+        return redirect(url_for('import_status', job_id=job_id))
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM Import_Job ORDER BY id DESC LIMIT 20")
+    jobs = cursor.fetchall()
+    cursor.close()
+    return render_template('import_catalog.html', jobs=jobs, running=_running_imports)
+
+@app.route('/admin/import-catalog/<int:job_id>')
+def import_status(job_id):
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    job = catalog_import.get_job(get_db(), job_id)
+    if not job:
+        return "Import job not found.", 404
+    return render_template('import_catalog.html', jobs=[job], running=_running_imports, single=True)
+
+@app.route('/admin/import-catalog/<int:job_id>/resume', methods=['POST'])
+def resume_import(job_id):
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    job = catalog_import.get_job(get_db(), job_id)
+    if not job:
+        return "Import job not found.", 404
+    if job['status'] == 'completed' or job_id in _running_imports:
+        return redirect(url_for('import_status', job_id=job_id))
+    if not os.path.exists(job['source']):
+        return "The uploaded file for this job is no longer available.", 410
+    _start_import_job(job_id, job['source'])
+    return redirect(url_for('import_status', job_id=job_id))
+
 # -------------------------
 # Issue & return books
 # -------------------------
+ISSUABLE_BOOKS_SQL = "SELECT id, title FROM Book WHERE quantity > 0"
+ISSUE_MEMBERS_SQL = "SELECT id, username FROM Member"
+
 @app.route('/admin/issue-book', methods=['GET', 'POST'])
 @app.route('/employee/issue-book', methods=['GET', 'POST'])
 def issue_book():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
 
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, title FROM Book WHERE quantity > 0")
-    books = cursor.fetchall()
-    cursor.execute("SELECT id, username FROM Member")
-    members = cursor.fetchall()
-    cursor.close()
+    books = _cached_rows(ISSUABLE_BOOKS_SQL, tables=('Book',))
+    members = _cached_rows(ISSUE_MEMBERS_SQL, tables=('Member',))
 
     if request.method == 'POST':
         book_id = request.form.get('book_id')
         member_id = request.form.get('member_id')
-        issue_date = request.form.get('issue_date')
-        return_date = request.form.get('return_date')
+        issue_date = _parse_date(request.form.get('issue_date'))
+        return_date = _parse_date(request.form.get('return_date'))
 
         if not (book_id and member_id and issue_date and return_date):
-            return "All fields are required.", 400
+            return "All fields are required (dates as YYYY-MM-DD).", 400
 
+        db = get_db()
         try:
             cursor = db.cursor()
             cursor.execute("UPDATE Book SET quantity = quantity - 1 WHERE id=%s AND quantity > 0", (book_id,))
@@ -382,6 +889,7 @@ def issue_book():
                 VALUES (%s, %s, %s, %s)
             """, (book_id, member_id, issue_date, return_date))
             db.commit()
+            _tables_changed('Book', 'Issued_Books')
             cursor.close()
             return redirect(url_for('view_issued_books'))
         except Exception as e:
@@ -391,25 +899,59 @@ def issue_book():
 
     return render_template('issue_book.html', books=books, members=members)
 
+ISSUED_LIST_SQL = """
+    SELECT ib.id, b.title AS book_title, m.username AS member_name,
+           ib.issue_date, ib.return_date, ib.returned, ib.book_id
+    FROM Issued_Books ib
+    JOIN Book b ON ib.book_id = b.id
+    JOIN Member m ON ib.member_id = m.id"""
+
+ISSUED_SORTS = {
+    'issue_date': KeysetSort('ib.issue_date', 'issue_date', 'ib.id', descending=True),
+    'oldest': KeysetSort('ib.issue_date', 'issue_date', 'ib.id'),
+    'id': KeysetSort('ib.id', 'id', 'ib.id', descending=True),
+}
+
+def _issued_filters():
+    where, params = [], []
+    status = request.args.get('status', 'all')
+    if status == 'outstanding':
+        where.append("ib.returned = FALSE")
+    elif status == 'returned':
+        where.append("ib.returned = TRUE")
+    member_id = request.args.get('member_id', type=int)
+    if member_id:
+        where.append("ib.member_id = %s")
+        params.append(member_id)
+    return where, params
+
 @app.route('/admin/issued-books')
 @app.route('/employee/issued-books')
 def view_issued_books():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
 
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT ib.id, b.title AS book_title, m.username AS member_name,
-               ib.issue_date, ib.return_date, ib.returned, ib.book_id
-        FROM Issued_Books ib
-        JOIN Book b ON ib.book_id = b.id
-        JOIN Member m ON ib.member_id = m.id
-        ORDER BY ib.issue_date DESC
-    """)
-    issued_books = cursor.fetchall()
-    cursor.close()
-    return render_template('issued_books.html', issued_books=issued_books)
+    where, params = _issued_filters()
+    page = _stream_list_page(ISSUED_LIST_SQL, ISSUED_SORTS, 'issue_date', where, params)
+    return _render_stream('issued_books.html', issued_books=page, page=page)
+
+HISTORY_LIST_SQL = """
+    SELECT ib.id, b.title AS book_title, m.username AS member_name,
+           ib.issue_date, ib.return_date, ib.returned_at, ib.book_id
+    FROM Issued_Books_Archive ib
+    JOIN Book b ON ib.book_id = b.id
+    JOIN Member m ON ib.member_id = m.id"""
+
+@app.route('/admin/loan-history')
+@app.route('/employee/loan-history')
+def loan_history():
+    """Archived (long since returned) loans; current ones are on ``view_issued_books``"""
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+
+    where, params = _issued_filters()
+    page = _stream_list_page(HISTORY_LIST_SQL, ISSUED_SORTS, 'issue_date', where, params)
+    return _render_stream('loan_history.html', loans=page, page=page)
 
 @app.route('/admin/return-book/<int:issue_id>')
 @app.route('/employee/return-book/<int:issue_id>')
@@ -417,27 +959,70 @@ def return_book(issue_id):
     if not is_admin_or_employee():
         return redirect(url_for('login'))
 
-    db = get_db()
     try:
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT book_id FROM Issued_Books WHERE id=%s AND returned=FALSE", (issue_id,))
-        rec = cursor.fetchone()
-        cursor.close()
-
-        if not rec:
-            return "Book already returned or not found.", 404
-
-        book_id = rec['book_id']
-        cursor = db.cursor()
-        cursor.execute("UPDATE Issued_Books SET returned=TRUE WHERE id=%s", (issue_id,))
-        cursor.execute("UPDATE Book SET quantity = quantity + 1 WHERE id=%s", (book_id,))
-        db.commit()
-        cursor.close()
-        return redirect(url_for('view_issued_books'))
+        result, = circulation.apply_batch(get_db(), returns=[issue_id], max_balance=Config.FINE_BLOCK_THRESHOLD)
     except Exception as e:
-        db.rollback()
         logger.exception("Error returning book")
         return f"Error returning book: {str(e)}", 500
+    if not result['ok']:
+        return "Book already returned or not found.", 404
+    _circulation_changed([result])
+    return redirect(url_for('view_issued_books'))
+
+def _circulation_tables(results):
+    """Tables a batch of issue/return results touched"""
+    if not any(r['ok'] for r in results):
+        return []
+    tables = ['Book', 'Issued_Books']
+    if any(r.get('reserved_for') for r in results):
+        tables += ['Reservation', 'Waitlist']
+    return tables
+
+def _circulation_changed(results):
+    """Invalidates what a batch of issue/return results touched"""
+    tables = _circulation_tables(results)
+    if tables:
+        _tables_changed(*tables)
+
+@app.route('/admin/circulation-desk', methods=['GET', 'POST'])
+@app.route('/employee/circulation-desk', methods=['GET', 'POST'])
+def circulation_desk():
+    """Batch issue/return: JSON ``{"issues": [[book_id, member_id], ...], "returns": [issue_id, ...]}`` or the scan form"""
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    if request.method == 'GET':
+        return render_template('circulation_desk.html')
+
+    payload = request.get_json(silent=True) if request.is_json else None
+    if payload is not None:
+        issues, returns = payload.get('issues') or [], payload.get('returns') or []
+        issue_date, return_date = payload.get('issue_date'), payload.get('return_date')
+    else:
+        issues, returns = circulation.parse_lines(request.form.get('scans', ''))
+        issue_date, return_date = request.form.get('issue_date'), request.form.get('return_date')
+    today = datetime.date.today()
+    # Malformed dates become None, which apply_batch rejects for issues.
+    issue_date = _parse_date(issue_date, today)
+    return_date = _parse_date(return_date, today + datetime.timedelta(days=Config.LOAN_PERIOD_DAYS))
+
+    try:
+        results = circulation.apply_batch(get_db(), issues, returns, issue_date, return_date,
+                                          Config.FINE_BLOCK_THRESHOLD)
+    except circulation.CirculationError as e:
+        if payload is not None:
+            return jsonify(error=str(e)), 400
+        return render_template('circulation_desk.html', error=str(e)), 400
+    except Exception as e:
+        logger.exception("Circulation batch failed")
+        if payload is not None:
+            return jsonify(error=str(e)), 500
+        return render_template('circulation_desk.html', error=str(e)), 500
+    _circulation_changed(results)
+
+    summary = {'ok': sum(r['ok'] for r in results), 'failed': sum(not r['ok'] for r in results)}
+    if payload is not None:
+        return jsonify(results=results, **summary)
+    return render_template('circulation_desk.html', results=results, summary=summary)
 
 # -------------------------
 # Member management
@@ -454,13 +1039,18 @@ def add_member():
         if not (username and email and raw_password):
             return "All fields required.", 400
 
-        hashed = generate_password_hash(raw_password)
+        try:
+            hashed = password_hasher.hash(raw_password)
+        except PasswordQueueFull:
+            return _busy_response()
         db = get_db()
         try:
             cursor = db.cursor()
             cursor.execute("INSERT INTO Member (username, email, password) VALUES (%s, %s, %s)",
                            (username, email, hashed))
+            counters.bump(cursor, counters.MEMBERS)
             db.commit()
+            _tables_changed('Member')
             cursor.close()
             return redirect(url_for('view_members'))
         except Exception as e:
@@ -470,17 +1060,25 @@ def add_member():
 
     return render_template('add_member.html')
 
+MEMBER_LIST_SQL = "SELECT id, username, email FROM Member"
+
+MEMBER_SORTS = {
+    'username': KeysetSort('username', 'username', 'id'),
+    'id': KeysetSort('id', 'id', 'id'),
+}
+
 @app.route('/admin/view-members')
 def view_members():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
     try:
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT id, username, email FROM Member")
-        members = cursor.fetchall()
-        cursor.close()
-        return render_template('view_members.html', members=members)
+        where, params = [], []
+        q = request.args.get('q', '').strip()
+        if q:
+            where.append("username LIKE %s")
+            params.append(_prefix_pattern(q))
+        page = _stream_list_page(MEMBER_LIST_SQL, MEMBER_SORTS, 'username', where, params)
+        return _render_stream('view_members.html', members=page, page=page)
     except Exception as e:
         logger.exception("Error fetching members")
         return render_template('view_members.html', members=[], error=str(e))
@@ -491,8 +1089,12 @@ def delete_member(member_id):
         return redirect(url_for('login'))
     db = get_db()
     cursor = db.cursor()
+    counters.forget_member(cursor, member_id)
     cursor.execute("DELETE FROM Member WHERE id=%s", (member_id,))
+    if cursor.rowcount:
+        counters.bump(cursor, counters.MEMBERS, -1)
     db.commit()
+    _tables_changed('Member', 'Reservation', 'Fine', 'Fine_Ledger', 'Issued_Books', 'Issued_Books_Archive')
     cursor.close()
     return redirect(url_for('view_members'))
 
@@ -503,11 +1105,7 @@ def delete_member(member_id):
 def view_authors():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM Author")
-    authors = cursor.fetchall()
-    cursor.close()
+    authors = _cached_rows("SELECT id, name FROM Author", tables=('Author',))
     return render_template('authors.html', authors=authors)
 
 @app.route('/admin/add-author', methods=['GET', 'POST'])
@@ -520,6 +1118,8 @@ def add_author():
         cursor = db.cursor()
         cursor.execute("INSERT INTO Author (name) VALUES (%s)", (name,))
         db.commit()
+        _tables_changed('Author')
+        search_index.add_author(cursor.lastrowid, name)
         cursor.close()
         return redirect(url_for('view_authors'))
     return render_template('add_author.html')
@@ -528,11 +1128,7 @@ def add_author():
 def view_publishers():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM Publisher")
-    publishers = cursor.fetchall()
-    cursor.close()
+    publishers = _cached_rows("SELECT id, name FROM Publisher", tables=('Publisher',))
     return render_template('publishers.html', publishers=publishers)
 
 @app.route('/admin/add-publisher', methods=['GET', 'POST'])
@@ -545,6 +1141,8 @@ def add_publisher():
         cursor = db.cursor()
         cursor.execute("INSERT INTO Publisher (name) VALUES (%s)", (name,))
         db.commit()
+        _tables_changed('Publisher')
+        search_index.add_publisher(cursor.lastrowid, name)
         cursor.close()
         return redirect(url_for('view_publishers'))
     return render_template('add_publisher.html')
@@ -552,21 +1150,34 @@ def add_publisher():
 # -------------------------
 # Reservations / Vendors / Fines
 # -------------------------
+RESERVATION_LIST_SQL = """
+    SELECT r.id, b.title AS book_title, m.username AS member_username, r.reservation_date
+    FROM Reservation AS r
+    JOIN Book AS b ON r.book_id = b.id
+    JOIN Member AS m ON r.member_id = m.id"""
+
+RESERVATION_SORTS = {
+    'reservation_date': KeysetSort('r.reservation_date', 'reservation_date', 'r.id', descending=True),
+    'oldest': KeysetSort('r.reservation_date', 'reservation_date', 'r.id'),
+    'id': KeysetSort('r.id', 'id', 'r.id', descending=True),
+}
+
+def _reservation_filters():
+    where, params = [], []
+    for arg, column in (('book_id', 'r.book_id'), ('member_id', 'r.member_id')):
+        value = request.args.get(arg, type=int)
+        if value:
+            where.append(f"{column} = %s")
+            params.append(value)
+    return where, params
+
 @app.route('/view-reservations')
 def view_reservations():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT r.id, b.title AS book_title, m.username AS member_username, r.reservation_date
-        FROM Reservation AS r
-        JOIN Book AS b ON r.book_id = b.id
-        JOIN Member AS m ON r.member_id = m.id
-    """)
-    reservations = cursor.fetchall()
-    cursor.close()
-    return render_template('view_reservations.html', reservations=reservations)
+    where, params = _reservation_filters()
+    page = _list_page(RESERVATION_LIST_SQL, RESERVATION_SORTS, 'reservation_date', where, params)
+    return render_template('view_reservations.html', reservations=page, page=page)
 
 @app.route('/admin/vendors')
 def manage_vendors():
@@ -590,6 +1201,7 @@ def add_vendor():
         cursor = db.cursor()
         cursor.execute("INSERT INTO Vendor (name, contact) VALUES (%s, %s)", (name, contact))
         db.commit()
+        _tables_changed('Vendor')
         cursor.close()
         return redirect(url_for('manage_vendors'))
     return render_template('add_vendor.html')
@@ -602,45 +1214,76 @@ def delete_vendor_by_id(vendor_id):
     cursor = db.cursor()
     cursor.execute("DELETE FROM Vendor WHERE id=%s", (vendor_id,))
     db.commit()
+    _tables_changed('Vendor')
     cursor.close()
     return redirect(url_for('manage_vendors'))
 
+FINE_LIST_SQL = """
+    SELECT Fine.id, Fine.member_id, Member.username, Fine.amount, Fine.reason, Fine.date_assessed
+    FROM Fine
+    JOIN Member ON Fine.member_id = Member.id"""
+
+FINE_SORTS = {
+    'date_assessed': KeysetSort('Fine.date_assessed', 'date_assessed', 'Fine.id', descending=True),
+    'oldest': KeysetSort('Fine.date_assessed', 'date_assessed', 'Fine.id'),
+    'amount': KeysetSort('Fine.amount', 'amount', 'Fine.id', descending=True),
+}
+
+def _fine_filters():
+    where, params = [], []
+    member_id = request.args.get('member_id', type=int)
+    if member_id:
+        where.append("Fine.member_id = %s")
+        params.append(member_id)
+    return where, params
+
 @app.route('/admin/fines')
 def manage_fines():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT Fine.id, Member.username, Fine.amount, Fine.reason, Fine.date_assessed
-        FROM Fine
-        JOIN Member ON Fine.member_id = Member.id
-    """)
-    fines = cursor.fetchall()
-    cursor.close()
-    return render_template('manage_fines.html', fines=fines)
+    where, params = _fine_filters()
+    page = _list_page(FINE_LIST_SQL, FINE_SORTS, 'date_assessed', where, params)
+    return render_template('manage_fines.html', fines=page, page=page)
 
 @app.route('/admin/fine/add', methods=['GET', 'POST'])
 def add_fine():
     if not is_admin_or_employee():
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, username FROM Member")
-    members = cursor.fetchall()
-    cursor.close()
+    members = _cached_rows("SELECT id, username FROM Member", tables=('Member',))
 
     if request.method == 'POST':
-        member_id = request.form.get('member_id')
+        member_id = request.form.get('member_id', type=int)
         amount = request.form.get('amount')
         reason = request.form.get('reason', '').strip()
-        date_assessed = request.form.get('date_assessed')
+        date_assessed = _parse_date(request.form.get('date_assessed'), default=datetime.date.today())
+        amount = _parse_amount(amount)
+        if member_id is None or not any(m['id'] == member_id for m in members):
+            return "Choose an existing member.", 400
+        if amount is None:
+            return "Amount must be a positive number.", 400
+        if date_assessed is None:
+            return "Date must be YYYY-MM-DD.", 400
 
+        db = get_db()
         cursor = db.cursor()
-        cursor.execute("INSERT INTO Fine (member_id, amount, reason, date_assessed) VALUES (%s, %s, %s, %s)",
-                       (member_id, amount, reason, date_assessed))
-        db.commit()
-        cursor.close()
+        try:
+            cursor.execute("INSERT INTO Fine (member_id, amount, reason, date_assessed) VALUES (%s, %s, %s, %s)",
+                           (member_id, amount, reason, date_assessed))
+            fines_ledger.charge(cursor, member_id, amount, fine_id=cursor.lastrowid, note=reason)
+            counters.bump(cursor, counters.FINES)
+            counters.bump_member(cursor, member_id, fines=1)
+            db.commit()
+        except (mysql.connector.IntegrityError, mysql.connector.DataError) as e:
+            # e.g. the member was deleted since the (cached) list was loaded
+            db.rollback()
+            return f"Could not add fine: {e.msg}", 400
+        except Exception as e:
+            db.rollback()
+            logger.exception("Error adding fine")
+            return f"Error adding fine: {str(e)}", 500
+        finally:
+            cursor.close()
+        _tables_changed('Fine', 'Fine_Ledger')
         return redirect(url_for('manage_fines'))
 
     return render_template('add_fine.html', members=members)
@@ -651,11 +1294,125 @@ def delete_fine(fine_id):
         return redirect(url_for('login'))
     db = get_db()
     cursor = db.cursor()
+    cursor.execute("SELECT member_id, amount, issue_id FROM Fine WHERE id=%s FOR UPDATE", (fine_id,))
+    fine = cursor.fetchone()
     cursor.execute("DELETE FROM Fine WHERE id=%s", (fine_id,))
+    if fine and cursor.rowcount:
+        counters.bump(cursor, counters.FINES, -1)
+        if fine[0] is not None:
+            counters.bump_member(cursor, fine[0], fines=-1)
+            fines_ledger.waive(cursor, fine[0], fine[1] or 0, fine_id=fine_id, note=f"Fine #{fine_id} deleted")
+        if fine[2] is not None:
+            # An engine fine: keep assess-fines from charging the loan again.
+            cursor.execute("INSERT IGNORE INTO Fine_Waiver (issue_id, fine_id) VALUES (%s, %s)", (fine[2], fine_id))
     db.commit()
+    _tables_changed('Fine', 'Fine_Ledger')
     cursor.close()
     return redirect(url_for('manage_fines'))
 
+def _parse_date(value, default=None):
+    """A YYYY-MM-DD date from form input; ``default`` when empty, None when malformed"""
+    value = str(value or '').strip()
+    if not value:
+        return default
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _parse_amount(value):
+    """A positive money amount from form input, rounded to cents; None when invalid"""
+    try:
+        amount = decimal.Decimal(str(value).strip()).quantize(decimal.Decimal('0.01'))
+    except (decimal.InvalidOperation, ValueError):
+        return None
+    return amount if amount.is_finite() and amount > 0 else None
+
+LEDGER_LIST_SQL = """
+    SELECT l.id, l.member_id, Member.username, l.entry_type, l.amount, l.fine_id, l.note, l.created_at
+    FROM Fine_Ledger l
+    JOIN Member ON Member.id = l.member_id"""
+
+LEDGER_SORTS = {
+    'newest': KeysetSort('l.id', 'id', 'l.id', descending=True),
+    'oldest': KeysetSort('l.id', 'id', 'l.id'),
+}
+
+def _member_balance(member_id):
+    cursor = get_read_db().cursor()
+    owed = fines_ledger.balance(cursor, member_id)
+    cursor.close()
+    return owed
+
+@app.route('/admin/fines/ledger')
+def fine_ledger():
+    """Ledger entries, newest first; with ``?member_id=`` the member's balance and a payment form"""
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    where, params = [], []
+    member_id = request.args.get('member_id', type=int)
+    balance = None
+    if member_id:
+        where.append("l.member_id = %s")
+        params.append(member_id)
+        balance = _member_balance(member_id)
+    page = _list_page(LEDGER_LIST_SQL, LEDGER_SORTS, 'newest', where, params)
+    return render_template('fine_ledger.html', entries=page, page=page, member_id=member_id, balance=balance,
+                           error=request.args.get('error'))
+
+@app.route('/admin/fines/payment', methods=['POST'])
+def record_payment():
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    member_id = request.form.get('member_id', type=int)
+    amount = _parse_amount(request.form.get('amount', ''))
+    if not member_id:
+        return "Member is required.", 400
+    if amount is None:
+        return redirect(url_for('fine_ledger', member_id=member_id, error="Amount must be a positive number."))
+    note = request.form.get('note', '').strip() or f"Payment taken by {session.get('username')}"
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        fines_ledger.pay(cursor, member_id, amount, note=note)
+        db.commit()
+    except fines_ledger.PaymentError as e:
+        db.rollback()
+        return redirect(url_for('fine_ledger', member_id=member_id, error=str(e)))
+    finally:
+        cursor.close()
+    _tables_changed('Fine_Ledger')
+    return redirect(url_for('fine_ledger', member_id=member_id))
+
+# -------------------------
+# Streaming exports
+# -------------------------
+_EXPORT_FILTERS = {
+    'catalog': _book_filters,
+    'circulation': _issued_filters,
+    'history': _issued_filters,
+    'fines': _fine_filters,
+}
+
+@app.route('/admin/export/<name>.<fmt>')
+def export_data(name, fmt):
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+    if name not in exports.EXPORTS or fmt not in exports.FORMATS:
+        return "Unknown export.", 404
+    where, params = _EXPORT_FILTERS[name]()
+    try:
+        # A dedicated connection: the response body outlives the request
+        # context, and an unbuffered result set ties up its connection.
+        conn, release = _pool_connection()
+    except PoolTimeout:
+        return _busy_response()
+    response = Response(exports.stream_export(conn, name, fmt, where, params), mimetype=exports.FORMATS[fmt])
+    response.call_on_close(lambda: release(conn))
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}-{time.strftime("%Y%m%d")}.{fmt}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return _add_no_cache_headers(response)
+
 # -------------------------
 # Member-specific pages
 # -------------------------
@@ -663,81 +1420,441 @@ def delete_fine(fine_id):
 def view_books():
     if session.get('role') != 'member':
         return redirect(url_for('login'))
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT Book.id, Book.title, Author.name AS author, Publisher.name AS publisher, Book.quantity 
-        FROM Book
-        LEFT JOIN Author ON Book.author_id = Author.id
-        LEFT JOIN Publisher ON Book.publisher_id = Publisher.id
-        ORDER BY Book.title
-    """)
-    books = cursor.fetchall()
-    cursor.close()
-    return render_template('view_books.html', books=books)
+    where, params = _book_filters()
+    page = _list_page(BOOK_LIST_SQL, BOOK_SORTS, 'title', where, params,
+                      cache_tables=('Book', 'Author', 'Publisher'))
+    return render_template('view_books.html', books=page, page=page)
+
+def _fines_block_message(owed):
+    return (f"Reservation blocked: you owe ₹{owed:.2f} in fines, more than the ₹{Config.FINE_BLOCK_THRESHOLD} "
+            f"limit. Please settle your fines at the desk.")
+
+RESERVABLE_BOOKS_SQL = """
+    SELECT Book.id, Book.title, Author.name AS author, Book.quantity
+    FROM Book
+    LEFT JOIN Author ON Book.author_id = Author.id
+    WHERE Book.quantity > 0
+"""
 
 @app.route('/member/reserve-book', methods=['GET', 'POST'])
 def reserve_book():
     if session.get('role') != 'member':
         return redirect(url_for('login'))
-    db = get_db()
-    username = session.get('username')
-
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id FROM Member WHERE username=%s", (username,))
-    member = cursor.fetchone()
-    member_id = member['id'] if member else None
-    cursor.close()
+    member_id = _session_member_id()
 
     if not member_id:
         return "Could not find member information for reservation.", 404
 
     if request.method == 'POST':
         book_id = request.form.get('book_id')
+        db = get_db()
         try:
             cursor = db.cursor()
+            owed = fines_ledger.balance(cursor, member_id)
+            if fines_ledger.over_limit(owed, Config.FINE_BLOCK_THRESHOLD):
+                cursor.close()
+                return _fines_block_message(owed), 403
             cursor.execute("UPDATE Book SET quantity = quantity - 1 WHERE id=%s AND quantity > 0", (book_id,))
             if cursor.rowcount == 0:
-                db.rollback()
-                return "Reservation failed: Book is out of stock or does not exist.", 400
+                # No copy on the shelf: take a place in the queue once instead of retrying.
+                cursor.execute("SELECT id FROM Book WHERE id=%s FOR UPDATE", (book_id,))
+                if cursor.fetchone() is None:
+                    db.rollback()
+                    return "Reservation failed: Book does not exist.", 404
+                # Promoted entries leave the queue, so only a member still waiting is turned away.
+                place = waitlist.position(cursor, book_id, member_id)
+                if place is not None:
+                    db.rollback()
+                    return f"You are already number {place} on the waitlist for this book.", 409
+                place = waitlist.enqueue(cursor, book_id, member_id)
+                db.commit()
+                _tables_changed('Waitlist')
+                cursor.close()
+                return f"Book is out of stock. You are number {place} on the waitlist."
             cursor.execute("INSERT INTO Reservation (book_id, member_id, reservation_date) VALUES (%s, %s, CURDATE())",
                            (book_id, member_id))
+            counters.bump(cursor, counters.RESERVATIONS)
+            counters.bump_member(cursor, member_id, reservations=1)
             db.commit()
+            _tables_changed('Book', 'Reservation')
             cursor.close()
             return "Book reserved successfully!"
+        except mysql.connector.IntegrityError:
+            # Member row is gone (account deleted); the FK rejects the insert.
+            db.rollback()
+            session.clear()
+            return redirect(url_for('login'))
         except Exception as e:
             db.rollback()
             logger.exception("Reservation failed")
             return f"Reservation failed: {str(e)}", 500
 
+    books = _cached_rows(RESERVABLE_BOOKS_SQL, tables=('Book', 'Author'))
+    return render_template('reserve_book.html', books=books)
+
+@app.route('/member/waitlist', methods=['GET', 'POST'])
+def my_waitlist():
+    if session.get('role') != 'member':
+        return redirect(url_for('login'))
+    member_id = _session_member_id()
+    if not member_id:
+        return "Could not find member information.", 404
+
+    db = get_db()
+    if request.method == 'POST':
+        cursor = db.cursor()
+        if waitlist.leave(cursor, request.form.get('book_id', type=int), member_id):
+            db.commit()
+            _tables_changed('Waitlist')
+        cursor.close()
+        return redirect(url_for('my_waitlist'))
+
     cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT Book.id, Book.title, Author.name AS author, Book.quantity 
-        FROM Book 
-        LEFT JOIN Author ON Book.author_id = Author.id 
-        WHERE Book.quantity > 0
-    """)
-    books = cursor.fetchall()
+    entries = waitlist.for_member(cursor, member_id)
     cursor.close()
-    return render_template('reserve_book.html', books=books)
+    return render_template('my_waitlist.html', entries=entries)
 
 @app.route('/member/my-fines')
 def my_fines():
     if session.get('role') != 'member':
         return redirect(url_for('login'))
-    db = get_db()
-    username = session.get('username')
+    member_id = _session_member_id()
+    if not member_id:
+        return "Could not find member information.", 404
 
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id FROM Member WHERE username=%s", (username,))
-    member = cursor.fetchone()
-    if member:
-        cursor.execute("SELECT * FROM Fine WHERE member_id=%s ORDER BY date_assessed DESC", (member['id'],))
-        fines = cursor.fetchall()
-        cursor.close()
-        return render_template('my_fines.html', fines=fines)
+    balance = _member_balance(member_id)
+    page = _list_page(LEDGER_LIST_SQL, LEDGER_SORTS, 'newest', ["l.member_id = %s"], [member_id])
+    return render_template('my_fines.html', entries=page, page=page, balance=balance)
+
+# -------------------------
+# JSON API (v1)
+# -------------------------
+def _api_error(message, status):
+    return jsonify(error=message), status
+
+def _api_rows(rows):
+    """Dates as ISO 8601 (jsonify would use HTTP-date) and Decimals as strings"""
+    out = []
+    for row in rows:
+        item = {}
+        for key, value in row.items():
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            elif isinstance(value, decimal.Decimal):
+                value = str(value)
+            item[key] = value
+        out.append(item)
+    return out
+
+def _api_conditional(tables, build):
+    """
+    Serves ``build()`` with an ETag derived from the tables' change versions.
+
+    A matching If-None-Match is answered 304 after a single Table_Version
+    read; ``build`` (the real query and serialization) is skipped. ``build``
+    returning None means 404.
+    """
+    cursor = get_read_db().cursor()
+    versions = table_versions.read(cursor, tables)
     cursor.close()
-    return "Could not find member information.", 404
+    scope = (request.path, tuple(sorted(request.args.items(multi=True))),
+             session.get('role'), session.get('user_id'))
+    etag = table_versions.etag(scope, versions)
+    if etag in request.if_none_match:
+        response = app.make_response(('', 304))
+    else:
+        body = build()
+        if body is None:
+            return _api_error("Not found.", 404)
+        response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _api_page(base_sql, sorts, default_sort, where, params, tables):
+    def build():
+        page = _list_page(base_sql, sorts, default_sort, where, params)
+        return {'data': _api_rows(page), 'next': page.next_url, 'prev': page.prev_url}
+    return _api_conditional(tables, build)
+
+def _api_member_scope(column, where, params):
+    """Restricts a member to their own rows; returns False when not logged in"""
+    if is_admin_or_employee():
+        return True
+    if session.get('role') != 'member':
+        return False
+    member_id = _session_member_id()
+    if not member_id:
+        return False
+    where.append(f"{column} = %s")
+    params.append(member_id)
+    return True
+
+@app.route('/api/v1/books')
+def api_books():
+    if not session.get('role'):
+        return _api_error("Authentication required.", 401)
+    where, params = _book_filters()
+    return _api_page(BOOK_LIST_SQL, BOOK_SORTS, 'title', where, params, ('Book', 'Author', 'Publisher'))
+
+@app.route('/api/v1/books/<int:book_id>')
+def api_book(book_id):
+    if not session.get('role'):
+        return _api_error("Authentication required.", 401)
+
+    def build():
+        cursor = get_read_db().cursor(dictionary=True)
+        cursor.execute(BOOK_LIST_SQL + " WHERE Book.id = %s", (book_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        if not row:
+            return None
+        row['available'] = row['quantity'] > 0
+        return {'data': _api_rows([row])[0]}
+
+    return _api_conditional(('Book', 'Author', 'Publisher'), build)
+
+@app.route('/api/v1/availability')
+def api_availability():
+    """Stock for up to PAGE_SIZE_MAX books: ``?ids=1,2,3``"""
+    if not session.get('role'):
+        return _api_error("Authentication required.", 401)
+    try:
+        ids = sorted({int(i) for i in request.args.get('ids', '').split(',') if i.strip()})
+    except ValueError:
+        return _api_error("ids must be a comma-separated list of integers.", 400)
+    if not ids or len(ids) > Config.PAGE_SIZE_MAX:
+        return _api_error(f"Pass between 1 and {Config.PAGE_SIZE_MAX} ids.", 400)
+
+    def build():
+        cursor = get_read_db().cursor()
+        cursor.execute(f"SELECT id, quantity FROM Book WHERE id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+        stock = dict(cursor.fetchall())
+        cursor.close()
+        return {'data': [{'book_id': i, 'quantity': stock[i], 'available': stock[i] > 0}
+                         for i in ids if i in stock]}
+
+    return _api_conditional(('Book',), build)
+
+@app.route('/api/v1/reservations')
+def api_reservations():
+    where, params = _reservation_filters() if is_admin_or_employee() else ([], [])
+    if not _api_member_scope('r.member_id', where, params):
+        return _api_error("Authentication required.", 401)
+    return _api_page(RESERVATION_LIST_SQL, RESERVATION_SORTS, 'reservation_date', where, params,
+                     ('Reservation', 'Book', 'Member'))
+
+@app.route('/api/v1/issued-books')
+def api_issued_books():
+    if not is_admin_or_employee():
+        return _api_error("Staff only.", 403 if session.get('role') else 401)
+    where, params = _issued_filters()
+    return _api_page(ISSUED_LIST_SQL, ISSUED_SORTS, 'issue_date', where, params,
+                     ('Issued_Books', 'Book', 'Member'))
+
+@app.route('/api/v1/fines')
+def api_fines():
+    where, params = _fine_filters() if is_admin_or_employee() else ([], [])
+    if not _api_member_scope('Fine.member_id', where, params):
+        return _api_error("Authentication required.", 401)
+    return _api_page(FINE_LIST_SQL, FINE_SORTS, 'date_assessed', where, params, ('Fine', 'Member'))
+
+# -------------------------
+# Maintenance commands
+# -------------------------
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute dashboard counters and fine balances from the base tables (run from cron)."""
+    conn, release = _pool_connection()
+    try:
+        counters.reconcile(conn)
+        fines_ledger.reconcile(conn)
+    finally:
+        release(conn)
+
+@app.cli.command('db-migrate')
+@click.option('--status', is_flag=True, help='List applied and pending migrations without applying.')
+@click.option('--baseline', is_flag=True, help='Load mysql.sql (schema and seed data) into an empty database first.')
+def db_migrate_command(status, baseline):
+    """Apply pending schema migrations from migrations/."""
+    conn, release = _pool_connection()
+    try:
+        if baseline and not status:
+            migrate.load_baseline(conn)
+            click.echo("Loaded mysql.sql")
+        if status:
+            applied = migrate.applied_versions(conn)
+            for migration in migrate.discover():
+                state = 'applied' if migration.version in applied else 'pending'
+                click.echo(f"{migration.version:04d}_{migration.name}: {state}")
+            return
+        done = migrate.migrate(conn)
+        for migration in done:
+            click.echo(f"Applied {migration.version:04d}_{migration.name}")
+        if not done:
+            click.echo("Schema is up to date.")
+    finally:
+        release(conn)
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN the app's queries and fail on full scans with no usable index."""
+    import query_plans
+
+    if Config.DB_BACKEND != 'mysql':
+        raise click.UsageError("check-query-plans reads MySQL's EXPLAIN output; set DB_BACKEND=mysql.")
+    conn, release = _pool_connection()
+    try:
+        problems = query_plans.run_checks(conn)
+    finally:
+        release(conn)
+    for name, problem in problems:
+        click.echo(f"FAIL {name}: {problem}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("All query plans use an index.")
+
+@app.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(catalog_import.FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=Config.IMPORT_CHUNK_SIZE, show_default=True)
+@click.option('--resume', 'resume_job', type=int, help='Continue an interrupted job from its last committed chunk.')
+def import_catalog_command(path, fmt, chunk_size, resume_job):
+    """Stream a CSV/JSONL catalog feed into Book, creating authors and publishers as needed."""
+    conn, release = _pool_connection()
+    try:
+        if resume_job:
+            job_id = resume_job
+            if not catalog_import.get_job(conn, job_id):
+                raise click.ClickException(f"Import job {job_id} does not exist")
+        else:
+            try:
+                fmt = fmt or catalog_import.detect_format(path)
+            except catalog_import.CatalogImportError as e:
+                raise click.ClickException(str(e))
+            job_id = catalog_import.create_job(conn, os.path.abspath(path), fmt)
+            click.echo(f"Started import job {job_id}")
+
+        def report(p):
+            click.echo(f"job {p['job_id']}: {p['records_done']} records, {p['books_inserted']} books, "
+                       f"{p['records_rejected']} rejected ({p['rate']} rec/s)")
+
+        with open(path, 'rb') as raw:
+            job = catalog_import.run_import(conn, job_id, catalog_import.open_text(raw),
+                                            chunk_size=chunk_size, progress=report)
+        click.echo(f"Completed job {job_id}: {job['books_inserted']} books, "
+                   f"{job['authors_created']} new authors, {job['publishers_created']} new publishers")
+    finally:
+        release(conn)
+
+@app.cli.command('export')
+@click.argument('name', type=click.Choice(sorted(exports.EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(exports.FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Defaults to stdout.')
+def export_command(name, fmt, output):
+    """Stream the catalog, circulation history or fines as CSV/NDJSON."""
+    conn, release = _pool_connection()
+    try:
+        for chunk in exports.stream_export(conn, name, fmt):
+            output.write(chunk)
+    finally:
+        release(conn)
+
+@app.cli.command('assess-fines')
+@click.option('--as-of', type=click.DateTime(formats=['%Y-%m-%d']), help='Assess as of this date (default today).')
+@click.option('--batch-size', default=Config.FINE_BATCH_SIZE, show_default=True)
+@click.option('--full', is_flag=True, help='Revisit every open overdue loan, e.g. after changing the rate or cap.')
+def assess_fines_command(as_of, batch_size, full):
+    """Upsert overdue fines for open loans past their return date (run daily from cron)."""
+    rates = overdue_fines.FineRates(Config.FINE_RATE_PER_DAY, Config.FINE_MAX_PER_LOAN, Config.FINE_GRACE_DAYS)
+    conn, release = _pool_connection()
+    try:
+        run = overdue_fines.run(conn, rates, as_of=as_of.date() if as_of else None, batch_size=batch_size,
+                                full=full, progress=lambda p: click.echo(
+                                    f"run {p['run_id']}: {p['loans_scanned']} loans ({p['rate']} loans/s)"))
+    finally:
+        release(conn)
+    click.echo(f"Run {run['id']} as of {run['as_of']}: {run['loans_scanned']} loans scanned, "
+               f"{run['fines_created']} fines created, {run['fines_updated']} updated")
+
+@app.cli.command('archive-loans')
+@click.option('--older-than', 'older_than', default=Config.ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive loans returned more than this many days ago.')
+@click.option('--batch-size', default=Config.ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option('--pause', default=Config.ARCHIVE_PAUSE, show_default=True, help='Seconds to sleep between batches.')
+@click.option('--max-batches', type=int, help='Stop after this many batches (resume with the next run).')
+def archive_loans_command(older_than, batch_size, pause, max_batches):
+    """Move long-returned loans from Issued_Books to Issued_Books_Archive (run nightly from cron)."""
+    conn, release = _pool_connection()
+    try:
+        moved = loan_archive.archive(conn, older_than, batch_size=batch_size, pause=pause, max_batches=max_batches,
+                                     progress=lambda n: click.echo(f"{n} loans archived"))
+    finally:
+        release(conn)
+    click.echo(f"Archived {moved} loans returned more than {older_than} days ago.")
+
+@app.cli.command('send-reminders')
+@click.option('--as-of', type=click.DateTime(formats=['%Y-%m-%d']), help='Send as of this date (default today).')
+@click.option('--kind', 'kinds', multiple=True, type=click.Choice(reminders.KINDS),
+              help='Only send this kind of notice (repeatable; default all).')
+@click.option('--batch-size', default=Config.REMINDER_BATCH_SIZE, show_default=True)
+@click.option('--concurrency', default=Config.MAIL_CONCURRENCY, show_default=True, help='Parallel SMTP sessions.')
+@click.option('--dry-run', is_flag=True, help='Count the loans and messages due without claiming or sending.')
+def send_reminders_command(as_of, kinds, batch_size, concurrency, dry_run):
+    """Mail due-soon reminders and overdue notices, at most once per loan and due date (run daily from cron)."""
+    mailer = reminders.Mailer(reminders.MailSettings.from_config(Config), retries=Config.MAIL_MAX_RETRIES,
+                              per_connection=Config.MAIL_MESSAGES_PER_CONNECTION)
+    conn, release = _pool_connection()
+    try:
+        totals = reminders.run(conn, mailer, render_template, as_of=as_of.date() if as_of else None,
+                               days_before=Config.REMINDER_DAYS_BEFORE, overdue_days=Config.REMINDER_OVERDUE_DAYS,
+                               batch_size=batch_size, concurrency=concurrency, kinds=kinds or reminders.KINDS,
+                               dry_run=dry_run, progress=lambda kind, t: click.echo(
+                                   f"{kind}: {t['sent']} loans sent, {t['failed']} failed"))
+    except (OSError, smtplib.SMTPException) as e:
+        raise click.ClickException(f"Mail run stopped, unsent loans are left for the next run: {e}")
+    finally:
+        release(conn)
+    if dry_run:
+        click.echo(f"Would send {totals['messages']} messages covering {totals['loans']} loans.")
+    else:
+        click.echo(f"{totals['messages']} messages for {totals['loans']} loans: {totals['sent']} sent, "
+                   f"{totals['failed']} failed, {totals['retry_later']} left for the next run.")
+
+@app.cli.command('generate-data')
+@click.option('--profile', type=click.Choice(sorted(datagen.PROFILES)), default='small', show_default=True)
+@click.option('--books', type=int, help='Override the profile (likewise for the options below).')
+@click.option('--authors', type=int)
+@click.option('--publishers', type=int)
+@click.option('--members', type=int)
+@click.option('--loans', type=int)
+@click.option('--reservations', type=int)
+@click.option('--fines', type=int)
+@click.option('--years', default=5, show_default=True, help='Years of circulation history.')
+@click.option('--seed', type=int, help='Random seed, for a reproducible dataset.')
+@click.option('--loader', type=click.Choice(datagen.LOADERS), default='insert', show_default=True)
+@click.option('--batch-size', default=datagen.DEFAULT_BATCH_SIZE, show_default=True, help='Rows per INSERT.')
+@click.option('--keep-indexes', is_flag=True, help='Load with secondary indexes in place.')
+@click.option('--password', default='password', show_default=True, help='Password of every generated member.')
+@click.confirmation_option(prompt='This bulk-loads synthetic rows with checks off. Continue?')
+def generate_data_command(profile, years, seed, loader, batch_size, keep_indexes, password, **overrides):
+    """Bulk-load a synthetic production-sized dataset into a throwaway database."""
+    if Config.DB_BACKEND != 'mysql':
+        raise click.UsageError("generate-data uses MySQL session settings and index DDL; set DB_BACKEND=mysql.")
+    counts = dict(datagen.PROFILES[profile])
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    rates = overdue_fines.FineRates(Config.FINE_RATE_PER_DAY, Config.FINE_MAX_PER_LOAN, Config.FINE_GRACE_DAYS)
+    # A dedicated connection: LOAD DATA LOCAL needs allow_local_infile, and the
+    # session settings the load changes should not reach pooled connections.
+    conn = mysql.connector.connect(**get_pool(Config).connect_args, allow_local_infile=loader == 'load-data')
+    try:
+        done = datagen.generate(conn, counts, password_hasher.hash(password), rates, seed=seed, years=years,
+                                loan_days=Config.LOAN_PERIOD_DAYS, loader=loader, batch_size=batch_size,
+                                defer_indexes=not keep_indexes,
+                                progress=lambda p: click.echo(f"{p['table']}: {p['rows']} rows ({p['elapsed']}s)"))
+    finally:
+        conn.close()
+    click.echo("Generated " + ", ".join(f"{rows} {table}" for table, rows in done.items()))
 
 # -------------------------
 # Run
@@ -0,0 +1,509 @@
+# asgi.py
+"""
+ASGI entry point with non-blocking database access for the hot routes.
+
+    uvicorn asgi:application --workers 4
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+The hot routes (login, dashboards, view_books, reserve_book, issue/return)
+are coroutines on an ``aiomysql`` pool (async_db.py): while one request
+waits on MySQL the process serves others, so a worker keeps hundreds of
+requests in flight instead of one per thread. Every other URL is passed
+to the Flask WSGI app on a bounded thread pool (``ASGI_WSGI_THREADS``),
+one thread per request for its whole response so streamed bodies keep
+their request context.
+
+Routing, sessions, templates, ``url_for`` and the before/after-request
+hooks (metrics, query inspector) are Flask's own. Each async view runs
+inside a Flask request context pushed in its own task, so an async view
+reads like its sync counterpart in app.py and the two serve the same
+URLs and cookies. Keep them in step when either changes.
+"""
+import asyncio
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+from flask import redirect, render_template, request, session, url_for
+from werkzeug.exceptions import HTTPException
+
+import async_db
+import circulation
+import counters
+import fines_ledger
+import metrics
+import table_versions
+import waitlist
+from app import (app, Config, password_hasher, query_cache, BOOK_LIST_SQL, BOOK_SORTS, ISSUABLE_BOOKS_SQL,
+                 ISSUE_MEMBERS_SQL, MEMBER_STATS_SQL, RESERVABLE_BOOKS_SQL, _add_no_cache_headers, _book_filters,
+                 _busy_response, _circulation_tables, _fines_block_message, _mark_wrote, _observe_query,
+                 _page_cache_key, _parse_date, _start_session, is_admin_or_employee)
+from db_pool import PoolTimeout
+from pagination import fetch_page_async, get_per_page
+from passwords import PasswordQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------
+# Helpers (async counterparts of those in app.py)
+# -------------------------
+def _db():
+    return async_db.connection(Config.DB_POOL_TIMEOUT, on_query=_observe_query)
+
+
+async def _tables_changed(db, *tables):
+    """Invalidates cached reads and API ETags of ``tables``; call after the write commits"""
+    query_cache.invalidate(*tables)
+    _mark_wrote()
+    try:
+        async with db.cursor() as cursor:
+            await table_versions.bump_async(cursor, *tables)
+        await db.commit()
+    except Exception:
+        logger.exception("Could not bump table versions for %s", tables)
+
+
+async def _cached_rows(sql, params=(), tables=()):
+    """Reference-data SELECT through the query cache; shares entries with app._cached_rows"""
+    hit, value = query_cache.lookup(('sql', sql, tuple(params)), tables)
+    if hit:
+        return value
+    async with _db() as db, db.cursor(dictionary=True) as cursor:
+        await cursor.execute(sql, params)
+        rows = list(await cursor.fetchall())
+    query_cache.store(value, rows)
+    return rows
+
+
+async def _list_page(base_sql, sorts, default_sort, where=None, params=None, cache_tables=None):
+    sort_name = request.args.get('sort', default_sort)
+    sort = sorts.get(sort_name) or sorts[default_sort]
+    per_page = get_per_page(request.args, Config.PAGE_SIZE, Config.PAGE_SIZE_MAX)
+
+    token = None
+    if cache_tables:
+        hit, token = query_cache.lookup(_page_cache_key(base_sql, where, params), cache_tables)
+        if hit:
+            return token
+    async with _db() as db, db.cursor(dictionary=True) as cursor:
+        page = await fetch_page_async(cursor, base_sql, sort, request.args, request.path,
+                                      where=where, params=params, per_page=per_page)
+    if token is not None:
+        query_cache.store(token, page)
+    return page
+
+
+async def _session_member_id():
+    """``app._session_member_id``; only old sessions without an id touch the database"""
+    member_id = session.get('user_id')
+    if member_id is None and session.get('role') == 'member' and session.get('username'):
+        async with _db() as db, db.cursor() as cursor:
+            await cursor.execute("SELECT id FROM Member WHERE username=%s", (session['username'],))
+            row = await cursor.fetchone()
+        if row:
+            member_id = session['user_id'] = row[0]
+    return member_id
+
+
+# -------------------------
+# Async views, keyed by Flask endpoint
+# -------------------------
+async def login():
+    if request.method != 'POST':
+        return render_template('login.html')
+
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '')
+    role = request.form.get('role', '').lower()
+    if role not in ['admin', 'employee', 'member']:
+        return "Invalid role specified.", 400
+
+    table = role.capitalize()  # Admin, Employee, Member
+    try:
+        # The connection goes back to the pool while the password is checked.
+        async with _db() as db, db.cursor(dictionary=True) as cursor:
+            await cursor.execute(f"SELECT id, username, password FROM {table} WHERE username=%s", (username,))
+            user = await cursor.fetchone()
+
+        matches, needs_rehash = await password_hasher.verify_async(user['password'] if user else None, password)
+        if not matches:
+            return "Login Failed: Invalid username or password.", 401
+
+        if needs_rehash:
+            try:
+                new_hash = await password_hasher.hash_async(password)
+                async with _db() as db:
+                    async with db.cursor() as cursor:
+                        await cursor.execute(f"UPDATE {table} SET password=%s WHERE id=%s", (new_hash, user['id']))
+                    await db.commit()
+            except Exception:
+                logger.exception("Password rehash failed; keeping the existing value")
+
+        _start_session(user, role)
+        return redirect(url_for(f'{role}_dashboard'))
+    except PasswordQueueFull:
+        return _busy_response()
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.exception("Login Error")
+        return f"Login Error: {str(e)}", 500
+
+
+async def _dashboard_stats(role, member_id=None):
+    stats = {'books_count': 0, 'reservations_count': 0, 'fines_count': 0, 'members_count': 0}
+    try:
+        async with _db() as db, db.cursor() as cursor:
+            if role in ['admin', 'employee']:
+                totals = await counters.read_totals_async(cursor)
+                stats['books_count'] = totals[counters.BOOKS]
+                stats['reservations_count'] = totals[counters.RESERVATIONS]
+                stats['fines_count'] = totals[counters.FINES]
+                if role == 'admin':
+                    stats['members_count'] = totals[counters.MEMBERS]
+            elif role == 'member' and member_id:
+                await cursor.execute(MEMBER_STATS_SQL, (counters.BOOKS, member_id))
+                row = await cursor.fetchone()
+                if not row:
+                    return None  # the account was deleted after this session was issued
+                stats['books_count'] = row[0] or 0
+                stats['reservations_count'] = row[1]
+                stats['fines_count'] = row[2]
+    except PoolTimeout:
+        raise
+    except Exception:
+        logger.exception("Error building dashboard stats")
+    return stats
+
+
+async def admin_dashboard():
+    if session.get('role') != 'admin':
+        return redirect(url_for('login'))
+    stats = await _dashboard_stats('admin')
+    return _add_no_cache_headers(app.make_response(render_template('admin_dashboard.html', **stats)))
+
+
+async def employee_dashboard():
+    if session.get('role') != 'employee':
+        return redirect(url_for('login'))
+    stats = await _dashboard_stats('employee')
+    return _add_no_cache_headers(app.make_response(render_template('employee_dashboard.html', **stats)))
+
+
+async def member_dashboard():
+    if session.get('role') != 'member':
+        return redirect(url_for('login'))
+    stats = await _dashboard_stats('member', await _session_member_id())
+    if stats is None:
+        session.clear()
+        return redirect(url_for('login'))
+    return _add_no_cache_headers(app.make_response(render_template('member_dashboard.html', **stats)))
+
+
+async def view_books():
+    if session.get('role') != 'member':
+        return redirect(url_for('login'))
+    where, params = _book_filters()
+    page = await _list_page(BOOK_LIST_SQL, BOOK_SORTS, 'title', where, params,
+                            cache_tables=('Book', 'Author', 'Publisher'))
+    return render_template('view_books.html', books=page, page=page)
+
+
+async def reserve_book():
+    if session.get('role') != 'member':
+        return redirect(url_for('login'))
+    member_id = await _session_member_id()
+
+    if not member_id:
+        return "Could not find member information for reservation.", 404
+
+    if request.method != 'POST':
+        books = await _cached_rows(RESERVABLE_BOOKS_SQL, tables=('Book', 'Author'))
+        return render_template('reserve_book.html', books=books)
+
+    book_id = request.form.get('book_id')
+    async with _db() as db:
+        try:
+            async with db.cursor() as cursor:
+                owed = await fines_ledger.balance_async(cursor, member_id)
+                if fines_ledger.over_limit(owed, Config.FINE_BLOCK_THRESHOLD):
+                    return _fines_block_message(owed), 403
+                await cursor.execute("UPDATE Book SET quantity = quantity - 1 WHERE id=%s AND quantity > 0",
+                                     (book_id,))
+                if cursor.rowcount == 0:
+                    # No copy on the shelf: take a place in the queue once instead of retrying.
+                    await cursor.execute("SELECT id FROM Book WHERE id=%s FOR UPDATE", (book_id,))
+                    if await cursor.fetchone() is None:
+                        await db.rollback()
+                        return "Reservation failed: Book does not exist.", 404
+                    # Promoted entries leave the queue, so only a member still waiting is turned away.
+                    place = await waitlist.position_async(cursor, book_id, member_id)
+                    if place is not None:
+                        await db.rollback()
+                        return f"You are already number {place} on the waitlist for this book.", 409
+                    place = await waitlist.enqueue_async(cursor, book_id, member_id)
+                    await db.commit()
+                    await _tables_changed(db, 'Waitlist')
+                    return f"Book is out of stock. You are number {place} on the waitlist."
+                await cursor.execute("INSERT INTO Reservation (book_id, member_id, reservation_date) "
+                                     "VALUES (%s, %s, CURDATE())", (book_id, member_id))
+                await counters.bump_async(cursor, counters.RESERVATIONS)
+                await counters.bump_member_async(cursor, member_id, reservations=1)
+            await db.commit()
+            await _tables_changed(db, 'Book', 'Reservation')
+            return "Book reserved successfully!"
+        except pymysql.IntegrityError:
+            # Member row is gone (account deleted); the FK rejects the insert.
+            await db.rollback()
+            session.clear()
+            return redirect(url_for('login'))
+        except Exception as e:
+            await db.rollback()
+            logger.exception("Reservation failed")
+            return f"Reservation failed: {str(e)}", 500
+
+
+async def issue_book():
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+
+    if request.method != 'POST':
+        books = await _cached_rows(ISSUABLE_BOOKS_SQL, tables=('Book',))
+        members = await _cached_rows(ISSUE_MEMBERS_SQL, tables=('Member',))
+        return render_template('issue_book.html', books=books, members=members)
+
+    book_id = request.form.get('book_id')
+    member_id = request.form.get('member_id')
+    issue_date = _parse_date(request.form.get('issue_date'))
+    return_date = _parse_date(request.form.get('return_date'))
+    if not (book_id and member_id and issue_date and return_date):
+        return "All fields are required (dates as YYYY-MM-DD).", 400
+
+    async with _db() as db:
+        try:
+            async with db.cursor() as cursor:
+                await cursor.execute("UPDATE Book SET quantity = quantity - 1 WHERE id=%s AND quantity > 0",
+                                     (book_id,))
+                if cursor.rowcount == 0:
+                    await db.rollback()
+                    return "Book issue failed: Out of stock.", 400
+                await cursor.execute("""
+                    INSERT INTO Issued_Books (book_id, member_id, issue_date, return_date)
+                    VALUES (%s, %s, %s, %s)
+                """, (book_id, member_id, issue_date, return_date))
+            await db.commit()
+            await _tables_changed(db, 'Book', 'Issued_Books')
+            return redirect(url_for('view_issued_books'))
+        except Exception as e:
+            await db.rollback()
+            logger.exception("Error issuing book")
+            return f"Error issuing book: {str(e)}", 500
+
+
+async def return_book(issue_id):
+    if not is_admin_or_employee():
+        return redirect(url_for('login'))
+
+    async with _db() as db:
+        try:
+            result = await circulation.return_async(db, issue_id, Config.FINE_BLOCK_THRESHOLD)
+        except Exception as e:
+            logger.exception("Error returning book")
+            return f"Error returning book: {str(e)}", 500
+        if not result['ok']:
+            return "Book already returned or not found.", 404
+        await _tables_changed(db, *_circulation_tables([result]))
+    return redirect(url_for('view_issued_books'))
+
+
+ASYNC_VIEWS = {
+    'login': login,
+    'admin_dashboard': admin_dashboard,
+    'employee_dashboard': employee_dashboard,
+    'member_dashboard': member_dashboard,
+    'view_books': view_books,
+    'reserve_book': reserve_book,
+    'issue_book': issue_book,
+    'return_book': return_book,
+}
+
+
+# -------------------------
+# ASGI plumbing
+# -------------------------
+def _environ(scope, body):
+    """WSGI environ for an ASGI http scope, so Flask can build its request context"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for raw_name, raw_value in scope.get('headers', []):
+        name, value = raw_name.decode('latin-1').lower(), raw_value.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ', ') + value
+        environ[key] = value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _pool_stats():
+    stats = async_db.stats()
+    if not stats:
+        return []
+    return [
+        ('library_async_db_pool_connections', 'gauge', 'Async pool connections by state.',
+         [({'state': 'in_use'}, stats['in_use']), ({'state': 'idle'}, stats['idle'])]),
+    ]
+
+
+class Application:
+    """Runs ``views`` (Flask endpoint -> coroutine) natively and everything else through the WSGI app"""
+
+    def __init__(self, flask_app, views, wsgi_threads):
+        self.flask_app = flask_app
+        self.views = views
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        view = self._match(scope)
+        if view is None:
+            await self._run_wsgi(scope, receive, send)
+        else:
+            await self._dispatch(view, scope, receive, send)
+
+    async def _run_wsgi(self, scope, receive, send):
+        """Serves the request with the Flask WSGI app on one pool thread, sending chunks as they are produced"""
+        environ = _environ(scope, await _read_body(receive))
+        loop = asyncio.get_running_loop()
+        status = {}
+
+        def send_sync(message):
+            # Blocks the worker thread until the chunk is handed off: backpressure for streamed bodies.
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status_line, headers, exc_info=None):
+            status['code'] = int(status_line.split(' ', 1)[0])
+            status['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def start():
+            if not status.get('sent'):
+                status['sent'] = True
+                send_sync({'type': 'http.response.start', 'status': status['code'], 'headers': status['headers']})
+
+        def run():
+            iterable = self.flask_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        start()
+                        send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                start()
+                send_sync({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        await loop.run_in_executor(self.executor, run)
+
+    def _match(self, scope):
+        adapter = self.flask_app.url_map.bind('localhost', script_name=scope.get('root_path') or '/')
+        try:
+            endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return None  # 404/405/redirects are answered by Flask itself
+        return self.views.get(endpoint)
+
+    async def _dispatch(self, view, scope, receive, send):
+        """``Flask.wsgi_app`` + ``full_dispatch_request``, awaiting the view"""
+        flask_app = self.flask_app
+        ctx = flask_app.request_context(_environ(scope, await _read_body(receive)))
+        error = None
+        try:
+            ctx.push()
+            try:
+                try:
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except PoolTimeout:
+                    logger.exception("Async database pool exhausted.")
+                    rv = _busy_response()
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                response = flask_app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = flask_app.handle_exception(e)
+            body = b''.join(response.iter_encoded())
+            status, headers = response.status_code, list(response.headers.items())
+            response.close()
+        finally:
+            ctx.pop(error)
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await async_db.open_pool(Config)
+                except Exception as e:
+                    logger.exception("Could not open the async database pool.")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.close_pool()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+metrics.registry.add_collector(_pool_stats)
+
+application = Application(app, ASYNC_VIEWS, Config.ASGI_WSGI_THREADS)
@@ -0,0 +1,129 @@
+# async_db.py
+"""
+asyncio MySQL access for the ASGI entry point (asgi.py).
+
+One ``aiomysql`` pool per process is opened at ASGI startup and shared by
+every in-flight request; a coroutine waiting on a query yields the event
+loop, so a single process keeps many requests in flight while the remote
+database answers. Like db_pool.py, checkouts are bounded by a timeout
+(``PoolTimeout``) and connections are rolled back before they go back to
+the pool. Cursors are timed into the same metrics as the sync driver.
+"""
+import asyncio
+import contextlib
+import time
+
+import aiomysql
+
+import metrics
+from db_pool import PoolTimeout
+
+_pool = None
+
+
+async def open_pool(config):
+    global _pool
+    if config.DB_BACKEND != 'mysql':
+        raise RuntimeError("asgi.py needs DB_BACKEND=mysql; serve the SQLite backend with the WSGI app")
+    if _pool is None:
+        _pool = await aiomysql.create_pool(
+            host=config.DB_HOST,
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            db=config.DB_NAME,
+            port=config.DB_PORT,
+            autocommit=False,
+            minsize=min(config.ASYNC_DB_POOL_MIN, config.ASYNC_DB_POOL_SIZE),
+            maxsize=config.ASYNC_DB_POOL_SIZE,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        pool.close()
+        await pool.wait_closed()
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Async pool not open; serve the app through asgi.py")
+    return _pool
+
+
+class AsyncCursor:
+    """Times ``execute``/``executemany`` like ``metrics.InstrumentedCursor``"""
+
+    def __init__(self, cursor, on_query=metrics.observe_query):
+        self._cursor = cursor
+        self._on_query = on_query
+
+    async def _timed(self, method, sql, params):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await method(sql, params)
+            failed = False
+            return result
+        finally:
+            self._on_query(sql, params, time.perf_counter() - started, failed)
+
+    async def execute(self, sql, params=()):
+        return await self._timed(self._cursor.execute, sql, params)
+
+    async def executemany(self, sql, seq_params):
+        return await self._timed(self._cursor.executemany, sql, seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)  # fetchone/fetchall coroutines, rowcount, lastrowid
+
+
+class AsyncConnection:
+    def __init__(self, raw, on_query=metrics.observe_query):
+        self.raw = raw
+        self._on_query = on_query
+
+    @contextlib.asynccontextmanager
+    async def cursor(self, dictionary=False):
+        cursor = await self.raw.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor)
+        try:
+            yield AsyncCursor(cursor, self._on_query)
+        finally:
+            await cursor.close()
+
+    async def commit(self):
+        await self.raw.commit()
+
+    async def rollback(self):
+        await self.raw.rollback()
+
+
+@contextlib.asynccontextmanager
+async def connection(timeout, on_query=metrics.observe_query):
+    """Checks out a connection for the block; it is rolled back (uncommitted work dropped) on the way back"""
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        raw = await asyncio.wait_for(pool.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"No async database connection available within {timeout}s")
+    metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started)
+    try:
+        yield AsyncConnection(raw, on_query)
+    finally:
+        try:
+            # aiomysql closes connections released mid-transaction; end it here so they are reused.
+            await raw.rollback()
+        except Exception:
+            raw.close()
+        pool.release(raw)
+
+
+def stats():
+    pool = _pool
+    if pool is None:
+        return {}
+    return {'size': pool.size, 'idle': pool.freesize, 'in_use': pool.size - pool.freesize, 'max': pool.maxsize}
@@ -0,0 +1,379 @@
+# benchmark.py
+"""
+Load benchmark for the Flask app against a local database.
+
+Seeds the database configured through ``MYSQL_*`` (a throwaway local
+MySQL, e.g. ``docker run -e MYSQL_ROOT_PASSWORD=bench -p 3306:3306 mysql:8``
+loaded with mysql.sql and ``flask db-migrate``), starts the app on a
+threaded local server (or targets ``--base-url``), then drives a mix of
+member and staff sessions from concurrent clients and reports throughput
+and p50/p95/p99 latency per route as JSON.
+
+    python benchmark.py --scale small --seed --duration 30 --concurrency 16 -o bench.json
+    python benchmark.py --scale small --duration 30 -o new.json --baseline bench.json
+
+With ``--baseline`` the run is compared route by route and the exit code
+is 1 when any route's p95 regressed by more than ``--tolerance``.
+Seeded rows use a ``bench_`` / ``Bench`` prefix and are reused by later
+runs at the same or smaller scale.
+"""
+import argparse
+import datetime
+import http.cookiejar
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SCALES = {
+    'small': {'books': 1000, 'members': 200, 'loans': 5000},
+    'medium': {'books': 50000, 'members': 5000, 'loans': 200000},
+    'large': {'books': 500000, 'members': 50000, 'loans': 2000000},
+}
+
+BENCH_PASSWORD = 'bench-password'
+STAFF_USERNAME = 'bench_staff'
+SEED_CHUNK = 5000
+
+
+# -------------------------
+# Seeding
+# -------------------------
+def _count(cursor, sql, params=()):
+    cursor.execute(sql, params)
+    return cursor.fetchone()[0]
+
+
+def _insert_chunks(db, cursor, sql, rows):
+    for start in range(0, len(rows), SEED_CHUNK):
+        cursor.executemany(sql, rows[start:start + SEED_CHUNK])
+        db.commit()
+
+
+def seed(db, password_hash, books, members, loans, rng):
+    """Tops the bench_ rows up to the requested counts"""
+    import counters
+    import table_versions
+
+    cursor = db.cursor()
+    have_books = _count(cursor, "SELECT COUNT(*) FROM Book WHERE title LIKE 'Bench Title %'")
+    have_members = _count(cursor, "SELECT COUNT(*) FROM Member WHERE username LIKE 'bench_member_%'")
+
+    if not _count(cursor, "SELECT COUNT(*) FROM Employee WHERE username=%s", (STAFF_USERNAME,)):
+        cursor.execute("INSERT INTO Employee (username, email, password) VALUES (%s, %s, %s)",
+                       (STAFF_USERNAME, 'bench_staff@example.com', password_hash))
+    authors = max(1, books // 20)
+    if _count(cursor, "SELECT COUNT(*) FROM Author WHERE name LIKE 'Bench Author %'") < authors:
+        _insert_chunks(db, cursor, "INSERT INTO Author (name) VALUES (%s)",
+                       [(f"Bench Author {i}",) for i in range(authors)])
+    cursor.execute("SELECT id FROM Author WHERE name LIKE 'Bench Author %'")
+    author_ids = [row[0] for row in cursor.fetchall()]
+
+    if have_books < books:
+        words = ['Silent', 'River', 'Garden', 'Winter', 'Echo', 'Stone', 'Light', 'Harbor', 'Crown', 'Shadow']
+        _insert_chunks(db, cursor, "INSERT INTO Book (title, author_id, quantity) VALUES (%s, %s, %s)", [
+            (f"Bench Title {rng.choice(words)} {i}", rng.choice(author_ids), rng.randint(0, 1000))
+            for i in range(have_books, books)
+        ])
+    if have_members < members:
+        _insert_chunks(db, cursor, "INSERT INTO Member (username, email, password) VALUES (%s, %s, %s)", [
+            (f"bench_member_{i}", f"bench_member_{i}@example.com", password_hash)
+            for i in range(have_members, members)
+        ])
+
+    cursor.execute("SELECT MIN(id), MAX(id) FROM Book WHERE title LIKE 'Bench Title %'")
+    book_lo, book_hi = cursor.fetchone()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM Member WHERE username LIKE 'bench_member_%'")
+    member_lo, member_hi = cursor.fetchone()
+    have_loans = _count(cursor, "SELECT COUNT(*) FROM Issued_Books WHERE member_id BETWEEN %s AND %s",
+                        (member_lo, member_hi))
+    if have_loans < loans:
+        today = datetime.date.today()
+        rows = []
+        for _ in range(loans - have_loans):
+            issued = today - datetime.timedelta(days=rng.randint(0, 720))
+            rows.append((rng.randint(book_lo, book_hi), rng.randint(member_lo, member_hi),
+                         issued, issued + datetime.timedelta(days=14), rng.random() < 0.9))
+        _insert_chunks(db, cursor, "INSERT INTO Issued_Books (book_id, member_id, issue_date, return_date, returned) "
+                                   "VALUES (%s, %s, %s, %s, %s)", rows)
+
+    table_versions.bump(cursor, 'Author', 'Book', 'Member', 'Issued_Books')
+    db.commit()
+    cursor.close()
+    counters.reconcile(db)
+    return {'books': (book_lo, book_hi), 'members': (member_lo, member_hi)}
+
+
+def bench_ranges(db):
+    cursor = db.cursor()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM Book WHERE title LIKE 'Bench Title %'")
+    books = cursor.fetchone()
+    cursor.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM Member WHERE username LIKE 'bench_member_%'")
+    member_lo, member_hi, member_count = cursor.fetchone()
+    cursor.close()
+    if books[0] is None or not member_count:
+        raise SystemExit("No bench_ data found; run with --seed first.")
+    return {'books': books, 'members': (member_lo, member_hi), 'member_count': member_count}
+
+
+# -------------------------
+# HTTP clients
+# -------------------------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser-like session (own cookie jar); redirects are not followed"""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, route, path, form=None, json_body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                body = resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        except Exception:
+            body, status = b'', 0
+        self.recorder.record(route, time.perf_counter() - started, status)
+        return status, body
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, route, elapsed, status):
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status == 0 or status >= 500:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def member_session(client, rng, ranges, stop):
+    client.request('login', '/login', form={'username': f"bench_member_{rng.randrange(ranges['member_count'])}",
+                                            'password': BENCH_PASSWORD, 'role': 'member'})
+    while not stop.is_set():
+        roll = rng.random()
+        if roll < 0.25:
+            client.request('member_dashboard', '/member/dashboard')
+        elif roll < 0.55:
+            query = rng.choice(['', '?q=Bench+Title+S', '?q=Bench+Title+R', '?sort=newest', '?in_stock=1'])
+            client.request('view_books', '/member/view-books' + query)
+        elif roll < 0.75:
+            client.request('search', '/search?q=' + rng.choice(['silent', 'river garden', 'winter', 'echo stone']))
+        elif roll < 0.88:
+            client.request('reserve_book', '/member/reserve-book', form={'book_id': rng.randint(*ranges['books'])})
+        else:
+            client.request('my_fines', '/member/my-fines')
+
+
+def staff_session(client, rng, ranges, stop):
+    client.request('login', '/login', form={'username': STAFF_USERNAME, 'password': BENCH_PASSWORD,
+                                            'role': 'employee'})
+    open_loans = []
+    today = datetime.date.today()
+    while not stop.is_set():
+        roll = rng.random()
+        if roll < 0.2:
+            client.request('employee_dashboard', '/employee/dashboard')
+        elif roll < 0.4:
+            client.request('manage_books', '/manage-books' + rng.choice(['', '?sort=newest', '?q=Bench+Title+W']))
+        elif roll < 0.55:
+            client.request('view_issued_books', '/employee/issued-books' + rng.choice(['', '?status=outstanding']))
+        elif roll < 0.7:
+            client.request('issue_book', '/employee/issue-book', form={
+                'book_id': rng.randint(*ranges['books']), 'member_id': rng.randint(*ranges['members']),
+                'issue_date': today.isoformat(), 'return_date': (today + datetime.timedelta(days=14)).isoformat()})
+        elif roll < 0.85 or not open_loans:
+            cart = [[rng.randint(*ranges['books']), rng.randint(*ranges['members'])] for _ in range(rng.randint(1, 10))]
+            status, body = client.request('circulation_desk', '/employee/circulation-desk', json_body={'issues': cart})
+            if status == 200:
+                open_loans += [r['issue_id'] for r in json.loads(body)['results'] if r['ok']]
+        else:
+            client.request('return_book', f"/employee/return-book/{open_loans.pop()}")
+
+
+# -------------------------
+# Reporting
+# -------------------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))  # nearest-rank
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    everything = []
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        everything.extend(samples)
+        routes[route] = {
+            'count': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'rps': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p50_ms': round(percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        }
+    everything.sort()
+    total = {
+        'count': len(everything),
+        'errors': sum(recorder.errors.values()),
+        'rps': round(len(everything) / elapsed, 2),
+        'p50_ms': round((percentile(everything, 50) or 0) * 1000, 2),
+        'p95_ms': round((percentile(everything, 95) or 0) * 1000, 2),
+        'p99_ms': round((percentile(everything, 99) or 0) * 1000, 2),
+    }
+    return routes, total
+
+
+def compare(result, baseline, tolerance):
+    """Prints per-route p95/throughput deltas; returns the routes whose p95 regressed beyond ``tolerance``"""
+    regressions = []
+    print(f"{'route':<22}{'p95 base':>10}{'p95 now':>10}{'delta':>9}{'rps base':>10}{'rps now':>10}")
+    for route, now in sorted(result['routes'].items()):
+        base = baseline.get('routes', {}).get(route)
+        if not base:
+            print(f"{route:<22}{'-':>10}{now['p95_ms']:>10}{'new':>9}{'-':>10}{now['rps']:>10}")
+            continue
+        delta = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        flag = '  REGRESSED' if delta > tolerance else ''
+        print(f"{route:<22}{base['p95_ms']:>10}{now['p95_ms']:>10}{delta:>+9.1%}{base['rps']:>10}{now['rps']:>10}{flag}")
+        if delta > tolerance:
+            regressions.append(route)
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# -------------------------
+# Main
+# -------------------------
+def _start_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', action='store_true', help='Top up the bench_ rows for --scale before running.')
+    parser.add_argument('--base-url', help='Benchmark an already running server instead of starting one.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of measured traffic.')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of unmeasured traffic first.')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--staff-ratio', type=float, default=0.25, help='Share of clients acting as staff.')
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('-o', '--output', help='Write the JSON result here (default stdout).')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result.')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p95 regression (0.10 = 10%%).')
+    args = parser.parse_args(argv)
+
+    import app as app_module
+
+    rng = random.Random(args.random_seed)
+    conn, release = app_module._pool_connection()
+    try:
+        if args.seed:
+            counts = SCALES[args.scale]
+            started = time.perf_counter()
+            seed(conn, app_module.password_hasher.hash(BENCH_PASSWORD), counts['books'], counts['members'],
+                 counts['loans'], rng)
+            print(f"Seeded {args.scale} scale in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        ranges = bench_ranges(conn)
+    finally:
+        release(conn)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = _start_server(app_module.app)
+
+    stop = threading.Event()
+    recorder = Recorder()
+    warmup = Recorder()
+    clients = []
+    staff = max(1, int(round(args.concurrency * args.staff_ratio))) if args.staff_ratio > 0 else 0
+    for i in range(args.concurrency):
+        client = Client(base_url, warmup)
+        session_fn = staff_session if i < staff else member_session
+        thread = threading.Thread(target=session_fn, args=(client, random.Random(rng.random()), ranges, stop),
+                                  name=f'bench-client-{i}', daemon=True)
+        clients.append(client)
+        thread.start()
+
+    time.sleep(args.warmup)
+    for client in clients:
+        client.recorder = recorder
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    if server:
+        server.shutdown()
+
+    routes, total = summarize(recorder, elapsed)
+    result = {
+        'meta': {
+            'scale': args.scale, 'concurrency': args.concurrency, 'staff_ratio': args.staff_ratio,
+            'duration': round(elapsed, 2), 'random_seed': args.random_seed, 'revision': _git_revision(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'base_url': base_url,
+        },
+        'total': total,
+        'routes': routes,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            regressions = compare(result, json.load(fh), args.tolerance)
+        if regressions:
+            print(f"p95 regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
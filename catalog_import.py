@@ -0,0 +1,240 @@
+# catalog_import.py
+"""
+Streaming bulk import of vendor catalog feeds (CSV or JSON Lines).
+
+Records are read lazily from the file and processed in chunks. Per chunk,
+author and publisher names are resolved against an in-memory name -> id
+map (missing names are inserted in one batch), books are inserted with a
+single ``executemany`` and the job checkpoint in ``Import_Job`` is advanced
+in the same transaction. A job interrupted part-way can therefore be
+resumed from the last committed chunk without duplicating books.
+
+Expected fields: ``title`` (required), ``author``, ``publisher``,
+``quantity`` (defaults to 1).
+"""
+import csv
+import io
+import json
+import logging
+import time
+
+import counters
+import table_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+
+class CatalogImportError(ValueError):
+    """Raised for an unusable feed (unknown format, missing job, ...)"""
+
+
+def detect_format(filename):
+    lowered = filename.lower()
+    if lowered.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if lowered.endswith('.csv'):
+        return 'csv'
+    raise CatalogImportError(f"Cannot tell the format of {filename!r}; use .csv or .jsonl")
+
+
+def iter_records(stream, fmt):
+    """Yields dict records from a text stream without reading it all into memory"""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {(k or '').strip().lower(): v for k, v in row.items()}
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None  # counted as a rejected record, keeps positions stable for resume
+    else:
+        raise CatalogImportError(f"Unsupported format {fmt!r}; expected one of {FORMATS}")
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+class NameResolver:
+    """In-memory name -> id map for Author or Publisher that creates missing names in batches"""
+
+    def __init__(self, table):
+        self.table = table
+        self.ids = {}
+        self.created = 0
+
+    @staticmethod
+    def _key(name):
+        return name.casefold()
+
+    def load(self, cursor):
+        cursor.execute(f"SELECT id, name FROM {self.table} ORDER BY id")
+        for row_id, name in cursor.fetchall():
+            # Names are not unique in the schema; keep the oldest id.
+            self.ids.setdefault(self._key(name), row_id)
+
+    def resolve(self, cursor, names):
+        """Ensures every name has an id, inserting the missing ones in one round trip"""
+        missing = {}
+        for name in names:
+            if name and self._key(name) not in self.ids:
+                missing.setdefault(self._key(name), name)
+        if not missing:
+            return
+        cursor.executemany(f"INSERT INTO {self.table} (name) VALUES (%s)",
+                           [(name,) for name in missing.values()])
+        placeholders = ', '.join(['%s'] * len(missing))
+        cursor.execute(f"SELECT id, name FROM {self.table} WHERE name IN ({placeholders}) ORDER BY id",
+                       tuple(missing.values()))
+        for row_id, name in cursor.fetchall():
+            self.ids.setdefault(self._key(name), row_id)
+        self.created += len(missing)
+
+    def get(self, name):
+        return self.ids.get(self._key(name)) if name else None
+
+
+# -------------------------
+# Job bookkeeping
+# -------------------------
+def create_job(db, source, fmt):
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO Import_Job (source, format, status) VALUES (%s, %s, 'pending')", (source, fmt))
+    job_id = cursor.lastrowid
+    db.commit()
+    cursor.close()
+    return job_id
+
+
+def get_job(db, job_id):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM Import_Job WHERE id=%s", (job_id,))
+    job = cursor.fetchone()
+    cursor.close()
+    return job
+
+
+def _set_status(db, job_id, status, error=None):
+    cursor = db.cursor()
+    cursor.execute("UPDATE Import_Job SET status=%s, error=%s WHERE id=%s", (status, error, job_id))
+    db.commit()
+    cursor.close()
+
+
+# -------------------------
+# Import
+# -------------------------
+def _parse(record):
+    title = _clean(record.get('title'))
+    if not title:
+        raise ValueError("missing title")
+    quantity = _clean(record.get('quantity'))
+    quantity = int(quantity) if quantity is not None else 1
+    if quantity < 0:
+        raise ValueError("negative quantity")
+    return title, _clean(record.get('author')), _clean(record.get('publisher')), quantity
+
+
+def run_import(db, job_id, stream, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Imports ``stream`` under job ``job_id``, resuming after the job's checkpoint.
+
+    ``progress(job_dict)`` is called after every committed chunk.
+    """
+    job = get_job(db, job_id)
+    if job is None:
+        raise CatalogImportError(f"Import job {job_id} does not exist")
+    skip = job['records_done']
+    records = iter_records(stream, job['format'])
+
+    authors, publishers = NameResolver('Author'), NameResolver('Publisher')
+    cursor = db.cursor()
+    authors.load(cursor)
+    publishers.load(cursor)
+    cursor.close()
+    db.commit()
+
+    _set_status(db, job_id, 'running')
+    started = time.perf_counter()
+    done = skip
+    inserted = job['books_inserted']
+    rejected = job['records_rejected']
+    try:
+        for _ in range(skip):
+            next(records, None)
+
+        while True:
+            chunk = []
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    break
+            if not chunk:
+                break
+
+            parsed, chunk_rejected = [], 0
+            for record in chunk:
+                try:
+                    parsed.append(_parse(record))
+                except (ValueError, TypeError, AttributeError):
+                    chunk_rejected += 1
+
+            cursor = db.cursor()
+            try:
+                authors.resolve(cursor, {row[1] for row in parsed})
+                publishers.resolve(cursor, {row[2] for row in parsed})
+                if parsed:
+                    cursor.executemany(
+                        "INSERT INTO Book (title, author_id, publisher_id, quantity) VALUES (%s, %s, %s, %s)",
+                        [(title, authors.get(author), publishers.get(publisher), quantity)
+                         for title, author, publisher, quantity in parsed],
+                    )
+                    counters.bump(cursor, counters.BOOKS, len(parsed))
+                    table_versions.bump(cursor, 'Book', 'Author', 'Publisher')
+                cursor.execute("""
+                    UPDATE Import_Job
+                    SET records_done = records_done + %s,
+                        books_inserted = books_inserted + %s,
+                        records_rejected = records_rejected + %s,
+                        authors_created = %s, publishers_created = %s
+                    WHERE id = %s
+                """, (len(chunk), len(parsed), chunk_rejected,
+                      job['authors_created'] + authors.created,
+                      job['publishers_created'] + publishers.created, job_id))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            done += len(chunk)
+            inserted += len(parsed)
+            rejected += chunk_rejected
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress({'job_id': job_id, 'records_done': done, 'books_inserted': inserted,
+                          'records_rejected': rejected,
+                          'rate': round((done - skip) / elapsed, 1) if elapsed else None})
+    except Exception as e:
+        logger.exception("Catalog import %s failed", job_id)
+        _set_status(db, job_id, 'failed', str(e)[:1000])
+        raise
+
+    _set_status(db, job_id, 'completed')
+    return get_job(db, job_id)
+
+
+def open_text(binary_stream, encoding='utf-8-sig'):
+    """Wraps an uploaded/binary file for streaming text reads (strips a UTF-8 BOM)"""
+    return io.TextIOWrapper(binary_stream, encoding=encoding, newline='')
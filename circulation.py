@@ -0,0 +1,243 @@
+# circulation.py
+"""
+Batch issue/return for the circulation desk.
+
+A whole cart of scans is applied in one transaction. Rows are locked in a
+fixed order (``Book`` by id, then ``Issued_Books`` by id) so two desks
+working on overlapping carts wait on each other instead of deadlocking.
+Every item gets its own result; a bad scan is reported and skipped
+without failing the rest of the batch. Returned copies are offered to the
+book's waitlist (waitlist.py) before going back on the shelf.
+"""
+import asyncio
+import logging
+import time
+
+import mysql.connector
+import pymysql
+
+import waitlist
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 500
+
+# ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT: the whole transaction was rolled back
+_RETRY_ERRNOS = {1213, 1205}
+_ATTEMPTS = 3
+
+
+class CirculationError(ValueError):
+    """Raised for a batch that cannot be processed at all (too large, malformed)"""
+
+
+def _as_id(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _lock_books(cursor, book_ids):
+    """Locks the Book rows in ascending id order; returns {id: quantity}"""
+    if not book_ids:
+        return {}
+    ids = sorted(book_ids)
+    cursor.execute(f"SELECT id, quantity FROM Book WHERE id IN ({_placeholders(ids)}) ORDER BY id FOR UPDATE",
+                   tuple(ids))
+    return dict(cursor.fetchall())
+
+
+def _apply(db, issues, returns, issue_date, return_date, max_balance):
+    cursor = db.cursor()
+    try:
+        results_issue = [{'action': 'issue', 'book_id': book_id, 'member_id': member_id}
+                         for book_id, member_id in issues]
+        results_return = [{'action': 'return', 'issue_id': issue_id} for issue_id in returns]
+
+        # Unlocked read to learn which books the returns touch, so every Book
+        # row can be locked up front in one ordered statement.
+        return_ids = sorted({i for i in returns if i})
+        loans = {}
+        if return_ids:
+            cursor.execute(f"SELECT id, book_id FROM Issued_Books WHERE id IN ({_placeholders(return_ids)})",
+                           tuple(return_ids))
+            loans = dict(cursor.fetchall())
+
+        stock = _lock_books(cursor, {b for b, _ in issues if b} | set(loans.values()))
+
+        open_loans = {}
+        if return_ids:
+            cursor.execute(f"""
+                SELECT id, book_id FROM Issued_Books
+                WHERE id IN ({_placeholders(return_ids)}) AND returned = FALSE
+                ORDER BY id FOR UPDATE
+            """, tuple(return_ids))
+            open_loans = dict(cursor.fetchall())
+
+        member_ids = sorted({m for _, m in issues if m})
+        members = set()
+        if member_ids:
+            cursor.execute(f"SELECT id FROM Member WHERE id IN ({_placeholders(member_ids)})", tuple(member_ids))
+            members = {row[0] for row in cursor.fetchall()}
+
+        # Returns first: a copy handed back in this cart goes to the head of
+        # the book's waitlist, or back on the shelf where it can go straight out again.
+        delta = {}
+        returned = []
+        for result in results_return:
+            issue_id = result['issue_id']
+            book_id = open_loans.get(issue_id)
+            if not issue_id:
+                result['error'] = 'Invalid issue id.'
+            elif book_id is None or book_id not in stock:
+                result['error'] = 'Already returned or not found.'
+            else:
+                open_loans.pop(issue_id)  # a duplicate scan of the same loan is rejected
+                returned.append(issue_id)
+                delta[book_id] = delta.get(book_id, 0) + 1
+                result.update(ok=True, book_id=book_id)
+        for book_id in sorted(delta):
+            served = waitlist.promote(cursor, book_id, delta[book_id], max_balance)
+            delta[book_id] -= len(served)
+            stock[book_id] += delta[book_id]
+            reserved_for = iter(served)
+            for result in results_return:
+                if result.get('ok') and result['book_id'] == book_id:
+                    result['reserved_for'] = next(reserved_for, None)
+
+        for result in results_issue:
+            book_id, member_id = result['book_id'], result['member_id']
+            if not book_id or not member_id:
+                result['error'] = 'Invalid book or member id.'
+            elif book_id not in stock:
+                result['error'] = 'Book not found.'
+            elif member_id not in members:
+                result['error'] = 'Member not found.'
+            elif stock[book_id] <= 0:
+                result['error'] = 'Out of stock.'
+            else:
+                stock[book_id] -= 1
+                delta[book_id] = delta.get(book_id, 0) - 1
+                cursor.execute("""
+                    INSERT INTO Issued_Books (book_id, member_id, issue_date, return_date)
+                    VALUES (%s, %s, %s, %s)
+                """, (book_id, member_id, issue_date, return_date))
+                result.update(ok=True, issue_id=cursor.lastrowid)
+
+        if returned:
+            cursor.execute(f"UPDATE Issued_Books SET returned = TRUE, returned_at = CURDATE() "
+                           f"WHERE id IN ({_placeholders(returned)})",
+                           tuple(returned))
+        changes = [(d, book_id) for book_id, d in sorted(delta.items()) if d]
+        if changes:
+            cursor.executemany("UPDATE Book SET quantity = quantity + %s WHERE id = %s", changes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    results = results_return + results_issue
+    for result in results:
+        result.setdefault('ok', False)
+    return results
+
+
+def apply_batch(db, issues=(), returns=(), issue_date=None, return_date=None, max_balance=None):
+    """
+    Applies ``issues`` ((book_id, member_id) pairs) and ``returns`` (issue ids)
+    in a single transaction and returns one result dict per item, returns first.
+    ``max_balance`` is passed to ``waitlist.promote`` for returned copies.
+    """
+    issues = [(_as_id(b), _as_id(m)) for b, m in issues]
+    returns = [_as_id(i) for i in returns]
+    if not issues and not returns:
+        raise CirculationError("Nothing to process.")
+    if len(issues) + len(returns) > MAX_BATCH:
+        raise CirculationError(f"At most {MAX_BATCH} items per batch.")
+    if issues and not (issue_date and return_date):
+        raise CirculationError("Issue and return dates are required for issues.")
+
+    for attempt in range(1, _ATTEMPTS + 1):
+        try:
+            return _apply(db, issues, returns, issue_date, return_date, max_balance)
+        except mysql.connector.Error as err:
+            if err.errno not in _RETRY_ERRNOS or attempt == _ATTEMPTS:
+                raise
+            logger.warning("Circulation batch hit %s (attempt %d); retrying", err.msg, attempt)
+            time.sleep(0.05 * attempt)
+
+
+async def _return_async(db, issue_id, max_balance):
+    result = {'action': 'return', 'issue_id': issue_id, 'ok': False}
+    async with db.cursor() as cursor:
+        try:
+            # Same order as _apply: unlocked read, Book row lock, then the loan.
+            await cursor.execute("SELECT book_id FROM Issued_Books WHERE id = %s", (issue_id,))
+            row = await cursor.fetchone()
+            loan = None
+            if row:
+                await cursor.execute("SELECT id FROM Book WHERE id = %s FOR UPDATE", (row[0],))
+                if await cursor.fetchone():
+                    await cursor.execute(
+                        "SELECT book_id FROM Issued_Books WHERE id = %s AND returned = FALSE FOR UPDATE", (issue_id,))
+                    loan = await cursor.fetchone()
+            if loan is None or loan[0] != row[0]:
+                await db.rollback()
+                result['error'] = 'Already returned or not found.'
+                return result
+            book_id = loan[0]
+            served = await waitlist.promote_async(cursor, book_id, 1, max_balance)
+            await cursor.execute("UPDATE Issued_Books SET returned = TRUE, returned_at = CURDATE() WHERE id = %s",
+                                 (issue_id,))
+            if not served:
+                await cursor.execute("UPDATE Book SET quantity = quantity + 1 WHERE id = %s", (book_id,))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    result.update(ok=True, book_id=book_id, reserved_for=served[0] if served else None)
+    return result
+
+
+async def return_async(db, issue_id, max_balance=None):
+    """
+    One return on an async_db connection (the ASGI entry point), with the
+    lock order, waitlist hand-off and retries of ``apply_batch``; returns
+    the item's result dict.
+    """
+    issue_id = _as_id(issue_id)
+    if not issue_id:
+        return {'action': 'return', 'issue_id': issue_id, 'ok': False, 'error': 'Invalid issue id.'}
+    for attempt in range(1, _ATTEMPTS + 1):
+        try:
+            return await _return_async(db, issue_id, max_balance)
+        except pymysql.MySQLError as err:
+            if not err.args or err.args[0] not in _RETRY_ERRNOS or attempt == _ATTEMPTS:
+                raise
+            logger.warning("Return of loan %s hit %s (attempt %d); retrying", issue_id, err, attempt)
+            await asyncio.sleep(0.05 * attempt)
+
+
+def parse_lines(text):
+    """
+    Parses the desk's scan box: ``book_id member_id`` per line is an issue,
+    a lone number is an issue id to return. Returns (issues, returns).
+    """
+    issues, returns = [], []
+    for line in text.splitlines():
+        parts = line.replace(',', ' ').split()
+        if len(parts) == 1:
+            returns.append(parts[0])
+        elif len(parts) == 2:
+            issues.append((parts[0], parts[1]))
+        elif parts:
+            issues.append((None, None))  # reported back as an invalid scan
+    return issues, returns
@@ -0,0 +1,136 @@
+# counters.py
+"""
+Materialized row counts for the dashboards.
+
+Write routes adjust the counters inside the same transaction as the rows
+they change, so a dashboard is one primary-key read instead of a
+``COUNT(*)`` scan per table. Helpers take a plain (tuple) cursor on the
+caller's connection. ``reconcile()`` recomputes everything from the
+base tables and is meant to run periodically (``flask reconcile-counters``)
+to repair any drift, e.g. from rows changed outside the app.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+BOOKS = 'books'
+MEMBERS = 'members'
+RESERVATIONS = 'reservations'
+FINES = 'fines'
+
+_COUNTED_TABLES = {
+    BOOKS: 'Book',
+    MEMBERS: 'Member',
+    RESERVATIONS: 'Reservation',
+    FINES: 'Fine',
+}
+
+
+_BUMP_SQL = ("INSERT INTO Stat_Counter (name, value) VALUES (%s, %s) "
+             "ON DUPLICATE KEY UPDATE value = value + VALUES(value)")
+_BUMP_MEMBER_SQL = ("INSERT INTO Member_Counter (member_id, reservations, fines) VALUES (%s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE reservations = reservations + VALUES(reservations), "
+                    "fines = fines + VALUES(fines)")
+
+
+def bump(cursor, name, delta=1):
+    """Adjusts a global counter; call before the caller's commit"""
+    cursor.execute(_BUMP_SQL, (name, delta))
+
+
+def bump_member(cursor, member_id, reservations=0, fines=0):
+    """Adjusts a member's reservation/fine counters; call before the caller's commit"""
+    cursor.execute(_BUMP_MEMBER_SQL, (member_id, reservations, fines))
+
+
+async def bump_async(cursor, name, delta=1):
+    """``bump`` on an async_db cursor"""
+    await cursor.execute(_BUMP_SQL, (name, delta))
+
+
+async def bump_member_async(cursor, member_id, reservations=0, fines=0):
+    """``bump_member`` on an async_db cursor"""
+    await cursor.execute(_BUMP_MEMBER_SQL, (member_id, reservations, fines))
+
+
+def _totals(rows):
+    totals = dict.fromkeys(_COUNTED_TABLES, 0)
+    for name, value in rows:
+        totals[name] = int(value or 0)
+    return totals
+
+
+def read_totals(cursor):
+    """Returns {'books': n, 'members': n, 'reservations': n, 'fines': n}"""
+    cursor.execute("SELECT name, value FROM Stat_Counter")
+    return _totals(cursor.fetchall())
+
+
+async def read_totals_async(cursor):
+    """``read_totals`` on an async_db cursor"""
+    await cursor.execute("SELECT name, value FROM Stat_Counter")
+    return _totals(await cursor.fetchall())
+
+
+def forget_member(cursor, member_id):
+    """
+    Takes a member's cascaded reservations and fines out of the totals.
+
+    Must run before ``DELETE FROM Member``; the ON DELETE CASCADE removes
+    the Reservation, Fine and Member_Counter rows themselves.
+    """
+    cursor.execute(
+        "SELECT reservations, fines FROM Member_Counter WHERE member_id=%s FOR UPDATE",
+        (member_id,),
+    )
+    row = cursor.fetchone()
+    if row:
+        reservations, fines = row
+        if reservations:
+            bump(cursor, RESERVATIONS, -reservations)
+        if fines:
+            bump(cursor, FINES, -fines)
+
+
+def forget_book_reservations(cursor, book_id):
+    """Takes a book's cascaded reservations out of the counters; run before ``DELETE FROM Book``"""
+    cursor.execute(
+        "SELECT member_id, COUNT(*) FROM Reservation WHERE book_id=%s GROUP BY member_id",
+        (book_id,),
+    )
+    total = 0
+    for member_id, count in cursor.fetchall():
+        if member_id is not None:
+            bump_member(cursor, member_id, reservations=-count)
+        total += count
+    if total:
+        bump(cursor, RESERVATIONS, -total)
+
+
+def reconcile(db):
+    """Recomputes every counter from the base tables in one transaction"""
+    cursor = db.cursor()
+    try:
+        for name, table in _COUNTED_TABLES.items():
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            count = cursor.fetchone()[0]
+            cursor.execute(
+                "INSERT INTO Stat_Counter (name, value) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE value = VALUES(value)",
+                (name, count),
+            )
+        cursor.execute("""
+            INSERT INTO Member_Counter (member_id, reservations, fines)
+            SELECT m.id,
+                   (SELECT COUNT(*) FROM Reservation r WHERE r.member_id = m.id),
+                   (SELECT COUNT(*) FROM Fine f WHERE f.member_id = m.id)
+            FROM Member m
+            ON DUPLICATE KEY UPDATE reservations = VALUES(reservations), fines = VALUES(fines)
+        """)
+        db.commit()
+        logger.info("Dashboard counters reconciled.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
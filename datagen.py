@@ -0,0 +1,429 @@
+# datagen.py
+"""
+Synthetic production-scale dataset generator.
+
+Builds a test database of realistic shape on top of whatever is already
+there: a long tail of authors and publishers (a few of each own most of
+the catalog), members whose activity is skewed, and loans, reservations
+and fines spread over ``years`` of history with more activity in recent
+months. Which titles get borrowed and reserved follows a Zipf
+distribution, and the popular titles are scattered over the id range
+rather than clustered at its start.
+
+Ids are assigned up front from the tables' current maximum, so child rows
+reference their parents without any round trips. Rows go in through one
+of two bulk paths:
+
+* ``insert``: multi-row ``INSERT ... VALUES (...), (...)`` statements of
+  ``batch_size`` rows, committed per batch,
+* ``load-data``: ``LOAD DATA LOCAL INFILE`` from temporary TSV files
+  (needs ``local_infile=ON`` on the server).
+
+The secondary indexes from the migrations are dropped before loading and
+rebuilt with one ``ALTER TABLE`` per table afterwards, and the session
+runs with unique and foreign key checks off. Point it only at a
+throwaway database.
+"""
+import datetime
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+
+import mysql.connector
+
+import counters
+import fines_ledger
+import table_versions
+
+logger = logging.getLogger(__name__)
+
+PROFILES = {
+    'small': {'authors': 2000, 'publishers': 200, 'books': 50000, 'members': 10000,
+              'loans': 500000, 'reservations': 20000, 'fines': 50000},
+    'medium': {'authors': 20000, 'publishers': 1000, 'books': 500000, 'members': 50000,
+               'loans': 5000000, 'reservations': 200000, 'fines': 500000},
+    'production': {'authors': 150000, 'publishers': 5000, 'books': 3000000, 'members': 300000,
+                   'loans': 30000000, 'reservations': 1500000, 'fines': 3000000},
+}
+LOADERS = ('insert', 'load-data')
+
+DEFAULT_BATCH_SIZE = 5000
+LOAD_DATA_ROWS = 500000  # rows per temporary file for LOAD DATA
+
+# Zipf exponents: title popularity, books per author, books per publisher, member activity
+TITLE_SKEW = 1.0
+AUTHOR_SKEW = 1.1
+PUBLISHER_SKEW = 1.4
+MEMBER_SKEW = 0.8
+
+# Secondary indexes from the migrations, rebuilt after the load (name, columns)
+DEFERRED_INDEXES = {
+    'Book': [('idx_book_title', 'title'), ('idx_book_quantity', 'quantity')],
+    'Issued_Books': [('idx_issued_returned_date', 'returned, issue_date'),
+                     ('idx_issued_issue_date', 'issue_date'),
+                     ('idx_issued_member_date', 'member_id, issue_date'),
+                     ('idx_issued_returned_due', 'returned, return_date'),
+                     ('idx_issued_returned_at', 'returned_at')],
+    'Fine': [('idx_fine_member_date', 'member_id, date_assessed'), ('idx_fine_date', 'date_assessed'),
+             ('idx_fine_amount', 'amount, id')],
+    'Reservation': [('idx_reservation_member_date', 'member_id, reservation_date'),
+                    ('idx_reservation_date', 'reservation_date')],
+}
+
+# ER_DROP_INDEX_FK: MySQL folded the foreign key's own index into this one, so it has to stay
+_FK_INDEX_ERRNO = 1553
+
+_WORDS = ['Silent', 'River', 'Garden', 'Winter', 'Echo', 'Stone', 'Light', 'Harbor', 'Crown', 'Shadow',
+          'Iron', 'Glass', 'Summer', 'Night', 'Paper', 'Golden', 'Hidden', 'Last', 'Northern', 'Wild']
+_NOUNS = ['House', 'Road', 'Sea', 'City', 'Forest', 'Letter', 'Kingdom', 'Season', 'Promise', 'Map',
+          'Island', 'Clock', 'Bridge', 'Song', 'Fire', 'Tower', 'Orchard', 'Voyage', 'Archive', 'Mirror']
+_FIRST = ['Anna', 'James', 'Maria', 'Wei', 'Amir', 'Sofia', 'Lucas', 'Noor', 'Kenji', 'Elena',
+          'Tomas', 'Priya', 'Omar', 'Hana', 'Luca', 'Ines', 'Mateo', 'Zara', 'Ivan', 'Leila']
+_LAST = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Rossi', 'Kim', 'Silva', 'Haddad', 'Berg',
+         'Ivanova', 'Moreau', 'Tanaka', 'Patel', 'Costa', 'Fischer', 'Nguyen', 'Larsen', 'Mendes', 'Ali']
+
+
+class Zipf:
+    """
+    Samples 0-based ranks below ``n`` with P(rank k) ~ 1 / (k + 1) ** s by
+    inverting the continuous CDF, so millions of ranks need no table.
+    """
+
+    def __init__(self, n, s, rng):
+        self.n = max(1, int(n))
+        self.s = s
+        self.rng = rng
+        self._top = (self.n + 1) ** (1 - s) - 1 if s != 1 else math.log(self.n + 1)
+
+    def rank(self):
+        u = self.rng.random()
+        if self.s == 1:
+            x = math.exp(u * self._top)
+        else:
+            x = (1 + u * self._top) ** (1 / (1 - self.s))
+        return min(int(x) - 1, self.n - 1)
+
+
+class Scatter:
+    """Bijection rank -> offset in ``range(n)`` so popular ranks are spread over the id range"""
+
+    def __init__(self, n, rng):
+        self.n = max(1, int(n))
+        step = int(self.n * 0.6180339887) | 1
+        while math.gcd(step, self.n) != 1:
+            step += 2
+        self.step = step
+        self.shift = rng.randrange(self.n)
+
+    def __call__(self, rank):
+        return (rank * self.step + self.shift) % self.n
+
+
+# -------------------------
+# Row generators (yield tuples in the column order of TABLES)
+# -------------------------
+TABLES = {
+    'Author': ('id', 'name'),
+    'Publisher': ('id', 'name'),
+    'Book': ('id', 'title', 'author_id', 'publisher_id', 'quantity'),
+    'Member': ('id', 'username', 'email', 'password'),
+    'Issued_Books': ('id', 'book_id', 'member_id', 'issue_date', 'return_date', 'returned', 'returned_at'),
+    'Reservation': ('id', 'book_id', 'member_id', 'reservation_date'),
+    'Fine': ('id', 'member_id', 'issue_id', 'amount', 'reason', 'date_assessed'),
+}
+
+
+def _authors(base, count, rng):
+    for i in range(count):
+        yield (base + i + 1, f"{rng.choice(_FIRST)} {rng.choice(_LAST)} {base + i + 1}")
+
+
+def _publishers(base, count, rng):
+    suffixes = ['Press', 'Books', 'Publishing', 'House', 'Editions']
+    for i in range(count):
+        yield (base + i + 1, f"{rng.choice(_LAST)} {rng.choice(suffixes)} {base + i + 1}")
+
+
+def _books(base, count, authors, publishers, rng):
+    by_author = Zipf(authors[1], AUTHOR_SKEW, rng)
+    by_publisher = Zipf(publishers[1], PUBLISHER_SKEW, rng)
+    author_at, publisher_at = Scatter(authors[1], rng), Scatter(publishers[1], rng)
+    for i in range(count):
+        yield (base + i + 1,
+               f"{rng.choice(_WORDS)} {rng.choice(_NOUNS)} {base + i + 1}",
+               authors[0] + author_at(by_author.rank()) + 1,
+               publishers[0] + publisher_at(by_publisher.rank()) + 1,
+               rng.randint(1, 12))
+
+
+def _members(base, count, password_hash):
+    for i in range(count):
+        n = base + i + 1
+        yield (n, f"gen_member_{n}", f"gen_member_{n}@example.com", password_hash)
+
+
+def _days_ago(span, rng):
+    """0..span-1, denser towards 0: circulation grows over time"""
+    return int(span * (1 - math.sqrt(rng.random())))
+
+
+def _circulation(loan_base, fine_base, count, late_share, books, members, span, loan_days, rates, today, rng):
+    """
+    Yields (loan, fine or None). A ``late_share`` of past-due loans came
+    back late or are still out, and each of those carries the fine
+    ``assess-fines`` would have charged.
+    """
+    title = Zipf(books[1], TITLE_SKEW, rng)
+    book_at = Scatter(books[1], rng)
+    reader = Zipf(members[1], MEMBER_SKEW, rng)
+    member_at = Scatter(members[1], rng)
+    period = datetime.timedelta(days=loan_days)
+    next_fine = fine_base
+    for i in range(count):
+        issue_id = loan_base + i + 1
+        issued = today - datetime.timedelta(days=_days_ago(span, rng))
+        due = issued + period
+        overdue_days = (today - due).days
+        late = overdue_days > 0 and rng.random() < late_share
+        if overdue_days <= 0:
+            returned = rng.random() < 0.15
+        elif late:
+            returned = rng.random() < (0.98 if overdue_days > 60 else 0.7)
+        else:
+            returned = True
+        member_id = members[0] + member_at(reader.rank()) + 1
+        back = None
+        if late:
+            as_of = due + datetime.timedelta(days=rng.randint(1, min(overdue_days, 45))) if returned else today
+            back = as_of if returned else None
+        elif returned:
+            back = issued + datetime.timedelta(days=rng.randint(0, max(0, (min(due, today) - issued).days)))
+        loan = (issue_id, books[0] + book_at(title.rank()) + 1, member_id, issued, due, returned, back)
+
+        fine = None
+        if late:
+            amount, days = rates.amount(due, as_of)
+            if amount is not None:
+                next_fine += 1
+                fine = (next_fine, member_id, issue_id, amount, f"Overdue loan #{issue_id}: {days} day(s)", as_of)
+        yield loan, fine
+
+
+def _reservations(base, count, books, members, today, rng):
+    title = Zipf(books[1], TITLE_SKEW, rng)
+    book_at = Scatter(books[1], rng)
+    reader = Zipf(members[1], MEMBER_SKEW, rng)
+    member_at = Scatter(members[1], rng)
+    for i in range(count):
+        yield (base + i + 1, books[0] + book_at(title.rank()) + 1, members[0] + member_at(reader.rank()) + 1,
+               today - datetime.timedelta(days=_days_ago(60, rng)))
+
+
+# -------------------------
+# Bulk loaders
+# -------------------------
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _tsv(value):
+    if value is None:
+        return '\\N'
+    if value is True or value is False:
+        return '1' if value else '0'
+    return str(value)
+
+
+class InsertLoader:
+    """Multi-row INSERT statements, one commit per batch"""
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+
+    def load(self, cursor, table, rows, progress=None):
+        columns = TABLES[table]
+        row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+        total = 0
+        for batch in _batches(rows, self.batch_size):
+            cursor.execute(prefix + ', '.join([row_sql] * len(batch)), [v for row in batch for v in row])
+            self.db.commit()
+            total += len(batch)
+            if progress:
+                progress(table, total)
+        return total
+
+
+class LoadDataLoader:
+    """``LOAD DATA LOCAL INFILE`` from temporary TSV files of ``LOAD_DATA_ROWS`` rows"""
+
+    def __init__(self, db, rows_per_file=LOAD_DATA_ROWS):
+        self.db = db
+        self.rows_per_file = rows_per_file
+
+    def load(self, cursor, table, rows, progress=None):
+        columns = TABLES[table]
+        total = 0
+        for batch in _batches(rows, self.rows_per_file):
+            fd, path = tempfile.mkstemp(prefix=f"datagen_{table}_", suffix='.tsv')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as fh:
+                    for row in batch:
+                        fh.write('\t'.join(_tsv(v) for v in row))
+                        fh.write('\n')
+                cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    ({', '.join(columns)})
+                """, (path,))
+                self.db.commit()
+            finally:
+                os.unlink(path)
+            total += len(batch)
+            if progress:
+                progress(table, total)
+        return total
+
+
+# -------------------------
+# Index deferral
+# -------------------------
+def drop_secondary_indexes(db):
+    """Drops the deferred indexes that exist; returns {table: [(name, columns), ...]} to rebuild"""
+    cursor = db.cursor()
+    dropped = {}
+    try:
+        cursor.execute("""
+            SELECT DISTINCT table_name, index_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+        """)
+        present = {(table.lower(), name) for table, name in cursor.fetchall()}
+        for table, indexes in DEFERRED_INDEXES.items():
+            for name, columns in indexes:
+                if (table.lower(), name) not in present:
+                    continue
+                try:
+                    cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}")
+                except mysql.connector.Error as err:
+                    if err.errno != _FK_INDEX_ERRNO:
+                        raise
+                    logger.info("Keeping %s.%s: it backs a foreign key", table, name)
+                    continue
+                dropped.setdefault(table, []).append((name, columns))
+    finally:
+        cursor.close()
+    return dropped
+
+
+def rebuild_indexes(db, dropped):
+    """Recreates dropped indexes, one ALTER TABLE (one table pass) per table"""
+    cursor = db.cursor()
+    try:
+        for table, indexes in dropped.items():
+            started = time.monotonic()
+            cursor.execute(f"ALTER TABLE {table} " + ', '.join(
+                f"ADD INDEX {name} ({columns})" for name, columns in indexes))
+            logger.info("Rebuilt %d index(es) on %s in %.1fs", len(indexes), table, time.monotonic() - started)
+    finally:
+        cursor.close()
+
+
+# -------------------------
+# Driver
+# -------------------------
+def _max_ids(cursor):
+    bases = {}
+    for table in TABLES:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        bases[table] = cursor.fetchone()[0]
+    return bases
+
+
+def generate(db, counts, password_hash, rates, seed=None, years=5, loan_days=14, loader='insert',
+             batch_size=DEFAULT_BATCH_SIZE, defer_indexes=True, progress=None):
+    """
+    Appends ``counts`` (see ``PROFILES``) rows per table and returns
+    {table: rows inserted}. ``rates`` is an ``overdue_fines.FineRates`` so
+    generated fines match what ``assess-fines`` would charge.
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    span = max(1, int(years * 365))
+    loaders = {'insert': lambda: InsertLoader(db, batch_size), 'load-data': lambda: LoadDataLoader(db)}
+    if loader not in loaders:
+        raise ValueError(f"Unknown loader {loader!r}; expected one of {LOADERS}")
+    bulk = loaders[loader]()
+    started = time.monotonic()
+
+    def report(table, rows):
+        if progress:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            progress({'table': table, 'rows': rows, 'elapsed': round(elapsed, 1)})
+
+    cursor = db.cursor()
+    cursor.execute("SET SESSION unique_checks = 0")
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    bases = _max_ids(cursor)
+    dropped = drop_secondary_indexes(db) if defer_indexes else {}
+    done = {}
+    try:
+        # Children reference the rows generated in this run, or the existing
+        # id range of a table nothing is generated for. (offset, count) pairs.
+        def parents(table, key):
+            return (bases[table], counts[key]) if counts[key] else (0, bases[table])
+
+        authors, publishers = parents('Author', 'authors'), parents('Publisher', 'publishers')
+        books, members = parents('Book', 'books'), parents('Member', 'members')
+        if not (authors[1] and publishers[1] and books[1] and members[1]):
+            raise ValueError("No authors, publishers, books or members to reference.")
+
+        done['Author'] = bulk.load(cursor, 'Author', _authors(bases['Author'], counts['authors'], rng), report)
+        done['Publisher'] = bulk.load(cursor, 'Publisher',
+                                      _publishers(bases['Publisher'], counts['publishers'], rng), report)
+        done['Book'] = bulk.load(cursor, 'Book',
+                                 _books(bases['Book'], counts['books'], authors, publishers, rng), report)
+        done['Member'] = bulk.load(cursor, 'Member',
+                                   _members(bases['Member'], counts['members'], password_hash), report)
+
+        # Loans and their fines come from the same stream: it is generated
+        # twice from one seed instead of holding millions of fines in memory.
+        circulation_seed = rng.random()
+        late_share = min(1.0, counts['fines'] / max(1, counts['loans']))
+
+        def circulation():
+            return _circulation(bases['Issued_Books'], bases['Fine'], counts['loans'], late_share, books, members,
+                                span, loan_days, rates, today, random.Random(circulation_seed))
+
+        done['Issued_Books'] = bulk.load(cursor, 'Issued_Books', (loan for loan, _ in circulation()), report)
+        done['Fine'] = bulk.load(cursor, 'Fine', (fine for _, fine in circulation() if fine), report)
+        done['Reservation'] = bulk.load(cursor, 'Reservation', _reservations(
+            bases['Reservation'], counts['reservations'], books, members, today, rng), report)
+    finally:
+        cursor.execute("SET SESSION unique_checks = 1")
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.close()
+        if dropped:
+            rebuild_indexes(db, dropped)
+
+    cursor = db.cursor()
+    fines_ledger.post_missing_charges(cursor)
+    table_versions.bump(cursor, 'Author', 'Publisher', 'Book', 'Member', 'Issued_Books', 'Reservation', 'Fine',
+                        'Fine_Ledger')
+    db.commit()
+    cursor.close()
+    counters.reconcile(db)
+    fines_ledger.reconcile(db)
+    logger.info("Generated %s in %.1fs", done, time.monotonic() - started)
+    return done
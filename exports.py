@@ -0,0 +1,143 @@
+# exports.py
+"""
+Streaming CSV / NDJSON exports of the catalog, circulation (current and archived) and fines.
+
+Rows are pulled from an unbuffered cursor with ``fetchmany`` and encoded
+in small batches, so memory stays flat and the header (or first rows)
+reach the client before the query has finished sending results.
+"""
+import csv
+import datetime
+import decimal
+import io
+import json
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+FETCH_BATCH = 1000
+
+EXPORTS = {
+    'catalog': {
+        'sql': """
+            SELECT Book.id, Book.title, Author.name AS author, Publisher.name AS publisher, Book.quantity
+            FROM Book
+            LEFT JOIN Author ON Book.author_id = Author.id
+            LEFT JOIN Publisher ON Book.publisher_id = Publisher.id""",
+        'order_by': 'Book.id',
+        'columns': ['id', 'title', 'author', 'publisher', 'quantity'],
+    },
+    'circulation': {
+        'sql': """
+            SELECT ib.id, ib.book_id, b.title AS book_title, ib.member_id, m.username AS member_username,
+                   ib.issue_date, ib.return_date, ib.returned
+            FROM Issued_Books ib
+            JOIN Book b ON ib.book_id = b.id
+            JOIN Member m ON ib.member_id = m.id""",
+        'order_by': 'ib.id',
+        'columns': ['id', 'book_id', 'book_title', 'member_id', 'member_username',
+                    'issue_date', 'return_date', 'returned'],
+    },
+    'history': {
+        'sql': """
+            SELECT ib.id, ib.book_id, b.title AS book_title, ib.member_id, m.username AS member_username,
+                   ib.issue_date, ib.return_date, ib.returned_at
+            FROM Issued_Books_Archive ib
+            JOIN Book b ON ib.book_id = b.id
+            JOIN Member m ON ib.member_id = m.id""",
+        'order_by': 'ib.id',
+        'columns': ['id', 'book_id', 'book_title', 'member_id', 'member_username',
+                    'issue_date', 'return_date', 'returned_at'],
+    },
+    'fines': {
+        'sql': """
+            SELECT Fine.id, Fine.member_id, Member.username AS member_username, Fine.amount,
+                   Fine.reason, Fine.date_assessed
+            FROM Fine
+            JOIN Member ON Fine.member_id = Member.id""",
+        'order_by': 'Fine.id',
+        'columns': ['id', 'member_id', 'member_username', 'amount', 'reason', 'date_assessed'],
+    },
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def iter_rows(db, sql, params=()):
+    """Yields row tuples from an unbuffered cursor, ``FETCH_BATCH`` at a time"""
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(sql, params)
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        # Drain anything unread (client went away) so the connection is reusable.
+        try:
+            cursor.fetchall()
+        except Exception:
+            pass
+        cursor.close()
+
+
+def encode_csv(rows, columns, rows_per_chunk=500):
+    """Yields UTF-8 CSV chunks; the header goes out on its own so the first byte is immediate"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(rows, columns, rows_per_chunk=500):
+    """Yields UTF-8 newline-delimited JSON chunks, one object per row"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=_json_default, separators=(',', ':')))
+        if len(lines) >= rows_per_chunk:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def export_sql(name, where=None):
+    """SQL for export ``name``, primary-key ordered so the server can stream it off the index"""
+    spec = EXPORTS[name]
+    sql = spec['sql']
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY " + spec['order_by']
+
+
+def stream_export(db, name, fmt, where=None, params=()):
+    """Returns a generator of encoded chunks for export ``name`` in format ``fmt``"""
+    spec = EXPORTS[name]
+    rows = iter_rows(db, export_sql(name, where), tuple(params))
+    if fmt == 'csv':
+        return encode_csv(rows, spec['columns'])
+    if fmt == 'ndjson':
+        return encode_ndjson(rows, spec['columns'])
+    raise ValueError(f"Unsupported export format {fmt!r}")
@@ -0,0 +1,136 @@
+# fines_ledger.py
+"""
+Fines ledger: charges, payments and waivers per member, with a running balance.
+
+``Fine`` rows stay the assessments (what a member was fined for and how
+much is currently due on it). Every change to what a member owes is also
+appended to ``Fine_Ledger`` as a signed amount:
+
+* a charge when a fine is added or the overdue engine raises it,
+* a payment (negative) when staff take money at the desk,
+* a waiver (negative) when a fine is deleted.
+
+``post()`` applies the same amounts to ``Member_Balance`` in the caller's
+transaction, so a balance check (``balance()``) is one primary-key read and
+never drifts from the entries. ``reconcile()`` recomputes the balances
+from the ledger to repair rows changed outside the app.
+"""
+import decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHARGE = 'charge'
+PAYMENT = 'payment'
+WAIVER = 'waiver'
+
+NOTE_MAX_LENGTH = 255
+_ZERO = decimal.Decimal('0.00')
+
+_ENTRY_SQL = ("INSERT INTO Fine_Ledger (member_id, entry_type, amount, fine_id, note) "
+              "VALUES (%s, %s, %s, %s, %s)")
+_BALANCE_SQL = ("INSERT INTO Member_Balance (member_id, balance) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)")
+_READ_SQL = "SELECT balance FROM Member_Balance WHERE member_id = %s"
+
+
+class PaymentError(ValueError):
+    """A payment that is not positive or exceeds what the member owes"""
+
+
+def _money(value):
+    return decimal.Decimal(str(value)).quantize(_ZERO)
+
+
+def _note(text):
+    return text[:NOTE_MAX_LENGTH] if text else None
+
+
+def post(cursor, entries):
+    """
+    Appends ``(member_id, entry_type, amount, fine_id, note)`` entries and
+    adds them to the members' balances; call before the caller's commit.
+    """
+    entries = [(member_id, entry_type, decimal.Decimal(str(amount)), fine_id, _note(note))
+               for member_id, entry_type, amount, fine_id, note in entries if amount]
+    if not entries:
+        return
+    cursor.executemany(_ENTRY_SQL, entries)
+    deltas = {}
+    for member_id, _, amount, _, _ in entries:
+        deltas[member_id] = deltas.get(member_id, _ZERO) + amount
+    # Member order keeps concurrent batches from locking balance rows in opposite orders.
+    cursor.executemany(_BALANCE_SQL, sorted(deltas.items()))
+
+
+def charge(cursor, member_id, amount, fine_id=None, note=None):
+    post(cursor, [(member_id, CHARGE, amount, fine_id, note)])
+
+
+def waive(cursor, member_id, amount, fine_id=None, note=None):
+    post(cursor, [(member_id, WAIVER, -decimal.Decimal(str(amount)), fine_id, note)])
+
+
+def pay(cursor, member_id, amount, note=None):
+    """Records a payment against the member's balance; raises ``PaymentError`` for overpayments"""
+    amount = _money(amount)
+    if amount <= 0:
+        raise PaymentError("Payment must be a positive amount.")
+    cursor.execute(_READ_SQL + " FOR UPDATE", (member_id,))
+    row = cursor.fetchone()
+    owed = _money(row[0]) if row else _ZERO
+    if amount > owed:
+        raise PaymentError(f"Payment of {amount} exceeds the balance of {owed}.")
+    post(cursor, [(member_id, PAYMENT, -amount, None, note)])
+    return owed - amount
+
+
+def balance(cursor, member_id):
+    """What the member owes (0 for members with no ledger entries)"""
+    cursor.execute(_READ_SQL, (member_id,))
+    row = cursor.fetchone()
+    return _money(row[0]) if row else _ZERO
+
+
+async def balance_async(cursor, member_id):
+    """``balance`` on an async_db cursor"""
+    await cursor.execute(_READ_SQL, (member_id,))
+    row = await cursor.fetchone()
+    return _money(row[0]) if row else _ZERO
+
+
+def over_limit(owed, limit):
+    """True when ``owed`` exceeds ``limit`` (a decimal string; empty means no limit)"""
+    return bool(limit) and owed > decimal.Decimal(str(limit))
+
+
+def post_missing_charges(cursor):
+    """Opening charges for fines that have no ledger entry yet (e.g. bulk-loaded); returns the count"""
+    cursor.execute(f"""
+        INSERT INTO Fine_Ledger (member_id, entry_type, amount, fine_id, note, created_at)
+        SELECT f.member_id, '{CHARGE}', f.amount, f.id, SUBSTRING(f.reason, 1, {NOTE_MAX_LENGTH}),
+               COALESCE(f.date_assessed, CURRENT_TIMESTAMP)
+        FROM Fine f
+        WHERE f.member_id IS NOT NULL AND f.amount IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM Fine_Ledger l WHERE l.fine_id = f.id)
+    """)
+    return cursor.rowcount
+
+
+def reconcile(db):
+    """Recomputes every member's balance from the ledger in one transaction"""
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE Member_Balance SET balance = 0")
+        cursor.execute("""
+            INSERT INTO Member_Balance (member_id, balance)
+            SELECT member_id, SUM(amount) FROM Fine_Ledger GROUP BY member_id
+            ON DUPLICATE KEY UPDATE balance = VALUES(balance)
+        """)
+        db.commit()
+        logger.info("Member balances reconciled.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
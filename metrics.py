@@ -0,0 +1,234 @@
+# metrics.py
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Covers request latency per endpoint, per-statement query timings (SQL is
+normalized so ``WHERE id = 5`` and ``WHERE id = 7`` share one series),
+connection acquisition time and template render time. Like the pool and
+the query cache, the registry is per process: scrape each gunicorn worker
+separately or run one worker with threads when a single series is needed.
+
+``InstrumentedConnection`` wraps a DB-API connection so every cursor's
+``execute``/``executemany`` is timed; ``raw`` is the wrapped connection
+for code (the pool) that needs the original object.
+"""
+import re
+import threading
+import time
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+MAX_STATEMENTS = 500  # distinct normalized statements before the rest share one series
+_OTHER_STATEMENT = 'other'
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_VALUES_RE = re.compile(r'(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Collapses literals, IN lists and whitespace so one statement shape is one series"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    sql = _VALUES_RE.sub(r'\1, ...', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_float(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_format_float(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def series_count(self):
+        with self._lock:
+            return len(self._series)
+
+    def has_series(self, *labels):
+        with self._lock:
+            return labels in self._series
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_float(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_float(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """``collector()`` returns (name, type, help, [(labels_dict, value), ...]) tuples at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names, values = tuple(labels), tuple(labels.values())
+                    lines.append(f"{name}{_labels(names, values)} {_format_float(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    'library_http_request_duration_seconds', 'Request handling time by endpoint.',
+    ('endpoint', 'method', 'status')))
+QUERY_LATENCY = registry.register(Histogram(
+    'library_db_query_duration_seconds', 'Query execution time by normalized statement.',
+    ('statement',), buckets=QUERY_BUCKETS))
+QUERY_ERRORS = registry.register(Counter(
+    'library_db_query_errors_total', 'Queries that raised, by normalized statement.', ('statement',)))
+CONNECTION_ACQUIRE = registry.register(Histogram(
+    'library_db_connection_acquire_seconds', 'Time spent waiting for a pooled connection.',
+    buckets=QUERY_BUCKETS))
+TEMPLATE_RENDER = registry.register(Histogram(
+    'library_template_render_seconds', 'Template render time by template.', ('template',)))
+
+
+def statement_label(sql):
+    label = normalize_sql(sql)[:300]
+    if not QUERY_LATENCY.has_series(label) and QUERY_LATENCY.series_count() >= MAX_STATEMENTS:
+        return _OTHER_STATEMENT
+    return label
+
+
+def observe_query(sql, params, elapsed, failed=False):
+    label = statement_label(sql)
+    QUERY_LATENCY.observe(elapsed, label)
+    if failed:
+        QUERY_ERRORS.inc(1, label)
+
+
+class InstrumentedCursor:
+    """
+    Times ``execute``/``executemany`` and reports ``on_query(sql, params, elapsed, failed)``;
+    everything else goes to the real cursor.
+    """
+
+    def __init__(self, cursor, on_query=observe_query):
+        self._cursor = cursor
+        self._on_query = on_query
+
+    def _timed(self, method, sql, params):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(sql, params)
+            failed = False
+            return result
+        finally:
+            self._on_query(sql, params, time.perf_counter() - started, failed)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._timed(self._cursor.executemany, sql, seq_params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are timed; ``raw`` is the pooled connection"""
+
+    def __init__(self, raw, on_query=observe_query):
+        self.raw = raw
+        self._on_query = on_query
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs), self._on_query)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        if name in ('raw', '_on_query'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.raw, name, value)  # e.g. ``conn.autocommit = True``
+
+
+def unwrap(conn):
+    return getattr(conn, 'raw', conn)
@@ -0,0 +1,125 @@
+# migrate.py
+"""
+Ordered, versioned schema migrations.
+
+Migrations are ``migrations/NNNN_description.sql`` files applied in version
+order and recorded in ``schema_migrations``. MySQL commits DDL implicitly,
+so a migration that fails halfway is not rolled back; re-running it is safe
+because "already exists" errors (duplicate table/index/column) are skipped.
+
+    flask --app app db-migrate            # apply pending migrations
+    flask --app app db-migrate --status   # list applied/pending versions
+    flask --app app db-migrate --baseline # load mysql.sql into an empty database first
+"""
+import logging
+import os
+import re
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mysql.sql')
+
+_FILENAME_RE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+
+# ER_TABLE_EXISTS_ERROR, ER_DUP_FIELDNAME, ER_DUP_KEYNAME
+_ALREADY_APPLIED_ERRNOS = {1050, 1060, 1061}
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def statements(self):
+        with open(self.path, encoding='utf-8') as fh:
+            lines = [line for line in fh if not line.lstrip().startswith('--')]
+        return [stmt.strip() for stmt in ''.join(lines).split(';') if stmt.strip()]
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Returns the migrations on disk sorted by version"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2),
+                                        os.path.join(directory, filename)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError("Duplicate migration version numbers in migrations/")
+    return migrations
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(db):
+    cursor = db.cursor()
+    _ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def pending(db, directory=MIGRATIONS_DIR):
+    done = applied_versions(db)
+    return [m for m in discover(directory) if m.version not in done]
+
+
+def apply(db, migration):
+    cursor = db.cursor()
+    try:
+        for statement in migration.statements():
+            try:
+                cursor.execute(statement)
+            except mysql.connector.Error as err:
+                if err.errno in _ALREADY_APPLIED_ERRNOS:
+                    logger.info("Migration %04d: skipping already-applied statement (%s)",
+                                migration.version, err.msg)
+                    continue
+                raise
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                       (migration.version, migration.name))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("Applied migration %04d_%s", migration.version, migration.name)
+
+
+def load_baseline(db, path=BASELINE_PATH):
+    """Creates the baseline schema and seed data (mysql.sql); for empty databases only"""
+    cursor = db.cursor()
+    try:
+        for statement in Migration(0, 'baseline', path).statements():
+            cursor.execute(statement)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("Loaded baseline schema from %s", path)
+
+
+def migrate(db, directory=MIGRATIONS_DIR):
+    """Applies every pending migration in order; returns the ones applied"""
+    todo = pending(db, directory)
+    for migration in todo:
+        apply(db, migration)
+    return todo
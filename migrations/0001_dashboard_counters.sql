@@ -0,0 +1,26 @@
+-- Materialized counters for the dashboards (maintained by the app, see counters.py)
+CREATE TABLE IF NOT EXISTS Stat_Counter (
+    name VARCHAR(64) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS Member_Counter (
+    member_id INT PRIMARY KEY,
+    reservations INT NOT NULL DEFAULT 0,
+    fines INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
+INSERT INTO Stat_Counter (name, value)
+SELECT 'books', COUNT(*) FROM Book
+UNION ALL SELECT 'members', COUNT(*) FROM Member
+UNION ALL SELECT 'reservations', COUNT(*) FROM Reservation
+UNION ALL SELECT 'fines', COUNT(*) FROM Fine
+ON DUPLICATE KEY UPDATE value = VALUES(value);
+
+INSERT INTO Member_Counter (member_id, reservations, fines)
+SELECT m.id,
+       (SELECT COUNT(*) FROM Reservation r WHERE r.member_id = m.id),
+       (SELECT COUNT(*) FROM Fine f WHERE f.member_id = m.id)
+FROM Member m
+ON DUPLICATE KEY UPDATE reservations = VALUES(reservations), fines = VALUES(fines);
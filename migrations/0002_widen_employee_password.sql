@@ -0,0 +1,2 @@
+-- scrypt/pbkdf2 hashes written by the rehash-on-login path exceed 100 characters
+ALTER TABLE Employee MODIFY password VARCHAR(255) NOT NULL;
@@ -0,0 +1,22 @@
+-- Secondary indexes for the columns the app filters and sorts on.
+-- InnoDB appends the primary key to every secondary index, so each of these
+-- also serves the (sort column, id) keyset ORDER BY used by the list pages.
+-- Plain FK indexes on member_id/book_id already exist; the composites below
+-- extend them with the sort column.
+
+-- Catalog: title sort / prefix search, in-stock filters
+CREATE INDEX idx_book_title ON Book (title);
+CREATE INDEX idx_book_quantity ON Book (quantity);
+
+-- Circulation: outstanding/returned listings, member history, default date sort
+CREATE INDEX idx_issued_returned_date ON Issued_Books (returned, issue_date);
+CREATE INDEX idx_issued_issue_date ON Issued_Books (issue_date);
+CREATE INDEX idx_issued_member_date ON Issued_Books (member_id, issue_date);
+
+-- Fines: per-member history ordered by date, admin list ordered by date
+CREATE INDEX idx_fine_member_date ON Fine (member_id, date_assessed);
+CREATE INDEX idx_fine_date ON Fine (date_assessed);
+
+-- Reservations: per-member lookups and the date-sorted admin list
+CREATE INDEX idx_reservation_member_date ON Reservation (member_id, reservation_date);
+CREATE INDEX idx_reservation_date ON Reservation (reservation_date);
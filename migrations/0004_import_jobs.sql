@@ -0,0 +1,15 @@
+-- Checkpoints for streaming catalog imports (see catalog_import.py)
+CREATE TABLE IF NOT EXISTS Import_Job (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    source VARCHAR(512) NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    records_done INT NOT NULL DEFAULT 0,
+    books_inserted INT NOT NULL DEFAULT 0,
+    records_rejected INT NOT NULL DEFAULT 0,
+    authors_created INT NOT NULL DEFAULT 0,
+    publishers_created INT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,9 @@
+-- Per-table change versions backing API ETags (see table_versions.py)
+CREATE TABLE IF NOT EXISTS Table_Version (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT IGNORE INTO Table_Version (name, version) VALUES
+    ('Author', 0), ('Book', 0), ('Fine', 0), ('Issued_Books', 0),
+    ('Member', 0), ('Publisher', 0), ('Reservation', 0);
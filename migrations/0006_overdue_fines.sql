@@ -0,0 +1,24 @@
+-- Incremental overdue-fine engine (see overdue_fines.py)
+
+-- One engine-assessed fine per loan (manual fines keep issue_id NULL).
+-- No foreign key: the fine must survive its loan being archived.
+ALTER TABLE Fine ADD COLUMN issue_id INT NULL;
+CREATE UNIQUE INDEX uq_fine_issue ON Fine (issue_id);
+
+-- Open loans by due date: the engine walks this range in (return_date, id) order
+CREATE INDEX idx_issued_returned_due ON Issued_Books (returned, return_date);
+
+CREATE TABLE IF NOT EXISTS Fine_Run (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    as_of DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    due_floor DATE NULL,
+    last_due DATE NULL,
+    last_issue_id INT NOT NULL DEFAULT 0,
+    loans_scanned INT NOT NULL DEFAULT 0,
+    fines_created INT NOT NULL DEFAULT 0,
+    fines_updated INT NOT NULL DEFAULT 0,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_fine_run_status (status, as_of)
+);
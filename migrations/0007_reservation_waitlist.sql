@@ -0,0 +1,17 @@
+-- FIFO reservation waitlist per book (see waitlist.py)
+-- The auto-increment id is the queue order. (book_id, id) serves both the
+-- head-of-queue lookup on return and the position count, and the unique
+-- key keeps a member to one place per book.
+CREATE TABLE IF NOT EXISTS Waitlist (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    book_id INT NOT NULL,
+    member_id INT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_waitlist_book_member (book_id, member_id),
+    INDEX idx_waitlist_book_queue (book_id, id),
+    INDEX idx_waitlist_member (member_id),
+    FOREIGN KEY (book_id) REFERENCES Book(id) ON DELETE CASCADE,
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
+INSERT IGNORE INTO Table_Version (name, version) VALUES ('Waitlist', 0);
@@ -0,0 +1,37 @@
+-- Fines ledger (see fines_ledger.py)
+
+-- Every charge, payment and waiver as a signed amount (payments and waivers
+-- are negative). (member_id, id) serves a member's history, newest first.
+-- fine_id has no foreign key: the entry must outlive a deleted fine.
+CREATE TABLE IF NOT EXISTS Fine_Ledger (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    member_id INT NOT NULL,
+    entry_type VARCHAR(10) NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    fine_id INT NULL,
+    note VARCHAR(255),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_ledger_member (member_id, id),
+    INDEX idx_ledger_fine (fine_id),
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
+-- Running balance per member, updated in the same transaction as each ledger entry
+CREATE TABLE IF NOT EXISTS Member_Balance (
+    member_id INT PRIMARY KEY,
+    balance DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
+-- Opening entries: one charge per existing fine
+INSERT INTO Fine_Ledger (member_id, entry_type, amount, fine_id, note, created_at)
+SELECT f.member_id, 'charge', f.amount, f.id, SUBSTRING(f.reason, 1, 255), COALESCE(f.date_assessed, CURRENT_TIMESTAMP)
+FROM Fine f
+WHERE f.member_id IS NOT NULL AND f.amount IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM Fine_Ledger l WHERE l.fine_id = f.id);
+
+INSERT INTO Member_Balance (member_id, balance)
+SELECT member_id, SUM(amount) FROM Fine_Ledger GROUP BY member_id
+ON DUPLICATE KEY UPDATE balance = VALUES(balance);
+
+INSERT IGNORE INTO Table_Version (name, version) VALUES ('Fine_Ledger', 0);
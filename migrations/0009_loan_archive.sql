@@ -0,0 +1,28 @@
+-- Hot/cold split of circulation history (see loan_archive.py)
+
+-- When a loan came back. Loans returned before this column existed count
+-- from their due date.
+ALTER TABLE Issued_Books ADD COLUMN returned_at DATE NULL;
+UPDATE Issued_Books SET returned_at = return_date WHERE returned = TRUE AND returned_at IS NULL;
+
+-- The archiver takes the oldest returns first
+CREATE INDEX idx_issued_returned_at ON Issued_Books (returned_at);
+
+-- Cold storage for returned loans. Ids are kept, so Fine.issue_id still
+-- points at the loan. The history page reads it by date and per member.
+CREATE TABLE IF NOT EXISTS Issued_Books_Archive (
+    id INT PRIMARY KEY,
+    book_id INT,
+    member_id INT,
+    issue_date DATE,
+    return_date DATE,
+    returned BOOLEAN DEFAULT TRUE,
+    returned_at DATE,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_archive_issue_date (issue_date),
+    INDEX idx_archive_member_date (member_id, issue_date),
+    FOREIGN KEY (book_id) REFERENCES Book(id) ON DELETE CASCADE,
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
+INSERT IGNORE INTO Table_Version (name, version) VALUES ('Issued_Books_Archive', 0);
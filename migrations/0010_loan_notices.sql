@@ -0,0 +1,19 @@
+-- Due-date reminders and overdue notices (see reminders.py)
+
+-- One row per notice per loan and due date: a run claims the row before it
+-- sends, so a loan is never mailed the same notice twice (a renewed loan
+-- has a new due date and gets a new reminder). Rows go with their loan
+-- when it is archived or deleted.
+CREATE TABLE IF NOT EXISTS Loan_Notice (
+    issue_id INT NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    due_date DATE NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'sending',
+    claim CHAR(32) NOT NULL,
+    error VARCHAR(255) NULL,
+    claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP NULL,
+    PRIMARY KEY (issue_id, kind, due_date),
+    INDEX idx_notice_claim (claim),
+    FOREIGN KEY (issue_id) REFERENCES Issued_Books(id) ON DELETE CASCADE
+);
@@ -0,0 +1,6 @@
+-- Manage-fines "amount" sort: keyset pages walk (amount, id) instead of a filesort.
+-- amount becomes NOT NULL so no row falls outside the keyset predicate
+-- (NULL never compares), existing NULLs are treated as nothing owed.
+UPDATE Fine SET amount = 0 WHERE amount IS NULL;
+ALTER TABLE Fine MODIFY amount DECIMAL(10, 2) NOT NULL;
+CREATE INDEX idx_fine_amount ON Fine (amount, id);
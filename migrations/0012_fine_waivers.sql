@@ -0,0 +1,8 @@
+-- Loans whose engine fine staff deleted (waived): assess-fines skips them
+-- instead of charging the full amount again on its next run.
+-- No foreign key, like Fine.issue_id: the waiver outlives the loan being archived.
+CREATE TABLE IF NOT EXISTS Fine_Waiver (
+    issue_id INT PRIMARY KEY,
+    fine_id INT NULL,
+    waived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
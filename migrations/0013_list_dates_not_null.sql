@@ -0,0 +1,15 @@
+-- Keyset pages compare the sort column, and NULL never compares, so rows with
+-- a NULL date fell out of every listing after the first page. Backfill the
+-- dates the listings sort on and make them NOT NULL (the forms now require them).
+-- Unknown dates become the migration date, a loan with no issue date takes its due date.
+UPDATE Fine SET date_assessed = CURDATE() WHERE date_assessed IS NULL;
+ALTER TABLE Fine MODIFY date_assessed DATE NOT NULL;
+
+UPDATE Reservation SET reservation_date = CURDATE() WHERE reservation_date IS NULL;
+ALTER TABLE Reservation MODIFY reservation_date DATE NOT NULL;
+
+UPDATE Issued_Books SET issue_date = COALESCE(return_date, CURDATE()) WHERE issue_date IS NULL;
+ALTER TABLE Issued_Books MODIFY issue_date DATE NOT NULL;
+
+UPDATE Issued_Books_Archive SET issue_date = COALESCE(return_date, CURDATE()) WHERE issue_date IS NULL;
+ALTER TABLE Issued_Books_Archive MODIFY issue_date DATE NOT NULL;
@@ -1,5 +1,8 @@
 -- Railway MySQL schema for library management system
 -- Note: Database will be created automatically by Railway
+--
+-- This is the baseline schema plus seed data. Later schema changes live in
+-- migrations/ and are applied with: flask --app app db-migrate
 
 -- Table Creation
 -- These tables are created first as other tables depend on them.
@@ -70,6 +73,17 @@ CREATE TABLE Fine (
     FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
 );
 
+CREATE TABLE Issued_Books (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    book_id INT,
+    member_id INT,
+    issue_date DATE,
+    return_date DATE,
+    returned BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (book_id) REFERENCES Book(id) ON DELETE CASCADE,
+    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
+);
+
 -- --- Data Insertion ---
 
 -- Insert Admins
@@ -108,14 +122,3 @@ INSERT INTO Book (title, author_id, publisher_id, quantity) VALUES
 ('A Tale of Two Cities', 10, 4, 11),
 ('It', 4, 5, 9),
 ('Sense and Sensibility', 5, 1, 6);
-USE librarys_management_system;
-CREATE TABLE Issued_Books (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    book_id INT,
-    member_id INT,
-    issue_date DATE,
-    return_date DATE,
-    returned BOOLEAN DEFAULT FALSE,
-    FOREIGN KEY (book_id) REFERENCES Book(id) ON DELETE CASCADE,
-    FOREIGN KEY (member_id) REFERENCES Member(id) ON DELETE CASCADE
-);
\ No newline at end of file
@@ -0,0 +1,210 @@
+# overdue_fines.py
+"""
+Incremental overdue-fine assessment driven by ``Issued_Books.return_date``.
+
+``return_date`` is the due date. For every open loan past it the engine
+computes ``min(rate * days_overdue, cap)`` and upserts one ``Fine`` row
+per loan (keyed by ``Fine.issue_id``), so re-running a day is a no-op.
+Each increase is posted to the fines ledger as a charge of the difference.
+Loans whose engine fine staff deleted are recorded in ``Fine_Waiver`` and
+never charged again.
+
+Work is bounded two ways:
+
+* Within a run, open loans are walked in ``(return_date, id)`` order on
+  ``idx_issued_returned_due`` in keyset batches, each committed with a
+  checkpoint in ``Fine_Run``; an interrupted run resumes after it.
+* Across runs, the last completed run is the high-water mark. A loan that
+  had already reached the cap by then cannot change any more, so only
+  loans due after ``last_as_of - grace - days_to_cap`` are read again.
+
+    flask --app app assess-fines [--as-of YYYY-MM-DD]
+"""
+import datetime
+import decimal
+import logging
+import math
+import time
+
+import counters
+import fines_ledger
+import table_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+_CENT = decimal.Decimal('0.01')
+
+
+class FineRates:
+    """Per-day rate, per-loan cap (None = uncapped) and days of grace after the due date"""
+
+    def __init__(self, per_day, max_per_loan=None, grace_days=0):
+        self.per_day = decimal.Decimal(str(per_day))
+        self.max_per_loan = decimal.Decimal(str(max_per_loan)) if max_per_loan else None
+        self.grace_days = int(grace_days)
+
+    def amount(self, due_date, as_of):
+        days = (as_of - due_date).days - self.grace_days
+        if days <= 0:
+            return None, 0
+        amount = self.per_day * days
+        if self.max_per_loan is not None:
+            amount = min(amount, self.max_per_loan)
+        return amount.quantize(_CENT), days
+
+    def days_to_cap(self):
+        """Chargeable days after which a loan's fine stops changing; None when uncapped"""
+        if self.max_per_loan is None or self.per_day <= 0:
+            return None
+        return math.ceil(self.max_per_loan / self.per_day)
+
+
+def _last_completed(cursor):
+    cursor.execute("SELECT as_of FROM Fine_Run WHERE status = 'completed' ORDER BY as_of DESC LIMIT 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _due_floor(last_as_of, rates):
+    cap_days = rates.days_to_cap()
+    if last_as_of is None or cap_days is None:
+        return None
+    return last_as_of - datetime.timedelta(days=rates.grace_days + cap_days)
+
+
+def _get_run(db, run_id):
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM Fine_Run WHERE id = %s", (run_id,))
+    run = cursor.fetchone()
+    cursor.close()
+    return run
+
+
+def _start_run(db, as_of, rates, full=False):
+    """Returns the id of the run to work on: an interrupted one for ``as_of`` or a new one"""
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT id FROM Fine_Run WHERE status = 'running' AND as_of = %s ORDER BY id DESC LIMIT 1",
+                       (as_of,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        last_as_of = None if full else _last_completed(cursor)
+        floor = _due_floor(min(last_as_of, as_of) if last_as_of else None, rates)
+        cursor.execute("INSERT INTO Fine_Run (as_of, due_floor) VALUES (%s, %s)", (as_of, floor))
+        run_id = cursor.lastrowid
+        db.commit()
+        return run_id
+    finally:
+        cursor.close()
+
+
+def _fetch_batch(cursor, run, upper, batch_size):
+    where = ["returned = FALSE", "return_date < %s"]
+    params = [upper]
+    if run['due_floor'] is not None:
+        where.append("return_date >= %s")
+        params.append(run['due_floor'])
+    if run['last_due'] is not None:
+        where.append("(return_date > %s OR (return_date = %s AND id > %s))")
+        params += [run['last_due'], run['last_due'], run['last_issue_id']]
+    cursor.execute(f"""
+        SELECT id, member_id, return_date FROM Issued_Books
+        WHERE {' AND '.join(where)}
+        ORDER BY return_date, id
+        LIMIT %s
+    """, tuple(params) + (batch_size,))
+    return cursor.fetchall()
+
+
+def _assess_batch(cursor, loans, as_of, rates):
+    """Upserts fines for one batch of loans; returns (created, updated)"""
+    ids = [loan[0] for loan in loans]
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"SELECT issue_id, amount FROM Fine WHERE issue_id IN ({placeholders})", tuple(ids))
+    existing = {issue_id: decimal.Decimal(str(amount)) for issue_id, amount in cursor.fetchall()}
+    cursor.execute(f"SELECT issue_id FROM Fine_Waiver WHERE issue_id IN ({placeholders})", tuple(ids))
+    waived = {row[0] for row in cursor.fetchall()}
+
+    rows, deltas, new_by_member = [], [], {}
+    for issue_id, member_id, due_date in loans:
+        amount, days = rates.amount(due_date, as_of)
+        if amount is None or issue_id in waived or existing.get(issue_id) == amount:
+            continue
+        rows.append((member_id, issue_id, amount, f"Overdue loan #{issue_id}: {days} day(s)", as_of))
+        deltas.append((member_id, issue_id, amount - existing.get(issue_id, 0)))
+        if issue_id not in existing:
+            new_by_member[member_id] = new_by_member.get(member_id, 0) + 1
+    if not rows:
+        return 0, 0
+
+    cursor.executemany("""
+        INSERT INTO Fine (member_id, issue_id, amount, reason, date_assessed)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE amount = VALUES(amount), reason = VALUES(reason),
+                                date_assessed = VALUES(date_assessed)
+    """, rows)
+    changed = [issue_id for _, issue_id, _ in deltas]
+    cursor.execute(f"SELECT issue_id, id FROM Fine WHERE issue_id IN ({', '.join(['%s'] * len(changed))})",
+                   tuple(changed))
+    fine_ids = dict(cursor.fetchall())
+    fines_ledger.post(cursor, [(member_id, fines_ledger.CHARGE, delta, fine_ids.get(issue_id),
+                                f"Overdue loan #{issue_id}") for member_id, issue_id, delta in deltas])
+    created = sum(new_by_member.values())
+    if created:
+        counters.bump(cursor, counters.FINES, created)
+        for member_id, count in sorted(new_by_member.items()):
+            counters.bump_member(cursor, member_id, fines=count)
+    table_versions.bump(cursor, 'Fine', 'Fine_Ledger')
+    return created, len(rows) - created
+
+
+def run(db, rates, as_of=None, batch_size=DEFAULT_BATCH_SIZE, full=False, progress=None):
+    """
+    Assesses overdue fines as of ``as_of`` (default today) and returns the
+    finished ``Fine_Run`` row. ``progress(run_dict)`` is called per batch.
+
+    ``full`` ignores the high-water mark and revisits every open overdue
+    loan; use it after changing the rate or cap.
+    """
+    as_of = as_of or datetime.date.today()
+    run_id = _start_run(db, as_of, rates, full)
+    current = _get_run(db, run_id)
+    upper = as_of - datetime.timedelta(days=rates.grace_days)
+    started = time.perf_counter()
+    scanned_before = current['loans_scanned']
+
+    while True:
+        cursor = db.cursor()
+        try:
+            loans = _fetch_batch(cursor, current, upper, batch_size)
+            if not loans:
+                cursor.execute("UPDATE Fine_Run SET status = 'completed', finished_at = CURRENT_TIMESTAMP "
+                               "WHERE id = %s", (run_id,))
+                db.commit()
+                break
+            created, updated = _assess_batch(cursor, loans, as_of, rates)
+            last_id, _, last_due = loans[-1]
+            cursor.execute("""
+                UPDATE Fine_Run
+                SET last_due = %s, last_issue_id = %s, loans_scanned = loans_scanned + %s,
+                    fines_created = fines_created + %s, fines_updated = fines_updated + %s
+                WHERE id = %s
+            """, (last_due, last_id, len(loans), created, updated, run_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Fine run %s failed", run_id)
+            raise
+        finally:
+            cursor.close()
+
+        current['last_due'], current['last_issue_id'] = last_due, last_id
+        current['loans_scanned'] += len(loans)
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress({'run_id': run_id, 'loans_scanned': current['loans_scanned'],
+                      'rate': round((current['loans_scanned'] - scanned_before) / elapsed, 1) if elapsed else None})
+
+    return _get_run(db, run_id)
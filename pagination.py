@@ -0,0 +1,261 @@
+# pagination.py
+"""
+Keyset (cursor) pagination for the listing routes.
+
+Pages are addressed by an opaque cursor holding the sort value and id of
+the last (or first) row shown, so every page is a single index range scan
+of ``LIMIT per_page + 1`` rows no matter how deep the user has paged.
+"""
+import base64
+import datetime
+import decimal
+import json
+from urllib.parse import urlencode
+
+
+class KeysetSort:
+    """A whitelisted sort: SQL column, row key, and the id tie-breaker"""
+
+    def __init__(self, column, key, id_column, id_key='id', descending=False):
+        self.column = column
+        self.key = key
+        self.id_column = id_column
+        self.id_key = id_key
+        self.descending = descending
+
+
+class Page:
+    """One page of rows plus links to its neighbours"""
+
+    def __init__(self, rows, next_url=None, prev_url=None, per_page=None):
+        self.rows = rows
+        self.next_url = next_url
+        self.prev_url = prev_url
+        self.per_page = per_page
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([_jsonable(sort_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns (sort_value, id) or None for a missing or malformed cursor"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_per_page(args, default, maximum):
+    try:
+        per_page = int(args.get('per_page', default))
+    except (TypeError, ValueError):
+        per_page = default
+    return max(1, min(per_page, maximum))
+
+
+def _page_url(path, args, **overrides):
+    query = {k: v for k, v in args.items() if k not in ('after', 'before')}
+    query.update({k: v for k, v in overrides.items() if v is not None})
+    return f"{path}?{urlencode(query)}" if query else path
+
+
+def _page_query(base_sql, sort, args, where, params, per_page):
+    """Returns (sql, values, after, backwards) for one keyset page of ``base_sql``"""
+    conditions = list(where or [])
+    values = list(params or [])
+
+    after = decode_cursor(args.get('after'))
+    before = None if after else decode_cursor(args.get('before'))
+    boundary = after or before
+
+    # Walking backwards flips both the comparison and the ORDER BY; rows
+    # are reversed again afterwards so the page always displays in sort order.
+    backwards = before is not None
+    descending = sort.descending != backwards
+    if boundary is not None:
+        op = '<' if descending else '>'
+        conditions.append(
+            f"({sort.column} {op} %s OR ({sort.column} = %s AND {sort.id_column} {op} %s))"
+        )
+        values.extend([boundary[0], boundary[0], boundary[1]])
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = base_sql
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {sort.column} {direction}, {sort.id_column} {direction} LIMIT %s"
+    values.append(per_page + 1)
+    return sql, tuple(values), after, backwards
+
+
+def _links(first, last, has_next, has_prev, sort, args, path):
+    next_url = prev_url = None
+    if first is not None:
+        if has_next:
+            next_url = _page_url(path, args, after=encode_cursor(last[sort.key], last[sort.id_key]))
+        if has_prev:
+            prev_url = _page_url(path, args, before=encode_cursor(first[sort.key], first[sort.id_key]))
+    return next_url, prev_url
+
+
+def _finish_page(rows, after, backwards, sort, args, path, per_page):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    # Coming from a ``before`` link there is always a next page; coming
+    # from an ``after`` link there is always a previous one.
+    has_next = has_more or backwards
+    has_prev = has_more if backwards else after is not None
+    next_url, prev_url = _links(rows[0] if rows else None, rows[-1] if rows else None,
+                                has_next, has_prev, sort, args, path)
+    return Page(rows, next_url=next_url, prev_url=prev_url, per_page=per_page)
+
+
+def fetch_page(cursor, base_sql, sort, args, path, where=None, params=None, per_page=20):
+    """
+    Runs ``base_sql`` (a SELECT without WHERE/ORDER BY) for one keyset page.
+
+    ``args`` are the request query args; ``after``/``before`` cursors are
+    read from them and all other args are carried over into the page links.
+    """
+    sql, values, after, backwards = _page_query(base_sql, sort, args, where, params, per_page)
+    cursor.execute(sql, values)
+    return _finish_page(cursor.fetchall(), after, backwards, sort, args, path, per_page)
+
+
+async def fetch_page_async(cursor, base_sql, sort, args, path, where=None, params=None, per_page=20):
+    """``fetch_page`` on an async_db cursor"""
+    sql, values, after, backwards = _page_query(base_sql, sort, args, where, params, per_page)
+    await cursor.execute(sql, values)
+    return _finish_page(await cursor.fetchall(), after, backwards, sort, args, path, per_page)
+
+
+class LazyPage:
+    """
+    A page whose rows are read from an open (unbuffered) cursor while they
+    are iterated, e.g. by a streamed template. The links depend on the last
+    row, so reading ``next_url``/``prev_url`` first consumes the rest of
+    the page; templates render the pager after the rows. The cursor is
+    closed once the rows have been read.
+    """
+
+    FETCH_SIZE = 50
+
+    def __init__(self, cursor, sort, args, path, per_page, after, on_complete=None):
+        self.per_page = per_page
+        self._cursor = cursor
+        self._sort = sort
+        self._args = args
+        self._path = path
+        self._after = after
+        self._on_complete = on_complete
+        self._rows = None
+        self._links = None
+        self._started = False
+
+    def __iter__(self):
+        if self._started:
+            return iter(self._rows or ())  # only a page being cached keeps its rows
+        self._started = True
+        return self._stream()
+
+    def __bool__(self):
+        return True
+
+    def _stream(self):
+        kept = [] if self._on_complete else None
+        first = last = None
+        count = 0
+        has_more = complete = False
+        try:
+            while not has_more:
+                batch = self._cursor.fetchmany(self.FETCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    if count == self.per_page:
+                        has_more = True
+                        break
+                    count += 1
+                    first = row if first is None else first
+                    last = row
+                    if kept is not None:
+                        kept.append(row)
+                    yield row
+            complete = True
+        finally:
+            self._close()
+        if complete:
+            self._rows = kept
+            self._links = _links(first, last, has_more, self._after is not None, self._sort, self._args, self._path)
+            if self._on_complete:
+                self._on_complete(Page(kept, *self._links, per_page=self.per_page))
+
+    def _close(self):
+        # Drain the extra (per_page + 1) row or anything left by a client
+        # that went away, so the connection can be reused.
+        try:
+            self._cursor.fetchall()
+        except Exception:
+            pass
+        self._cursor.close()
+
+    def _resolve(self):
+        if not self._started:
+            for _ in self:
+                pass
+        return self._links or (None, None)
+
+    @property
+    def next_url(self):
+        return self._resolve()[0]
+
+    @property
+    def prev_url(self):
+        return self._resolve()[1]
+
+
+def stream_page(cursor, base_sql, sort, args, path, where=None, params=None, per_page=20, on_complete=None):
+    """
+    Like ``fetch_page`` but returns a ``LazyPage`` reading from ``cursor``
+    (unbuffered; the page closes it). The query runs here, so SQL errors
+    surface before a response starts. Pages reached through a ``before``
+    link are shown reversed and so are read in full.
+    ``on_complete(page)`` receives a plain ``Page`` once every row was read.
+    """
+    sql, values, after, backwards = _page_query(base_sql, sort, args, where, params, per_page)
+    try:
+        cursor.execute(sql, values)
+        if backwards:
+            page = _finish_page(cursor.fetchall(), after, backwards, sort, args, path, per_page)
+    except Exception:
+        cursor.close()
+        raise
+    if backwards:
+        cursor.close()
+        if on_complete:
+            on_complete(page)
+        return page
+    return LazyPage(cursor, sort, args, path, per_page, after, on_complete)
@@ -0,0 +1,139 @@
+# passwords.py
+"""
+Password hashing and verification on a bounded worker pool.
+
+scrypt/pbkdf2 are deliberately CPU-heavy. Running them on a small
+dedicated executor caps how many verifications a process runs at once, and
+a bounded queue sheds load (``PasswordQueueFull``) instead of letting a
+login burst pile up behind the workers. Hash parameters come from
+``Config.PASSWORD_HASH_METHOD``; ``verify()`` also reports when a stored
+value is plaintext or uses older parameters so the caller can rehash it.
+"""
+import asyncio
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+_HASH_PREFIXES = ('pbkdf2:', 'scrypt:', 'argon2:')
+
+
+class PasswordQueueFull(RuntimeError):
+    """Raised when too many hash operations are already queued"""
+
+
+class PasswordHasher:
+    def __init__(self, method, salt_length=16, workers=2, max_pending=32, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        # Werkzeug stores the expanded method ("scrypt" -> "scrypt:32768:8:1"); compare
+        # against that. The hash doubles as the dummy for unknown usernames.
+        self._dummy_hash = self._hash('dummy-password')
+        self._stored_method = self._dummy_hash.split('$', 1)[0]
+
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait = 0.0
+        self._run_time = 0.0
+
+    # -------------------------
+    # Executor plumbing
+    # -------------------------
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordQueueFull("Too many password operations in progress; try again shortly.")
+        submitted = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self._pending -= 1
+                self._running += 1
+                self._queue_wait += started - submitted
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._run_time += time.perf_counter() - started
+                self._slots.release()
+
+        return self._executor.submit(task)
+
+    def _run(self, fn, *args):
+        return self._submit(fn, *args).result(timeout=self.timeout)
+
+    async def _run_async(self, fn, *args):
+        """``_run`` for coroutines: the event loop keeps serving while the hash runs"""
+        return await asyncio.wait_for(asyncio.wrap_future(self._submit(fn, *args)), self.timeout)
+
+    # -------------------------
+    # Hash operations
+    # -------------------------
+    def needs_rehash(self, stored):
+        """True for plaintext values and hashes made with other parameters"""
+        if not stored.startswith(_HASH_PREFIXES):
+            return True
+        return stored.split('$', 1)[0] != self._stored_method
+
+    def _verify(self, stored, password):
+        if stored.startswith(_HASH_PREFIXES):
+            return check_password_hash(stored, password)
+        # Plaintext seed accounts (see mysql.sql); compare in constant time.
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    def _hash(self, password):
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def verify(self, stored, password):
+        """Returns (matches, needs_rehash); ``stored`` None verifies against a dummy hash"""
+        if stored is None:
+            # Unknown user: spend the same effort so response time does not
+            # reveal which usernames exist.
+            self._run(self._verify, self._dummy_hash, password)
+            return False, False
+        matches = self._run(self._verify, stored, password)
+        return matches, matches and self.needs_rehash(stored)
+
+    async def hash_async(self, password):
+        return await self._run_async(self._hash, password)
+
+    async def verify_async(self, stored, password):
+        """``verify`` for the ASGI entry point"""
+        if stored is None:
+            await self._run_async(self._verify, self._dummy_hash, password)
+            return False, False
+        matches = await self._run_async(self._verify, stored, password)
+        return matches, matches and self.needs_rehash(stored)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self._workers,
+                'max_pending': self._max_pending,
+                'pending': self._pending,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_queue_wait': round(self._queue_wait / self._completed, 6) if self._completed else None,
+                'avg_run_time': round(self._run_time / self._completed, 6) if self._completed else None,
+            }
@@ -0,0 +1,122 @@
+# query_cache.py
+"""
+Read-through cache for hot reference queries.
+
+Every cached entry declares the tables it was read from. Keys embed the
+current version of each of those tables, and write routes bump a table's
+version after committing, so an entry read before the write can never be
+served again; it simply ages out of the LRU.
+
+Versions live in process memory, so a write in one gunicorn worker only
+invalidates that worker's cache. ``ttl`` bounds how long the other workers
+may keep serving their copy.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU + TTL cache keyed by (key, versions of the tables it depends on)"""
+
+    def __init__(self, max_entries=512, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _versioned_key(self, key, tables):
+        return key, tuple((table, self._versions.get(table, 0)) for table in sorted(tables))
+
+    def get_or_load(self, key, tables, loader):
+        """Returns the cached value for ``key`` or calls ``loader()`` and caches its result"""
+        hit, value = self.lookup(key, tables)
+        if hit:
+            return value
+        # Load outside the lock; two threads missing at once both query,
+        # which is cheaper than serializing every miss.
+        token = value
+        value = loader()
+        self.store(token, value)
+        return value
+
+    def lookup(self, key, tables):
+        """
+        Returns (True, value) on a hit, else (False, token); pass the token
+        to ``store`` with the loaded value. The token pins the table versions
+        seen now, so a value loaded across a write is never served.
+        """
+        now = time.monotonic()
+        with self._lock:
+            full_key = self._versioned_key(key, tables)
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(full_key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[full_key]
+                self.expirations += 1
+            self.misses += 1
+        return False, (full_key, now)
+
+    def store(self, token, value):
+        full_key, loaded_at = token
+        with self._lock:
+            self._entries[full_key] = (loaded_at + self.ttl, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *tables):
+        """Bumps the version of each table; call after the write has committed"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self.invalidations += len(tables)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'table_versions': dict(self._versions),
+            }
+
+
+def cached_query(cache, get_db, sql, params=(), tables=(), dictionary=True):
+    """
+    Runs a SELECT through ``cache``; ``tables`` are the tables the query reads.
+
+    ``get_db`` is only called on a miss, so a hit never checks out a connection.
+    """
+
+    def load():
+        cursor = get_db().cursor(dictionary=dictionary)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    return cache.get_or_load(('sql', sql, tuple(params)), tables, load)
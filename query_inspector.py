@@ -0,0 +1,130 @@
+# query_inspector.py
+"""
+Development/staging query inspector: slow queries, duplicates and N+1 patterns.
+
+With ``QUERY_INSPECTOR`` on, every query a request runs is recorded. At
+the end of the request the log is checked for
+
+* duplicates: the same SQL with the same parameters run more than once,
+* N+1 patterns: one statement shape (see ``metrics.normalize_sql``) run
+  ``n_plus_one`` or more times with different parameters,
+* slow queries: anything over ``slow_ms``, with its ``EXPLAIN`` attached.
+
+Each request with findings is logged as a report. ``summary()`` aggregates
+per endpoint over the life of the process (e.g. a test run) and can be
+written to ``QUERY_REPORT_PATH`` at exit.
+"""
+import json
+import logging
+import threading
+from collections import Counter
+
+from metrics import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLog:
+    """The queries of one request, in order"""
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, sql, params, elapsed, failed=False):
+        self.queries.append((sql, _freeze(params), elapsed, failed))
+
+
+def _freeze(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    try:
+        return tuple(params)
+    except TypeError:
+        return (params,)
+
+
+def _jsonable(value):
+    return value if isinstance(value, (int, float, str, bool, type(None))) else str(value)
+
+
+class QueryInspector:
+    def __init__(self, slow_ms=100, n_plus_one=3):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def analyze(self, log):
+        """Returns the findings for one request's log (without EXPLAIN output)"""
+        exact = Counter((sql, params) for sql, params, _, _ in log.queries)
+        shapes = {}
+        for sql, params, _, _ in log.queries:
+            shapes.setdefault(normalize_sql(sql), set()).add(params)
+
+        duplicates = [{'sql': ' '.join(sql.split()), 'params': [_jsonable(p) for p in params], 'count': count}
+                      for (sql, params), count in exact.items() if count > 1]
+        n_plus_one = [{'statement': shape, 'count': len(variants)}
+                      for shape, variants in shapes.items() if len(variants) >= self.n_plus_one]
+        slow = [{'sql': sql, 'params': params, 'ms': round(elapsed * 1000, 2)}
+                for sql, params, elapsed, failed in log.queries
+                if not failed and elapsed * 1000 >= self.slow_ms]
+        return {
+            'queries': len(log.queries),
+            'time_ms': round(sum(q[2] for q in log.queries) * 1000, 2),
+            'duplicates': duplicates,
+            'n_plus_one': n_plus_one,
+            'slow': slow,
+        }
+
+    def explain(self, db, slow):
+        """Attaches EXPLAIN rows to each slow SELECT (``db`` must be a connection that is not mid-result)"""
+        cursor = db.cursor(dictionary=True)
+        try:
+            for item in slow:
+                if item['sql'].lstrip().upper().startswith('SELECT'):
+                    try:
+                        cursor.execute("EXPLAIN " + item['sql'], item['params'])
+                        item['explain'] = [{k: _jsonable(v) for k, v in row.items()} for row in cursor.fetchall()]
+                    except Exception as e:
+                        item['explain'] = f"EXPLAIN failed: {e}"
+                item['sql'] = ' '.join(item['sql'].split())
+                item['params'] = [_jsonable(p) for p in item['params']]
+        finally:
+            cursor.close()
+
+    def report(self, endpoint, method, path, findings):
+        """Logs one request's findings and folds them into the summary"""
+        flagged = findings['duplicates'] or findings['n_plus_one'] or findings['slow']
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'time_ms': 0.0,
+                'duplicate_requests': 0, 'slow_queries': 0, 'n_plus_one': set(),
+            })
+            stats['requests'] += 1
+            stats['queries'] += findings['queries']
+            stats['max_queries'] = max(stats['max_queries'], findings['queries'])
+            stats['time_ms'] += findings['time_ms']
+            stats['duplicate_requests'] += bool(findings['duplicates'])
+            stats['slow_queries'] += len(findings['slow'])
+            stats['n_plus_one'].update(item['statement'] for item in findings['n_plus_one'])
+        if flagged:
+            logger.warning("Query report for %s %s (%s): %s", method, path, endpoint,
+                           json.dumps(findings, default=str, indent=2))
+        else:
+            logger.debug("%s %s: %d queries in %.2f ms", method, path, findings['queries'], findings['time_ms'])
+
+    def summary(self):
+        with self._lock:
+            return {
+                endpoint: dict(stats,
+                               avg_queries=round(stats['queries'] / stats['requests'], 2),
+                               time_ms=round(stats['time_ms'], 2),
+                               n_plus_one=sorted(stats['n_plus_one']))
+                for endpoint, stats in sorted(self._endpoints.items())
+            }
+
+    def write_summary(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.summary(), fh, indent=2)
@@ -0,0 +1,180 @@
+# query_plans.py
+"""
+EXPLAIN-based regression check for the queries app.py issues.
+
+Each check runs ``EXPLAIN`` against a real MySQL database (the one in
+Config, e.g. a local instance loaded from mysql.sql + migrations) and fails
+when a table is read with a full scan and no usable index at all. That
+holds regardless of how much data the database has: on a tiny seed the
+optimizer may still choose a scan, but ``possible_keys`` shows whether an
+index exists for it to pick once the table grows.
+
+Queries that only ORDER BY (first page of a keyset listing) have no
+predicate for ``possible_keys`` to report, so those checks also assert that
+an index leads with the sort column.
+
+    flask --app app check-query-plans
+"""
+import re
+
+import fines_ledger
+import loan_archive
+import reminders
+import waitlist
+from pagination import encode_cursor, fetch_page
+
+_TABLE_REF_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIASES = {'on', 'where', 'left', 'right', 'inner', 'join', 'order', 'group', 'limit'}
+
+
+class PlanCheck:
+    def __init__(self, name, sql, params=(), allow_scan=(), order_index=None):
+        self.name = name
+        self.sql = sql
+        self.params = tuple(params)
+        self.allow_scan = set(allow_scan)      # tables a full scan is expected on
+        self.order_index = order_index         # (table, column) that must lead an index
+
+
+class _RecordingCursor:
+    """Captures the SQL fetch_page would run without touching the database"""
+
+    def execute(self, sql, params=()):
+        self.sql, self.params = sql, params
+
+    def fetchall(self):
+        return []
+
+
+def _unlocked(sql, params):
+    return sql.replace(" FOR UPDATE", ""), params
+
+
+def _keyset_sql(base_sql, sort, where=(), params=(), after=None):
+    cursor = _RecordingCursor()
+    args = {'after': encode_cursor(*after)} if after else {}
+    fetch_page(cursor, base_sql, sort, args, '/', where=list(where), params=list(params), per_page=25)
+    return cursor.sql, cursor.params
+
+
+def _keyset_checks(label, base_sql, sort, sample_value, where=(), params=()):
+    first_sql, first_params = _keyset_sql(base_sql, sort, where, params)
+    next_sql, next_params = _keyset_sql(base_sql, sort, where, params, after=(sample_value, 1))
+    alias, column = sort.column.split('.') if '.' in sort.column else (None, sort.column)
+    table = _table_for(base_sql, alias)
+    return [
+        # An unfiltered first page is a scan in index order; what matters is
+        # that the sort column has an index to walk.
+        PlanCheck(f"{label} (first page)", first_sql, first_params,
+                  allow_scan=() if where else {table},
+                  order_index=(table, column)),
+        PlanCheck(f"{label} (next page)", next_sql, next_params),
+    ]
+
+
+def default_checks():
+    """Checks covering the reads in app.py and its maintenance jobs; app is imported lazily to avoid a cycle"""
+    import app as app_module
+
+    a = app_module
+    checks = [
+        PlanCheck("login lookup", "SELECT id, username, password FROM Member WHERE username=%s", ('user1',)),
+        PlanCheck("dashboard totals", "SELECT name, value FROM Stat_Counter", allow_scan={'Stat_Counter'}),
+        PlanCheck("member dashboard", """
+            SELECT (SELECT value FROM Stat_Counter WHERE name=%s),
+                   COALESCE(mc.reservations, 0), COALESCE(mc.fines, 0)
+            FROM Member m
+            LEFT JOIN Member_Counter mc ON mc.member_id = m.id
+            WHERE m.id=%s""", ('books', 1)),
+        PlanCheck("return_book probe", "SELECT book_id FROM Issued_Books WHERE id=%s AND returned=FALSE", (1,)),
+        PlanCheck("member balance", fines_ledger._READ_SQL, (1,)),
+        PlanCheck("in-stock books", "SELECT id, title FROM Book WHERE quantity > 0"),
+        PlanCheck("search stock lookup", "SELECT id, quantity FROM Book WHERE id IN (%s, %s, %s)", (1, 2, 3)),
+        PlanCheck("book reservations (delete_book)",
+                  "SELECT member_id, COUNT(*) FROM Reservation WHERE book_id=%s GROUP BY member_id", (1,)),
+        PlanCheck("overdue fine scan", """
+            SELECT id, member_id, return_date FROM Issued_Books
+            WHERE returned = FALSE AND return_date < %s AND return_date >= %s
+              AND (return_date > %s OR (return_date = %s AND id > %s))
+            ORDER BY return_date, id LIMIT 5000""", ('2024-06-01', '2024-01-01', '2024-02-01', '2024-02-01', 1)),
+        PlanCheck("overdue fine lookup", "SELECT issue_id, amount FROM Fine WHERE issue_id IN (%s, %s)", (1, 2)),
+        PlanCheck("loan archive batch", *_unlocked(loan_archive._OLDEST_SQL, ('2024-01-01', 1000))),
+        PlanCheck("reminder page scan", reminders._PAGE_SQL,
+                  (reminders.OVERDUE, '2024-01-01', '2024-01-31', '2024-01-10', '2024-01-10', 1, 500)),
+        PlanCheck("waived loan lookup", "SELECT issue_id FROM Fine_Waiver WHERE issue_id IN (%s, %s)", (1, 2)),
+        PlanCheck("waitlist head (return_book)", *_unlocked(*waitlist._heads(1, 1, '10.00'))),
+        PlanCheck("waitlist position",
+                  "SELECT COUNT(*) FROM Waitlist WHERE book_id = %s AND id <= %s", (1, 100)),
+        PlanCheck("author list", "SELECT id, name FROM Author", allow_scan={'Author'}),
+        PlanCheck("publisher list", "SELECT id, name FROM Publisher", allow_scan={'Publisher'}),
+        PlanCheck("member pick list", "SELECT id, username FROM Member", allow_scan={'Member'}),
+    ]
+    checks += _keyset_checks("catalog by title", a.BOOK_LIST_SQL, a.BOOK_SORTS['title'], 'M')
+    checks += _keyset_checks("catalog title prefix", a.BOOK_LIST_SQL, a.BOOK_SORTS['title'], 'M',
+                             where=["Book.title LIKE %s"], params=['The%'])
+    checks += _keyset_checks("members by username", a.MEMBER_LIST_SQL, a.MEMBER_SORTS['username'], 'm')
+    checks += _keyset_checks("issued by date", a.ISSUED_LIST_SQL, a.ISSUED_SORTS['issue_date'], '2024-01-01')
+    checks += _keyset_checks("issued outstanding", a.ISSUED_LIST_SQL, a.ISSUED_SORTS['issue_date'],
+                             '2024-01-01', where=["ib.returned = FALSE"])
+    checks += _keyset_checks("issued by member", a.ISSUED_LIST_SQL, a.ISSUED_SORTS['issue_date'],
+                             '2024-01-01', where=["ib.member_id = %s"], params=[1])
+    checks += _keyset_checks("reservations by date", a.RESERVATION_LIST_SQL,
+                             a.RESERVATION_SORTS['reservation_date'], '2024-01-01')
+    checks += _keyset_checks("fines by date", a.FINE_LIST_SQL, a.FINE_SORTS['date_assessed'], '2024-01-01')
+    checks += _keyset_checks("fines by amount", a.FINE_LIST_SQL, a.FINE_SORTS['amount'], '5.00')
+    checks += _keyset_checks("fines by member", a.FINE_LIST_SQL, a.FINE_SORTS['date_assessed'],
+                             '2024-01-01', where=["Fine.member_id = %s"], params=[1])
+    checks += _keyset_checks("fine ledger", a.LEDGER_LIST_SQL, a.LEDGER_SORTS['newest'], 1000)
+    checks += _keyset_checks("my_fines ledger", a.LEDGER_LIST_SQL, a.LEDGER_SORTS['newest'], 1000,
+                             where=["l.member_id = %s"], params=[1])
+    checks += _keyset_checks("loan history by date", a.HISTORY_LIST_SQL, a.ISSUED_SORTS['issue_date'], '2024-01-01')
+    checks += _keyset_checks("loan history by member", a.HISTORY_LIST_SQL, a.ISSUED_SORTS['issue_date'],
+                             '2024-01-01', where=["ib.member_id = %s"], params=[1])
+    return checks
+
+
+def _leading_index_columns(cursor, table):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND SEQ_IN_INDEX = 1
+    """, (table,))
+    return {row[0].lower() for row in cursor.fetchall()}
+
+
+def run_checks(db, checks=None):
+    """Returns a list of (check name, problem) tuples; empty means every plan is acceptable"""
+    checks = default_checks() if checks is None else checks
+    problems = []
+    cursor = db.cursor(dictionary=True)
+    plain = db.cursor()
+    try:
+        for check in checks:
+            cursor.execute("EXPLAIN " + check.sql, check.params)
+            for row in cursor.fetchall():
+                table = row.get('table')
+                if row.get('type') == 'ALL' and not row.get('possible_keys'):
+                    real = _table_for(check.sql, table)
+                    if real not in check.allow_scan:
+                        problems.append((check.name, f"full scan of {real} with no usable index"))
+            if check.order_index:
+                real, column = check.order_index
+                if column.lower() not in _leading_index_columns(plain, real):
+                    problems.append((check.name, f"no index on {real} leads with {column}"))
+    finally:
+        cursor.close()
+        plain.close()
+    return problems
+
+
+def _table_for(sql, alias):
+    """Resolves an alias used in ``sql`` (``ib`` -> ``Issued_Books``); None means the first FROM table"""
+    tables = {}
+    first = None
+    for table, table_alias in _TABLE_REF_RE.findall(sql):
+        first = first or table
+        tables[table] = table
+        if table_alias and table_alias.lower() not in _NOT_ALIASES:
+            tables[table_alias] = table
+    if alias is None:
+        return first
+    return tables.get(alias, alias)
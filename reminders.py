@@ -0,0 +1,359 @@
+# reminders.py
+"""
+Due-date reminders and overdue notices by email.
+
+A run walks open loans in ``(return_date, id)`` order on
+``idx_issued_returned_due`` in keyset pages, joined to the member's email
+address and the book title, and skips loans that already have the notice
+for their current due date in ``Loan_Notice``. Each page is handled in four
+steps:
+
+1. The page's loans are claimed in ``Loan_Notice`` under a page token
+   (``INSERT IGNORE``) and committed. An overlapping run or a re-run then
+   skips them.
+2. One message per member is rendered from ``email/<kind>.txt``.
+3. The messages are sent from ``concurrency`` threads. Each thread keeps
+   one SMTP session open for many messages and pipelines MAIL/RCPT/DATA
+   when the server offers PIPELINING. Transient failures are retried with
+   backoff on a fresh connection.
+4. Claims are marked ``sent``, or ``failed`` for permanent rejections.
+   Claims whose messages ran out of retries are released, so the next run
+   tries them again.
+
+A crash between steps 1 and 4 leaves claims in ``sending``. Those loans are
+not mailed again: a missed reminder is better than a duplicate.
+
+    flask --app app send-reminders [--as-of YYYY-MM-DD] [--dry-run]
+
+For development, point ``MAIL_SERVER``/``MAIL_PORT`` at a local stand-in such
+as ``python -m aiosmtpd -n -l localhost:1025`` with ``MAIL_USE_TLS=false``.
+"""
+import concurrent.futures
+import datetime
+import email.message
+import email.policy
+import logging
+import re
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DUE_SOON = 'due_soon'
+OVERDUE = 'overdue'
+KINDS = (DUE_SOON, OVERDUE)
+
+SUBJECTS = {
+    DUE_SOON: "Library reminder: {count} book(s) due soon",
+    OVERDUE: "Library notice: {count} overdue book(s)",
+}
+
+ERROR_MAX_LENGTH = 255
+
+_PAGE_SQL = """
+    SELECT ib.id, ib.member_id, ib.issue_date, ib.return_date,
+           b.title AS book_title, m.username, m.email
+    FROM Issued_Books ib
+    JOIN Member m ON ib.member_id = m.id
+    JOIN Book b ON ib.book_id = b.id
+    LEFT JOIN Loan_Notice n ON n.issue_id = ib.id AND n.kind = %s AND n.due_date = ib.return_date
+    WHERE ib.returned = FALSE AND ib.return_date BETWEEN %s AND %s
+      AND (ib.return_date > %s OR (ib.return_date = %s AND ib.id > %s))
+      AND n.issue_id IS NULL AND m.email <> ''
+    ORDER BY ib.return_date, ib.id
+    LIMIT %s"""
+
+_CLAIM_SQL = "INSERT IGNORE INTO Loan_Notice (issue_id, kind, due_date, claim) VALUES (%s, %s, %s, %s)"
+_SENT_SQL = ("UPDATE Loan_Notice SET status = 'sent', sent_at = CURRENT_TIMESTAMP "
+             "WHERE issue_id = %s AND kind = %s AND claim = %s")
+_FAILED_SQL = "UPDATE Loan_Notice SET status = 'failed', error = %s WHERE issue_id = %s AND kind = %s AND claim = %s"
+_RELEASE_SQL = "DELETE FROM Loan_Notice WHERE issue_id = %s AND kind = %s AND claim = %s AND status = 'sending'"
+
+_LEADING_DOT = re.compile(br'(?m)^\.')
+
+
+class MailSettings:
+    """SMTP server, credentials and sender address (see ``Config.MAIL_*``)"""
+
+    def __init__(self, server, port, use_tls=True, username=None, password=None, sender=None, timeout=30):
+        self.server = server
+        self.port = int(port)
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.MAIL_SERVER, config.MAIL_PORT, config.MAIL_USE_TLS, config.MAIL_USERNAME,
+                   config.MAIL_PASSWORD, config.MAIL_DEFAULT_SENDER, config.MAIL_TIMEOUT)
+
+
+class TransientMailError(Exception):
+    """A send that may succeed later (disconnects, timeouts, 4xx replies)"""
+
+
+class PermanentMailError(Exception):
+    """A message the server rejected outright (5xx replies); retrying will not help"""
+
+
+def _reply_error(code, reply, what):
+    error = f"{what}: {code} {reply.decode(errors='replace') if isinstance(reply, bytes) else reply}"
+    return (PermanentMailError if code >= 500 else TransientMailError)(error)
+
+
+class Mailer:
+    """
+    Sends messages over one reused SMTP session per calling thread.
+
+    A session is reopened after ``per_connection`` messages (servers cap
+    messages per session) and after any transient failure.
+    """
+
+    def __init__(self, settings, retries=3, backoff=1.0, per_connection=100, connect=smtplib.SMTP):
+        self.settings = settings
+        self.retries = retries
+        self.backoff = backoff
+        self.per_connection = per_connection
+        self._connect = connect
+        self._local = threading.local()
+        self._open = set()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        smtp = getattr(self._local, 'smtp', None)
+        if smtp is not None and self._local.sent < self.per_connection:
+            return smtp
+        self._drop()
+        s = self.settings
+        smtp = self._connect(s.server, s.port, timeout=s.timeout)
+        try:
+            smtp.ehlo()
+            if s.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+            if s.username:
+                smtp.login(s.username, s.password or '')
+        except Exception:
+            smtp.close()
+            raise
+        self._local.smtp, self._local.sent = smtp, 0
+        with self._lock:
+            self._open.add(smtp)
+        return smtp
+
+    def _drop(self):
+        smtp = getattr(self._local, 'smtp', None)
+        if smtp is None:
+            return
+        self._local.smtp = None
+        with self._lock:
+            self._open.discard(smtp)
+        _quit(smtp)
+
+    def _transaction(self, smtp, message):
+        recipients = [message['To']]
+        if not all(address.isascii() for address in recipients + [self.settings.sender]):
+            raise PermanentMailError(f"non-ASCII address in {recipients}")
+        if not smtp.has_extn('pipelining'):
+            try:
+                smtp.send_message(message, self.settings.sender, recipients)
+            except smtplib.SMTPRecipientsRefused as exc:
+                code, reply = next(iter(exc.recipients.values()))
+                raise _reply_error(code, reply, "recipient refused")
+            except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as exc:
+                raise _reply_error(exc.smtp_code, exc.smtp_error, "rejected")
+            return
+        # RFC 2920: one write for the envelope and DATA, then read all of their replies.
+        commands = [f"MAIL FROM:<{self.settings.sender}>"] + [f"RCPT TO:<{r}>" for r in recipients] + ["DATA"]
+        smtp.send(''.join(command + '\r\n' for command in commands))
+        replies = [smtp.getreply() for _ in commands]
+        (mail_code, mail_reply), (data_code, data_reply) = replies[0], replies[-1]
+        if data_code != 354:
+            smtp.rset()
+            if mail_code != 250:
+                raise _reply_error(mail_code, mail_reply, "sender refused")
+            code, reply = next(((c, r) for c, r in replies[1:-1] if c not in (250, 251)), (data_code, data_reply))
+            raise _reply_error(code, reply, "recipient refused")
+        body = _LEADING_DOT.sub(b'..', message.as_bytes(policy=email.policy.SMTP))
+        if not body.endswith(b'\r\n'):
+            body += b'\r\n'
+        smtp.send(body + b'.\r\n')
+        code, reply = smtp.getreply()
+        if code != 250:
+            raise _reply_error(code, reply, "message rejected")
+
+    def send(self, message):
+        """
+        Sends ``message``, retrying transient failures. Raises
+        ``TransientMailError`` when retries run out; when the server cannot
+        even be reached the connection error itself is raised, which ends
+        the run.
+        """
+        for attempt in range(self.retries + 1):
+            smtp = None
+            try:
+                smtp = self._session()
+                self._transaction(smtp, message)
+                self._local.sent += 1
+                return
+            except PermanentMailError:
+                raise
+            except (TransientMailError, smtplib.SMTPServerDisconnected, OSError) as exc:
+                self._drop()
+                if attempt == self.retries:
+                    if smtp is None:
+                        raise
+                    raise TransientMailError(str(exc)) from exc
+                logger.warning("Mail to %s failed (%s); retrying", message['To'], exc)
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self):
+        with self._lock:
+            sessions, self._open = self._open, set()
+        for smtp in sessions:
+            _quit(smtp)
+
+
+def _quit(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+def _window(kind, as_of, days_before, overdue_days):
+    if kind == DUE_SOON:
+        return as_of, as_of + datetime.timedelta(days=days_before)
+    return as_of - datetime.timedelta(days=overdue_days), as_of - datetime.timedelta(days=1)
+
+
+def _pages(db, kind, as_of, days_before, overdue_days, batch_size):
+    low, high = _window(kind, as_of, days_before, overdue_days)
+    last_due, last_id = low, 0
+    while True:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(_PAGE_SQL, (kind, low, high, last_due, last_due, last_id, batch_size))
+        rows = cursor.fetchall()
+        cursor.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_due, last_id = rows[-1]['return_date'], rows[-1]['id']
+
+
+def _claim(db, kind, rows):
+    """Claims ``rows`` for this page; returns the ones no other run had claimed"""
+    token = uuid.uuid4().hex
+    cursor = db.cursor()
+    try:
+        cursor.executemany(_CLAIM_SQL, [(row['id'], kind, row['return_date'], token) for row in rows])
+        cursor.execute("SELECT issue_id FROM Loan_Notice WHERE claim = %s", (token,))
+        claimed = {row[0] for row in cursor.fetchall()}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return token, [row for row in rows if row['id'] in claimed]
+
+
+def _messages(kind, rows, as_of, sender, render):
+    """One message per member, covering all of the member's loans on the page"""
+    by_member = {}
+    for row in rows:
+        by_member.setdefault(row['member_id'], []).append(row)
+    for loans in by_member.values():
+        for loan in loans:
+            loan['days'] = abs((loan['return_date'] - as_of).days)
+        message = email.message.EmailMessage()
+        message['From'] = sender
+        message['To'] = loans[0]['email']
+        message['Subject'] = SUBJECTS[kind].format(count=len(loans))
+        message.set_content(render(f'email/{kind}.txt', kind=kind, member=loans[0], loans=loans, as_of=as_of))
+        yield message, loans
+
+
+def _record(db, kind, token, outcomes):
+    sent, failed, released = [], [], []
+    for loans, error in outcomes:
+        for loan in loans:
+            if error is None:
+                sent.append((loan['id'], kind, token))
+            elif isinstance(error, PermanentMailError):
+                failed.append((str(error)[:ERROR_MAX_LENGTH], loan['id'], kind, token))
+            else:
+                released.append((loan['id'], kind, token))
+    cursor = db.cursor()
+    try:
+        for sql, params in ((_SENT_SQL, sent), (_FAILED_SQL, failed), (_RELEASE_SQL, released)):
+            if params:
+                cursor.executemany(sql, params)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(sent), len(failed), len(released)
+
+
+def run(db, mailer, render, as_of=None, days_before=2, overdue_days=30, batch_size=500, concurrency=4,
+        kinds=KINDS, dry_run=False, progress=None):
+    """
+    Sends due-soon reminders for loans due within ``days_before`` days of
+    ``as_of`` (default today) and overdue notices for loans up to
+    ``overdue_days`` past due. ``render(template, **context)`` returns the
+    message body. Returns counts of loans by outcome; ``dry_run`` only
+    counts what would be sent.
+    """
+    as_of = as_of or datetime.date.today()
+    totals = dict.fromkeys(('loans', 'messages', 'sent', 'failed', 'retry_later'), 0)
+    started = time.perf_counter()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='mailer')
+    try:
+        for kind in kinds:
+            for rows in _pages(db, kind, as_of, days_before, overdue_days, batch_size):
+                if dry_run:
+                    totals['loans'] += len(rows)
+                    totals['messages'] += len({row['member_id'] for row in rows})
+                    continue
+                token, rows = _claim(db, kind, rows)
+                batch = list(_messages(kind, rows, as_of, mailer.settings.sender, render))
+                futures = [(pool.submit(mailer.send, message), loans) for message, loans in batch]
+                outcomes, fatal = [], None
+                for future, loans in futures:
+                    try:
+                        future.result()
+                        outcomes.append((loans, None))
+                    except (PermanentMailError, TransientMailError) as exc:
+                        outcomes.append((loans, exc))
+                    except Exception as exc:
+                        # e.g. bad credentials or a cancelled send: release the claim for the next run
+                        outcomes.append((loans, TransientMailError(str(exc))))
+                        if fatal is None:
+                            fatal = exc
+                            for other, _ in futures:
+                                other.cancel()
+                sent, failed, released = _record(db, kind, token, outcomes)
+                if fatal is not None:
+                    raise fatal
+                totals['loans'] += len(rows)
+                totals['messages'] += len(batch)
+                totals['sent'] += sent
+                totals['failed'] += failed
+                totals['retry_later'] += released
+                if progress:
+                    progress(kind, totals)
+    finally:
+        pool.shutdown(wait=True)
+        mailer.close()
+    logger.info("Reminder run as of %s: %s in %.1fs", as_of, totals, time.perf_counter() - started)
+    return totals
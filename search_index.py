@@ -0,0 +1,421 @@
+# search_index.py
+"""
+In-process full-text index over the catalog (book titles, author and
+publisher names).
+
+Tokens map to the entities that contain them: title tokens point at book
+ids, author/publisher tokens point at author/publisher ids and are expanded
+to books at query time. Renaming or adding an author therefore touches one
+posting list instead of every book by that author. A sorted vocabulary
+serves prefix (type-ahead) matches and a trigram map serves fuzzy matches
+for misspelt terms.
+"""
+import bisect
+import heapq
+import logging
+import math
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+TITLE_WEIGHT = 3.0
+AUTHOR_WEIGHT = 2.0
+PUBLISHER_WEIGHT = 1.0
+
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.6
+FUZZY_MATCH = 0.4
+FUZZY_MIN_SIMILARITY = 0.4
+PREFIX_EXPANSION_LIMIT = 50
+
+
+def tokenize(text):
+    """Lower-cases, strips accents and splits text into alphanumeric tokens"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Postings:
+    """token -> set of entity ids for one indexed field"""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+
+    def add(self, entity_id, tokens):
+        for token in tokens:
+            self.postings[token].add(entity_id)
+
+    def remove(self, entity_id, tokens):
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(entity_id)
+            if not ids:
+                del self.postings[token]
+
+
+class CatalogIndex:
+    """Inverted index answering ranked catalog queries"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.books = {}          # book_id -> (title, author_id, publisher_id)
+        self.authors = {}        # author_id -> name
+        self.publishers = {}     # publisher_id -> name
+        self.author_books = defaultdict(set)
+        self.publisher_books = defaultdict(set)
+        self.titles = _Postings()
+        self.author_names = _Postings()
+        self.publisher_names = _Postings()
+        self.vocabulary = []     # sorted list of every indexed token
+        self._token_refs = defaultdict(int)
+        self.trigram_map = defaultdict(set)
+        self._bulk_loading = False
+        self.built_at = None
+        self.build_seconds = None
+
+    # -------------------------
+    # Vocabulary maintenance
+    # -------------------------
+    def _ref_tokens(self, tokens):
+        for token in tokens:
+            self._token_refs[token] += 1
+            if self._token_refs[token] == 1:
+                if not self._bulk_loading:
+                    bisect.insort(self.vocabulary, token)
+                for gram in trigrams(token):
+                    self.trigram_map[gram].add(token)
+
+    def _unref_tokens(self, tokens):
+        for token in tokens:
+            count = self._token_refs.get(token, 0) - 1
+            if count > 0:
+                self._token_refs[token] = count
+                continue
+            self._token_refs.pop(token, None)
+            pos = bisect.bisect_left(self.vocabulary, token)
+            if pos < len(self.vocabulary) and self.vocabulary[pos] == token:
+                del self.vocabulary[pos]
+            for gram in trigrams(token):
+                grams = self.trigram_map.get(gram)
+                if grams is not None:
+                    grams.discard(token)
+                    if not grams:
+                        del self.trigram_map[gram]
+
+    # -------------------------
+    # Build & incremental updates
+    # -------------------------
+    def build(self, db):
+        """Loads the whole catalog from the database into this (empty) index"""
+        started = time.perf_counter()
+        cursor = db.cursor()
+        cursor.execute("SELECT id, name FROM Author")
+        authors = cursor.fetchall()
+        cursor.execute("SELECT id, name FROM Publisher")
+        publishers = cursor.fetchall()
+        cursor.execute("SELECT id, title, author_id, publisher_id FROM Book")
+        books = cursor.fetchall()
+        cursor.close()
+
+        with self._lock:
+            # Sorting the vocabulary once at the end beats an insort per new token.
+            self._bulk_loading = True
+            for author_id, name in authors:
+                self._put_author(author_id, name)
+            for publisher_id, name in publishers:
+                self._put_publisher(publisher_id, name)
+            for book_id, title, author_id, publisher_id in books:
+                self._put_book(book_id, title, author_id, publisher_id)
+            self.vocabulary = sorted(self._token_refs)
+            self._bulk_loading = False
+            self.built_at = time.time()
+            self.build_seconds = time.perf_counter() - started
+        logger.info("Search index built: %d books in %.3fs", len(books), self.build_seconds)
+
+    def _put_author(self, author_id, name):
+        old = self.authors.get(author_id)
+        if old is not None:
+            old_tokens = set(tokenize(old))
+            self.author_names.remove(author_id, old_tokens)
+            self._unref_tokens(old_tokens)
+        tokens = set(tokenize(name))
+        self.authors[author_id] = name
+        self.author_names.add(author_id, tokens)
+        self._ref_tokens(tokens)
+
+    def _put_publisher(self, publisher_id, name):
+        old = self.publishers.get(publisher_id)
+        if old is not None:
+            old_tokens = set(tokenize(old))
+            self.publisher_names.remove(publisher_id, old_tokens)
+            self._unref_tokens(old_tokens)
+        tokens = set(tokenize(name))
+        self.publishers[publisher_id] = name
+        self.publisher_names.add(publisher_id, tokens)
+        self._ref_tokens(tokens)
+
+    def _put_book(self, book_id, title, author_id, publisher_id):
+        self._drop_book(book_id)
+        tokens = set(tokenize(title))
+        self.books[book_id] = (title, author_id, publisher_id)
+        self.titles.add(book_id, tokens)
+        self._ref_tokens(tokens)
+        if author_id is not None:
+            self.author_books[author_id].add(book_id)
+        if publisher_id is not None:
+            self.publisher_books[publisher_id].add(book_id)
+
+    def _drop_book(self, book_id):
+        old = self.books.pop(book_id, None)
+        if old is None:
+            return
+        title, author_id, publisher_id = old
+        tokens = set(tokenize(title))
+        self.titles.remove(book_id, tokens)
+        self._unref_tokens(tokens)
+        if author_id is not None:
+            self.author_books[author_id].discard(book_id)
+        if publisher_id is not None:
+            self.publisher_books[publisher_id].discard(book_id)
+
+    def add_author(self, author_id, name):
+        with self._lock:
+            self._put_author(author_id, name)
+
+    def add_publisher(self, publisher_id, name):
+        with self._lock:
+            self._put_publisher(publisher_id, name)
+
+    def upsert_book(self, book_id, title, author_id, publisher_id):
+        with self._lock:
+            self._put_book(book_id, title, author_id, publisher_id)
+
+    def remove_book(self, book_id):
+        with self._lock:
+            self._drop_book(book_id)
+
+    # -------------------------
+    # Querying
+    # -------------------------
+    def _expand_term(self, term, allow_prefix):
+        """Returns {indexed_token: match_weight} for one query term"""
+        matches = {}
+        if term in self._token_refs:
+            matches[term] = EXACT_MATCH
+        if allow_prefix:
+            pos = bisect.bisect_left(self.vocabulary, term)
+            for token in self.vocabulary[pos:pos + PREFIX_EXPANSION_LIMIT]:
+                if not token.startswith(term):
+                    break
+                matches.setdefault(token, PREFIX_MATCH * len(term) / len(token))
+        if not matches and len(term) >= 3:
+            grams = trigrams(term)
+            overlap = defaultdict(int)
+            for gram in grams:
+                for token in self.trigram_map.get(gram, ()):
+                    overlap[token] += 1
+            for token, shared in overlap.items():
+                similarity = shared / len(grams | trigrams(token))
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    matches[token] = FUZZY_MATCH * similarity
+        return matches
+
+    def _idf(self, matching_books):
+        return math.log(1 + len(self.books) / (1 + matching_books))
+
+    def search(self, query, limit=20):
+        """
+        Returns ``[(book_id, score), ...]`` best first.
+
+        Every query term must match the book's title, author or publisher;
+        the last term is also matched as a prefix so partial input works.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for position, term in enumerate(terms):
+                term_scores = defaultdict(float)
+                expanded = self._expand_term(term, allow_prefix=(position == len(terms) - 1))
+                for token, match_weight in expanded.items():
+                    title_books = self.titles.postings.get(token, ())
+                    if title_books:
+                        weight = TITLE_WEIGHT * match_weight * self._idf(len(title_books))
+                        for book_id in title_books:
+                            if scores is None or book_id in scores:
+                                term_scores[book_id] = max(term_scores[book_id], weight)
+                    for ids, books_by, field_weight in (
+                        (self.author_names.postings.get(token, ()), self.author_books, AUTHOR_WEIGHT),
+                        (self.publisher_names.postings.get(token, ()), self.publisher_books, PUBLISHER_WEIGHT),
+                    ):
+                        for entity_id in ids:
+                            entity_books = books_by.get(entity_id, ())
+                            if not entity_books:
+                                continue
+                            weight = field_weight * match_weight * self._idf(len(entity_books))
+                            for book_id in entity_books:
+                                if scores is None or book_id in scores:
+                                    term_scores[book_id] = max(term_scores[book_id], weight)
+                if scores is None:
+                    scores = dict(term_scores)
+                else:
+                    scores = {book_id: score + term_scores[book_id]
+                              for book_id, score in scores.items() if book_id in term_scores}
+                if not scores:
+                    return []
+            return heapq.nsmallest(limit, scores.items(),
+                                   key=lambda item: (-item[1], self.books[item[0]][0]))
+
+    def describe(self, book_id):
+        """Returns (title, author name, publisher name) for an indexed book"""
+        with self._lock:
+            title, author_id, publisher_id = self.books[book_id]
+            return title, self.authors.get(author_id), self.publishers.get(publisher_id)
+
+    # -------------------------
+    # Stats
+    # -------------------------
+    def stats(self):
+        with self._lock:
+            posting_entries = sum(len(ids) for p in (self.titles, self.author_names, self.publisher_names)
+                                  for ids in p.postings.values())
+            return {
+                'books': len(self.books),
+                'authors': len(self.authors),
+                'publishers': len(self.publishers),
+                'vocabulary': len(self.vocabulary),
+                'trigrams': len(self.trigram_map),
+                'posting_entries': posting_entries,
+                'built_at': self.built_at,
+                'build_seconds': round(self.build_seconds, 4) if self.build_seconds is not None else None,
+                'approx_memory_bytes': self._approx_memory(),
+            }
+
+    def _approx_memory(self):
+        total = sys.getsizeof(self.vocabulary) + sum(sys.getsizeof(t) for t in self.vocabulary)
+        total += sys.getsizeof(self.books) + sum(sys.getsizeof(v) for v in self.books.values())
+        for mapping in (self.titles.postings, self.author_names.postings, self.publisher_names.postings,
+                        self.trigram_map, self.author_books, self.publisher_books):
+            total += sys.getsizeof(mapping) + sum(sys.getsizeof(v) for v in mapping.values())
+        return total
+
+
+# -------------------------
+# Process-wide index
+# -------------------------
+_index = CatalogIndex()
+_build_lock = threading.Lock()
+# Guards swapping ``_index`` and ``_pending``: the changes made while a
+# rebuild reads the catalog, replayed onto the new index before it goes live.
+_swap_lock = threading.Lock()
+_pending = None
+
+
+def get_index():
+    return _index
+
+
+def is_stale(max_age):
+    if _index.built_at is None:
+        return True
+    return bool(max_age) and time.time() - _index.built_at > max_age
+
+
+def _apply(method, *args):
+    with _swap_lock:
+        getattr(_index, method)(*args)
+        if _pending is not None:
+            _pending.append((method, args))
+
+
+def add_author(author_id, name):
+    _apply('add_author', author_id, name)
+
+
+def add_publisher(publisher_id, name):
+    _apply('add_publisher', publisher_id, name)
+
+
+def upsert_book(book_id, title, author_id, publisher_id):
+    _apply('upsert_book', book_id, title, author_id, publisher_id)
+
+
+def remove_book(book_id):
+    _apply('remove_book', book_id)
+
+
+def _rebuild(connect):
+    """
+    Builds a fresh index off to the side and swaps it in when complete.
+    Changes made through the module functions above while it builds are
+    replayed onto it first (they are idempotent, so one the build already
+    read is harmless).
+    """
+    global _index, _pending
+    with _swap_lock:
+        _pending = []
+    try:
+        fresh = CatalogIndex()
+        conn, release = connect()
+        try:
+            fresh.build(conn)
+        finally:
+            release(conn)
+        with _swap_lock:
+            for method, args in _pending:
+                getattr(fresh, method)(*args)
+            _index = fresh
+    finally:
+        with _swap_lock:
+            _pending = None
+
+
+def ensure_built(connect):
+    """
+    Returns the index, building it first if this process has none yet.
+
+    ``connect`` returns a (connection, release) pair.
+    """
+    if _index.built_at is None:
+        with _build_lock:
+            if _index.built_at is None:
+                _rebuild(connect)
+    return _index
+
+
+def refresh_async(connect, max_age=None, force=False):
+    """Starts a background (re)build when the index is missing, older than ``max_age`` or ``force``d"""
+    if not (force or is_stale(max_age)) or not _build_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            if force or is_stale(max_age):
+                _rebuild(connect)
+        except Exception:
+            logger.exception("Search index build failed")
+        finally:
+            _build_lock.release()
+
+    threading.Thread(target=run, name='search-index-build', daemon=True).start()
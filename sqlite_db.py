@@ -0,0 +1,285 @@
+# sqlite_db.py
+"""
+Embedded SQLite storage backend for single-node deployments (``DB_BACKEND=sqlite``).
+
+A branch that runs the app and its database on one box skips the network
+round trip on every query. Connections are opened by the usual
+``db_pool.ConnectionPool`` and behave like mysql.connector connections
+(``cursor(dictionary=...)``, ``commit``/``rollback``, ``ping``), so the
+routes and helpers run unchanged:
+
+* SQL stays in the MySQL dialect and is rewritten once per statement
+  text (``translate``): ``%s`` placeholders, ``CURDATE()``,
+  ``AUTO_INCREMENT``, ``INSERT IGNORE``, ``ON DUPLICATE KEY UPDATE``,
+  inline indexes in ``CREATE TABLE`` and ``ON UPDATE CURRENT_TIMESTAMP``.
+  Text columns get ``COLLATE NOCASE`` to match MySQL's case-insensitive
+  default collation (and so prefix ``LIKE`` searches can use an index).
+* sqlite3 errors are re-raised as the mysql.connector exception with
+  the matching MySQL errno (1062 duplicate key, 1205 lock wait timeout,
+  1050/1060/1061 already exists), so existing ``except`` clauses, the
+  deadlock retries and the migration runner keep working.
+* Transactions: reads run outside a transaction against the latest
+  committed state; the first write or ``SELECT ... FOR UPDATE`` starts
+  ``BEGIN IMMEDIATE``, which takes the database write lock up front so a
+  transaction never has to upgrade its lock (and fail) halfway through.
+
+Each connection runs in WAL mode (readers never block the writer) with
+``synchronous=NORMAL``, a ``mmap_size`` window so reads come straight from
+the OS page cache shared by every connection and worker process, and a
+per-connection page cache of ``cache_size_kb``.
+"""
+import datetime
+import decimal
+import functools
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+import mysql.connector
+
+sqlite3.register_adapter(decimal.Decimal, str)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATE', lambda raw: datetime.date.fromisoformat(raw.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DECIMAL', lambda raw: decimal.Decimal(raw.decode()))
+
+# MySQL errnos the app and migrate.py check for
+ER_TABLE_EXISTS = 1050
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+ER_DUP_ENTRY = 1062
+ER_BAD_NULL = 1048
+ER_NO_REFERENCED_ROW = 1452
+ER_LOCK_WAIT_TIMEOUT = 1205
+
+
+def connect_args(config):
+    return {
+        'database': config.SQLITE_PATH,
+        'timeout': config.DB_POOL_TIMEOUT,
+        'mmap_size': config.SQLITE_MMAP_SIZE,
+        'cache_size_kb': config.SQLITE_CACHE_SIZE_KB,
+    }
+
+
+def connect(database, timeout=10, mmap_size=0, cache_size_kb=2048):
+    """Opens one tuned connection; the ``connect`` callable for ``db_pool.ConnectionPool``"""
+    directory = os.path.dirname(database)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        db = sqlite3.connect(database, timeout=timeout, isolation_level=None, check_same_thread=False,
+                             detect_types=sqlite3.PARSE_DECLTYPES)
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute("PRAGMA foreign_keys = ON")
+        db.execute("PRAGMA temp_store = MEMORY")
+        db.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        db.execute(f"PRAGMA cache_size = -{int(cache_size_kb)}")
+    except sqlite3.Error as err:
+        raise _mysql_error(err) from err
+    return Connection(db)
+
+
+# -------------------------
+# Dialect
+# -------------------------
+Statement = namedtuple('Statement', 'sql extra writes')
+
+_WRITE_VERBS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'ALTER', 'DROP'}
+
+_AUTO_INCREMENT_RE = re.compile(r'\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.I)
+_VARCHAR_RE = re.compile(r'\b(VARCHAR\(\d+\)|TEXT)(?!\s+COLLATE)', re.I)
+_INLINE_INDEX_RE = re.compile(r',\s*(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)', re.I)
+_INLINE_UNIQUE_RE = re.compile(r'\bUNIQUE\s+KEY\s+(\w+)\s*\(', re.I)
+_ON_UPDATE_RE = re.compile(r'\b(\w+)\s+TIMESTAMP\b[^,]*?\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', re.I)
+_CREATE_TABLE_RE = re.compile(r'^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.I)
+_UPSERT_RE = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$', re.I | re.S)
+_INSERT_SELECT_RE = re.compile(r'^(INSERT\s+INTO\s+\w+\s*\([^)]*\))\s*(SELECT\b.*)$', re.I | re.S)
+_SELF_ASSIGN_RE = re.compile(r'^\s*(\w+)\s*=\s*\1\s*$')
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    """
+    Rewrites one MySQL statement for SQLite.
+
+    Returns ``Statement(sql, extra, writes)``: ``sql`` is None for statements
+    with no SQLite equivalent (``ALTER TABLE ... MODIFY``, column sizes are
+    not enforced), ``extra`` holds follow-up DDL (indexes and triggers split
+    out of a ``CREATE TABLE``) and ``writes`` says whether the statement
+    needs the write lock.
+    """
+    sql = sql.strip()
+    verb = sql.split(None, 1)[0].upper() if sql else ''
+    writes = verb in _WRITE_VERBS or bool(re.search(r'\bFOR\s+UPDATE\s*$', sql, re.I))
+    if re.match(r'^ALTER\s+TABLE\s+\w+\s+MODIFY\b', sql, re.I):
+        return Statement(None, (), True)
+
+    extra = []
+    table = _CREATE_TABLE_RE.match(sql)
+    if table:
+        table = table.group(1)
+        sql = _AUTO_INCREMENT_RE.sub('INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+        sql = _VARCHAR_RE.sub(r'\1 COLLATE NOCASE', sql)
+        sql = _INLINE_UNIQUE_RE.sub(r'CONSTRAINT \1 UNIQUE (', sql)
+        for name, columns in _INLINE_INDEX_RE.findall(sql):
+            extra.append(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        sql = _INLINE_INDEX_RE.sub('', sql)
+        for column in _ON_UPDATE_RE.findall(sql):
+            extra.append(f"CREATE TRIGGER IF NOT EXISTS {table}_{column}_on_update "
+                         f"AFTER UPDATE ON {table} FOR EACH ROW WHEN NEW.{column} = OLD.{column} "
+                         f"BEGIN UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid; END")
+        sql = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', sql, flags=re.I)
+
+    sql = re.sub(r'\bCURDATE\(\)', "date('now', 'localtime')", sql, flags=re.I)
+    sql = re.sub(r'^INSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.I)
+    sql = re.sub(r'\s+FOR\s+UPDATE\s*$', '', sql, flags=re.I)
+
+    upsert = _UPSERT_RE.search(sql)
+    if upsert:
+        sql = sql[:upsert.start()]
+        assignments = upsert.group(1)
+        if all(_SELF_ASSIGN_RE.match(part) for part in assignments.split(',')):
+            conflict = "ON CONFLICT DO NOTHING"  # MySQL's no-op update; affects no rows either way
+        else:
+            conflict = "ON CONFLICT DO UPDATE SET " + re.sub(r'\bVALUES\((\w+)\)', r'excluded.\1', assignments)
+        insert_select = _INSERT_SELECT_RE.match(sql)
+        if insert_select:
+            # An upsert's SELECT needs a WHERE so ON is not read as a join constraint.
+            sql = f"{insert_select.group(1)} SELECT * FROM ({insert_select.group(2)}) WHERE true"
+        sql = f"{sql} {conflict}"
+
+    sql = sql.replace('%s', '?').replace('%%', '%')
+    return Statement(sql, tuple(extra), writes)
+
+
+def _mysql_error(err):
+    """The mysql.connector exception (with MySQL errno) matching a sqlite3 error"""
+    msg = str(err)
+    lowered = msg.lower()
+    if isinstance(err, sqlite3.IntegrityError):
+        if 'unique' in lowered or 'primary key' in lowered:
+            errno = ER_DUP_ENTRY
+        elif 'foreign key' in lowered:
+            errno = ER_NO_REFERENCED_ROW
+        elif 'not null' in lowered:
+            errno = ER_BAD_NULL
+        else:
+            errno = None
+        return mysql.connector.IntegrityError(msg=msg, errno=errno)
+    if 'locked' in lowered or 'busy' in lowered:
+        return mysql.connector.DatabaseError(msg=msg, errno=ER_LOCK_WAIT_TIMEOUT)
+    if 'already exists' in lowered:
+        errno = ER_DUP_KEYNAME if lowered.startswith('index') else ER_TABLE_EXISTS
+        return mysql.connector.ProgrammingError(msg=msg, errno=errno)
+    if 'duplicate column name' in lowered:
+        return mysql.connector.ProgrammingError(msg=msg, errno=ER_DUP_FIELDNAME)
+    if isinstance(err, sqlite3.OperationalError):
+        return mysql.connector.ProgrammingError(msg=msg)
+    return mysql.connector.DatabaseError(msg=msg)
+
+
+# -------------------------
+# Connection and cursor
+# -------------------------
+class Cursor:
+    """mysql.connector-style cursor; rows are tuples, or dicts with ``dictionary=True``"""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+        self._dictionary = dictionary
+
+    def _run(self, sql, run):
+        statement = translate(sql)
+        if statement.sql is None:
+            return
+        try:
+            if statement.writes:
+                self._connection._begin()
+            run(statement.sql)
+            for extra in statement.extra:
+                self._cursor.execute(extra)
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def execute(self, sql, params=()):
+        self._run(sql, lambda query: self._cursor.execute(query, tuple(params or ())))
+
+    def executemany(self, sql, seq_params):
+        self._run(sql, lambda query: self._cursor.executemany(query, [tuple(p) for p in seq_params]))
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """mysql.connector-style connection over one sqlite3 connection"""
+
+    def __init__(self, db):
+        self._db = db
+        self.autocommit = False
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        # sqlite3 cursors step through results lazily, so buffered=False needs nothing extra.
+        return Cursor(self, dictionary)
+
+    def _begin(self):
+        if not self.autocommit and not self._db.in_transaction:
+            self._db.execute("BEGIN IMMEDIATE")
+
+    def start_transaction(self, **kwargs):
+        try:
+            self._begin()
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def ping(self, reconnect=False, **kwargs):
+        try:
+            self._db.execute("SELECT 1").fetchone()
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def close(self):
+        self._db.close()
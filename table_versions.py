@@ -0,0 +1,48 @@
+# table_versions.py
+"""
+Persistent per-table change versions for HTTP validators.
+
+Unlike the in-process versions in query_cache.py these live in the
+database (``Table_Version``), so every worker agrees on them and an ETag
+computed from them changes as soon as any worker writes to a table. A
+conditional GET can then be answered with ``304 Not Modified`` after one
+primary-key read, without running the listing query.
+
+Writes made outside the app (manual SQL) do not bump versions; bump the
+affected tables by hand afterwards, e.g.
+``UPDATE Table_Version SET version = version + 1 WHERE name = 'Book'``.
+"""
+import hashlib
+
+
+_BUMP_SQL = "INSERT INTO Table_Version (name, version) VALUES (%s, 1) ON DUPLICATE KEY UPDATE version = version + 1"
+
+
+def bump(cursor, *tables):
+    """Advances the version of each table; call after (or inside) the writing transaction"""
+    if not tables:
+        return
+    cursor.executemany(_BUMP_SQL, [(table,) for table in sorted(set(tables))])
+
+
+async def bump_async(cursor, *tables):
+    """``bump`` on an async_db cursor"""
+    if tables:
+        await cursor.executemany(_BUMP_SQL, [(table,) for table in sorted(set(tables))])
+
+
+def read(cursor, tables):
+    """Returns {table: version} for ``tables`` (0 for tables never written)"""
+    tables = sorted(set(tables))
+    placeholders = ', '.join(['%s'] * len(tables))
+    cursor.execute(f"SELECT name, version FROM Table_Version WHERE name IN ({placeholders})", tuple(tables))
+    versions = dict.fromkeys(tables, 0)
+    for name, version in cursor.fetchall():
+        versions[name] = int(version)
+    return versions
+
+
+def etag(scope, versions):
+    """Strong validator for a response that depends on ``versions`` and nothing else but ``scope``"""
+    material = repr((scope, sorted(versions.items()))).encode()
+    return hashlib.sha1(material).hexdigest()
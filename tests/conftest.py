@@ -0,0 +1,55 @@
+"""
+Fixtures for tests that run against a throwaway SQLite database
+(``sqlite_db``), so no MySQL server is needed: each test gets a fresh file
+with mysql.sql and every migration applied.
+"""
+import pytest
+
+import db_pool
+import migrate
+import sqlite_db
+from config import Config
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'library.db')
+    conn = sqlite_db.connect(path)
+    try:
+        migrate.load_baseline(conn)
+        migrate.migrate(conn)
+    finally:
+        conn.close()
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    conn = sqlite_db.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    """A Flask test client on ``db_path``, signed in as the admin."""
+    import app as app_module
+
+    monkeypatch.setattr(Config, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(Config, 'SQLITE_PATH', db_path)
+    monkeypatch.setattr(db_pool, '_pool', None)
+    app_module.query_cache.clear()
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session.update(role='admin', user_id=1, username='admin')
+    return client
+
+
+def scalar(db, sql, params=()):
+    cursor = db.cursor()
+    try:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
@@ -0,0 +1,119 @@
+import datetime
+
+import mysql.connector
+import pytest
+
+import circulation
+from tests.conftest import scalar
+
+ISSUED = datetime.date(2026, 3, 2)
+DUE = datetime.date(2026, 3, 16)
+
+
+def _issue(db, book_id, member_id):
+    [result] = circulation.apply_batch(db, issues=[(book_id, member_id)], issue_date=ISSUED, return_date=DUE)
+    assert result['ok'], result
+    return result['issue_id']
+
+
+def _quantity(db, book_id):
+    return scalar(db, "SELECT quantity FROM Book WHERE id = %s", (book_id,))
+
+
+def test_failed_item_does_not_block_the_rest(db):
+    loan = _issue(db, 3, 2)
+    stock = _quantity(db, 1)
+
+    results = circulation.apply_batch(db, issues=[(1, 1), (999, 1), (1, 999)], returns=[loan, 424242],
+                                      issue_date=ISSUED, return_date=DUE)
+
+    assert [r['ok'] for r in results] == [True, False, True, False, False]
+    assert results[1]['error'] == 'Already returned or not found.'
+    assert results[3]['error'] == 'Book not found.'
+    assert results[4]['error'] == 'Member not found.'
+    assert _quantity(db, 1) == stock - 1
+    assert scalar(db, "SELECT returned FROM Issued_Books WHERE id = %s", (loan,)) == 1
+    assert scalar(db, "SELECT COUNT(*) FROM Issued_Books WHERE id = %s", (results[2]['issue_id'],)) == 1
+
+
+def test_out_of_stock_and_duplicate_return(db):
+    cursor = db.cursor()
+    cursor.execute("UPDATE Book SET quantity = 1 WHERE id = 2")
+    db.commit()
+    cursor.close()
+    loan = _issue(db, 4, 1)
+
+    results = circulation.apply_batch(db, issues=[(2, 1), (2, 2)], returns=[loan, loan],
+                                      issue_date=ISSUED, return_date=DUE)
+
+    assert [r['ok'] for r in results] == [True, False, True, False]
+    assert results[3]['error'] == 'Out of stock.'
+    assert _quantity(db, 2) == 0
+
+
+def test_return_hands_copy_to_waitlist_head(db):
+    loan = _issue(db, 5, 1)
+    cursor = db.cursor()
+    cursor.execute("UPDATE Book SET quantity = 0 WHERE id = 5")
+    cursor.execute("INSERT INTO Waitlist (book_id, member_id) VALUES (5, 2)")
+    db.commit()
+    cursor.close()
+
+    [result] = circulation.apply_batch(db, returns=[loan])
+
+    assert result['ok'] and result['reserved_for'] == 2
+    assert _quantity(db, 5) == 0
+    assert scalar(db, "SELECT COUNT(*) FROM Waitlist WHERE book_id = 5") == 0
+
+
+def test_waitlist_skips_member_over_fine_threshold(db):
+    loan = _issue(db, 7, 2)
+    cursor = db.cursor()
+    cursor.execute("UPDATE Book SET quantity = 0 WHERE id = 7")
+    cursor.execute("INSERT INTO Waitlist (book_id, member_id) VALUES (7, 1), (7, 2)")
+    cursor.execute("INSERT INTO Member_Balance (member_id, balance) VALUES (1, 25.00) "
+                   "ON DUPLICATE KEY UPDATE balance = VALUES(balance)")
+    db.commit()
+    cursor.close()
+
+    [result] = circulation.apply_batch(db, returns=[loan], max_balance='10.00')
+
+    assert result['reserved_for'] == 2
+    assert scalar(db, "SELECT member_id FROM Waitlist WHERE book_id = 7") == 1
+
+
+def test_batch_retries_after_deadlock(db, monkeypatch):
+    apply = circulation._apply
+    calls = []
+
+    def deadlock_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise mysql.connector.DatabaseError(msg='Deadlock found', errno=1213)
+        return apply(*args)
+
+    monkeypatch.setattr(circulation, '_apply', deadlock_once)
+    monkeypatch.setattr(circulation.time, 'sleep', lambda seconds: None)
+
+    [result] = circulation.apply_batch(db, issues=[(6, 1)], issue_date=ISSUED, return_date=DUE)
+
+    assert result['ok'] and len(calls) == 2
+
+
+def test_other_errors_are_not_retried(db, monkeypatch):
+    calls = []
+
+    def fail(*args):
+        calls.append(args)
+        raise mysql.connector.DatabaseError(msg='Lost connection', errno=2013)
+
+    monkeypatch.setattr(circulation, '_apply', fail)
+
+    with pytest.raises(mysql.connector.DatabaseError):
+        circulation.apply_batch(db, returns=[1])
+    assert len(calls) == 1
+
+
+def test_empty_batch_is_rejected(db):
+    with pytest.raises(circulation.CirculationError):
+        circulation.apply_batch(db)
@@ -0,0 +1,88 @@
+import datetime
+import decimal
+
+import overdue_fines
+from tests.conftest import scalar
+
+AS_OF = datetime.date(2026, 4, 1)
+RATES = overdue_fines.FineRates('0.50', max_per_loan='10.00')
+
+
+def _overdue_loan(db, book_id, member_id, due):
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO Issued_Books (book_id, member_id, issue_date, return_date) VALUES (%s, %s, %s, %s)",
+                   (book_id, member_id, due - datetime.timedelta(days=14), due))
+    db.commit()
+    issue_id = cursor.lastrowid
+    cursor.close()
+    return issue_id
+
+
+def _totals(db):
+    return (scalar(db, "SELECT COUNT(*) FROM Fine"), scalar(db, "SELECT COUNT(*) FROM Fine_Ledger"),
+            decimal.Decimal(str(scalar(db, "SELECT COALESCE(SUM(balance), 0) FROM Member_Balance"))))
+
+
+def _fine(db, issue_id):
+    return scalar(db, "SELECT amount FROM Fine WHERE issue_id = %s", (issue_id,))
+
+
+def test_second_run_on_the_same_day_changes_nothing(db):
+    first_loan = _overdue_loan(db, 1, 1, AS_OF - datetime.timedelta(days=4))
+    _overdue_loan(db, 2, 2, AS_OF - datetime.timedelta(days=60))
+
+    first = overdue_fines.run(db, RATES, as_of=AS_OF)
+    assert first['fines_created'] >= 2
+    assert decimal.Decimal(str(_fine(db, first_loan))) == decimal.Decimal('2.00')
+    totals = _totals(db)
+
+    for full in (False, True):
+        again = overdue_fines.run(db, RATES, as_of=AS_OF, full=full)
+        assert (again['fines_created'], again['fines_updated']) == (0, 0)
+        assert _totals(db) == totals
+
+
+def test_next_day_updates_the_fine_in_place(db):
+    loan = _overdue_loan(db, 3, 1, AS_OF - datetime.timedelta(days=2))
+    overdue_fines.run(db, RATES, as_of=AS_OF)
+    fines = scalar(db, "SELECT COUNT(*) FROM Fine")
+
+    later = overdue_fines.run(db, RATES, as_of=AS_OF + datetime.timedelta(days=1))
+
+    assert later['fines_created'] == 0 and later['fines_updated'] >= 1
+    assert scalar(db, "SELECT COUNT(*) FROM Fine") == fines
+    assert decimal.Decimal(str(_fine(db, loan))) == decimal.Decimal('1.50')
+
+
+def test_deleted_engine_fine_is_not_charged_again(db, client):
+    loan = _overdue_loan(db, 4, 2, AS_OF - datetime.timedelta(days=5))
+    overdue_fines.run(db, RATES, as_of=AS_OF)
+    fine_id = scalar(db, "SELECT id FROM Fine WHERE issue_id = %s", (loan,))
+    balance = scalar(db, "SELECT balance FROM Member_Balance WHERE member_id = 2")
+
+    response = client.get(f'/admin/fine/delete/{fine_id}')
+    assert response.status_code == 302
+    assert _fine(db, loan) is None
+    assert decimal.Decimal(str(scalar(db, "SELECT balance FROM Member_Balance WHERE member_id = 2"))) \
+        == decimal.Decimal(str(balance)) - decimal.Decimal('2.50')
+
+    for as_of, full in ((AS_OF, False), (AS_OF + datetime.timedelta(days=1), False),
+                        (AS_OF + datetime.timedelta(days=2), True)):
+        overdue_fines.run(db, RATES, as_of=as_of, full=full)
+        assert _fine(db, loan) is None
+
+
+def test_assess_fines_command_is_idempotent(db, client):
+    import app as app_module
+
+    _overdue_loan(db, 5, 1, AS_OF - datetime.timedelta(days=3))
+    runner = app_module.app.test_cli_runner()
+
+    first = runner.invoke(args=['assess-fines', '--as-of', AS_OF.isoformat()])
+    assert first.exit_code == 0, first.output
+    totals = _totals(db)
+    second = runner.invoke(args=['assess-fines', '--as-of', AS_OF.isoformat()])
+
+    assert second.exit_code == 0, second.output
+    assert '0 fines created, 0 updated' in second.output
+    assert _totals(db) == totals
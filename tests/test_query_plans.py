@@ -0,0 +1,30 @@
+"""
+Runs ``query_plans.run_checks`` (the ``check-query-plans`` command) against
+the MySQL server named by ``MYSQL_HOST``. EXPLAIN output is MySQL's own, so
+the module is skipped when ``MYSQL_HOST`` is unset or cannot be reached.
+"""
+import os
+
+import mysql.connector
+import pytest
+
+import query_plans
+from config import Config
+
+
+@pytest.fixture(scope='module')
+def mysql_db():
+    if not os.environ.get('MYSQL_HOST'):
+        pytest.skip("MYSQL_HOST is not set")
+    if Config.DB_BACKEND != 'mysql':
+        pytest.skip("query plans are checked on MySQL only (DB_BACKEND=mysql)")
+    try:
+        conn = mysql.connector.connect(**Config.get_db_config(), connection_timeout=3)
+    except mysql.connector.Error as err:
+        pytest.skip(f"MySQL at {Config.DB_HOST} is not reachable: {err}")
+    yield conn
+    conn.close()
+
+
+def test_every_query_plan_uses_an_index(mysql_db):
+    assert query_plans.run_checks(mysql_db) == []
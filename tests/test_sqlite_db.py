@@ -0,0 +1,182 @@
+import datetime
+
+import mysql.connector
+import pytest
+
+import sqlite_db
+from tests.conftest import scalar
+
+MEMBER_DDL = """
+    CREATE TABLE Member (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(50) NOT NULL,
+        UNIQUE KEY uq_member_username (username)
+    )
+"""
+LOAN_DDL = """
+    CREATE TABLE Loan (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NOT NULL,
+        title TEXT,
+        copies INT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_loan_member (member_id),
+        FOREIGN KEY (member_id) REFERENCES Member(id)
+    )
+"""
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite_db.connect(str(tmp_path / 'translate.db'))
+    cursor = conn.cursor()
+    cursor.execute(MEMBER_DDL)
+    cursor.execute(LOAN_DDL)
+    cursor.execute("INSERT INTO Member (username) VALUES (%s), (%s)", ('ann', 'bob'))
+    conn.commit()
+    cursor.close()
+    yield conn
+    conn.close()
+
+
+def _execute(conn, sql, params=()):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def test_placeholders_and_literal_percent(conn):
+    assert sqlite_db.translate("SELECT id FROM Member WHERE username LIKE %s AND id > %s").sql \
+        == "SELECT id FROM Member WHERE username LIKE ? AND id > ?"
+    assert sqlite_db.translate("SELECT 'a%%'").sql == "SELECT 'a%'"
+    assert scalar(conn, "SELECT COUNT(*) FROM Member WHERE username LIKE %s", ('a%',)) == 1
+
+
+def test_auto_increment_primary_key(conn):
+    statement = sqlite_db.translate(MEMBER_DDL)
+    assert 'INTEGER PRIMARY KEY AUTOINCREMENT' in statement.sql and statement.writes
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Member (username) VALUES (%s)", ('cy',))
+    assert cursor.lastrowid == 3
+    cursor.close()
+
+
+def test_text_columns_compare_case_insensitively(conn):
+    assert 'VARCHAR(50) COLLATE NOCASE' in sqlite_db.translate(MEMBER_DDL).sql
+    assert scalar(conn, "SELECT id FROM Member WHERE username = %s", ('ANN',)) == 1
+
+
+def test_inline_index_becomes_create_index(conn):
+    statement = sqlite_db.translate(LOAN_DDL)
+    assert 'idx_loan_member' not in statement.sql
+    assert "CREATE INDEX IF NOT EXISTS idx_loan_member ON Loan (member_id)" in statement.extra
+    assert scalar(conn, "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = 'idx_loan_member'") == 1
+
+
+def test_unique_key_becomes_constraint(conn):
+    assert 'CONSTRAINT uq_member_username UNIQUE (username)' in sqlite_db.translate(MEMBER_DDL).sql
+    with pytest.raises(mysql.connector.IntegrityError) as err:
+        _execute(conn, "INSERT INTO Member (username) VALUES (%s)", ('Ann',))
+    assert err.value.errno == sqlite_db.ER_DUP_ENTRY
+
+
+def test_on_update_current_timestamp_becomes_trigger(conn):
+    statement = sqlite_db.translate(LOAN_DDL)
+    assert 'ON UPDATE' not in statement.sql
+    assert any(sql.startswith('CREATE TRIGGER IF NOT EXISTS Loan_updated_at_on_update') for sql in statement.extra)
+    _execute(conn, "INSERT INTO Loan (member_id, updated_at) VALUES (1, '2000-01-01 00:00:00')")
+    _execute(conn, "UPDATE Loan SET copies = 2 WHERE member_id = 1")
+    assert scalar(conn, "SELECT updated_at FROM Loan WHERE member_id = 1") > datetime.datetime(2000, 1, 1)
+
+
+def test_alter_table_modify_is_skipped(conn):
+    assert sqlite_db.translate("ALTER TABLE Loan MODIFY title VARCHAR(255) NOT NULL") == (None, (), True)
+    _execute(conn, "ALTER TABLE Loan MODIFY title VARCHAR(255) NOT NULL")
+
+
+def test_curdate(conn):
+    assert "date('now', 'localtime')" in sqlite_db.translate("SELECT CURDATE()").sql
+    assert scalar(conn, "SELECT CURDATE()") == datetime.date.today().isoformat()
+
+
+def test_insert_ignore(conn):
+    assert sqlite_db.translate("INSERT IGNORE INTO Member (username) VALUES (%s)").sql \
+        == "INSERT OR IGNORE INTO Member (username) VALUES (?)"
+    assert _execute(conn, "INSERT IGNORE INTO Member (username) VALUES (%s)", ('ann',)) == 0
+    assert scalar(conn, "SELECT COUNT(*) FROM Member") == 2
+
+
+def test_for_update_is_dropped_and_takes_the_write_lock(conn):
+    statement = sqlite_db.translate("SELECT id FROM Member WHERE id = %s FOR UPDATE")
+    assert statement.sql == "SELECT id FROM Member WHERE id = ?" and statement.writes
+    assert not sqlite_db.translate("SELECT id FROM Member WHERE id = %s").writes
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM Member WHERE id = %s FOR UPDATE", (1,))
+    assert cursor.fetchone() == (1,)
+    assert conn._db.in_transaction
+    conn.rollback()
+    cursor.close()
+
+
+def test_on_duplicate_key_update_uses_excluded(conn):
+    sql = ("INSERT INTO Member (id, username) VALUES (%s, %s) "
+           "ON DUPLICATE KEY UPDATE username = VALUES(username)")
+    assert sqlite_db.translate(sql).sql == ("INSERT INTO Member (id, username) VALUES (?, ?) "
+                                            "ON CONFLICT DO UPDATE SET username = excluded.username")
+    _execute(conn, sql, (1, 'anne'))
+    _execute(conn, sql, (3, 'cy'))
+    assert [scalar(conn, "SELECT username FROM Member WHERE id = %s", (i,)) for i in (1, 3)] == ['anne', 'cy']
+
+
+def test_on_duplicate_key_self_assignment_does_nothing(conn):
+    sql = "INSERT INTO Member (id, username) VALUES (%s, %s) ON DUPLICATE KEY UPDATE id = id"
+    assert sqlite_db.translate(sql).sql.endswith("ON CONFLICT DO NOTHING")
+    assert _execute(conn, sql, (1, 'anne')) == 0
+    assert scalar(conn, "SELECT username FROM Member WHERE id = 1") == 'ann'
+
+
+def test_insert_select_upsert(conn):
+    sql = ("INSERT INTO Loan (id, member_id, copies) SELECT id, id, 5 FROM Member "
+           "ON DUPLICATE KEY UPDATE copies = copies + VALUES(copies)")
+    assert sqlite_db.translate(sql).sql.endswith("WHERE true ON CONFLICT DO UPDATE SET copies = copies + excluded.copies")
+    _execute(conn, sql)
+    _execute(conn, sql)
+    assert scalar(conn, "SELECT SUM(copies) FROM Loan") == 20
+
+
+@pytest.mark.parametrize('sql, params, error, errno', [
+    ("INSERT INTO Member (id, username) VALUES (%s, %s)", (1, 'dup'), mysql.connector.IntegrityError,
+     sqlite_db.ER_DUP_ENTRY),
+    ("INSERT INTO Loan (member_id) VALUES (%s)", (99,), mysql.connector.IntegrityError,
+     sqlite_db.ER_NO_REFERENCED_ROW),
+    ("INSERT INTO Member (username) VALUES (%s)", (None,), mysql.connector.IntegrityError, sqlite_db.ER_BAD_NULL),
+    (MEMBER_DDL, (), mysql.connector.ProgrammingError, sqlite_db.ER_TABLE_EXISTS),
+    ("CREATE INDEX idx_loan_member ON Loan (member_id)", (), mysql.connector.ProgrammingError,
+     sqlite_db.ER_DUP_KEYNAME),
+    ("ALTER TABLE Loan ADD COLUMN copies INT", (), mysql.connector.ProgrammingError, sqlite_db.ER_DUP_FIELDNAME),
+    ("SELECT nope FROM Member", (), mysql.connector.ProgrammingError, -1),
+])
+def test_errors_carry_mysql_errno(conn, sql, params, error, errno):
+    with pytest.raises(error) as err:
+        _execute(conn, sql, params)
+    assert err.value.errno == errno
+    conn.rollback()
+
+
+def test_lock_timeout_maps_to_lock_wait_errno(conn, tmp_path):
+    _execute(conn, "SELECT 1")
+    other = sqlite_db.connect(str(tmp_path / 'translate.db'), timeout=0.05)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE Member SET username = 'anne' WHERE id = 1")
+    try:
+        with pytest.raises(mysql.connector.DatabaseError) as err:
+            other.cursor().execute("UPDATE Member SET username = 'bobby' WHERE id = 2")
+        assert err.value.errno == sqlite_db.ER_LOCK_WAIT_TIMEOUT
+    finally:
+        conn.rollback()
+        cursor.close()
+        other.close()
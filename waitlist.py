@@ -0,0 +1,127 @@
+# waitlist.py
+"""
+FIFO reservation waitlist per book.
+
+A member who asks for a title with no copies on the shelf is enqueued once
+(``Waitlist``, unique per book and member) instead of retrying. When a copy
+comes back, ``promote()`` turns the head of the queue into a
+``Reservation`` inside the returning transaction, so the copy never shows
+as available in between. Callers must already hold the ``Book`` row lock
+(``SELECT ... FOR UPDATE`` or an ``UPDATE``) so two returns cannot promote
+the same member. Members whose fine balance is over the block threshold
+are passed over (and keep their place) until they pay it down.
+"""
+import decimal
+
+import counters
+
+
+_ENQUEUE_SQL = "INSERT INTO Waitlist (book_id, member_id) VALUES (%s, %s) ON DUPLICATE KEY UPDATE id = id"
+_ENTRY_SQL = "SELECT id FROM Waitlist WHERE book_id = %s AND member_id = %s"
+_POSITION_SQL = "SELECT COUNT(*) FROM Waitlist WHERE book_id = %s AND id <= %s"
+_HEADS_SQL = "SELECT id, member_id FROM Waitlist w WHERE book_id = %s{} ORDER BY id LIMIT %s FOR UPDATE"
+# Not a locking read: the subquery does not lock Member_Balance rows.
+_UNDER_LIMIT = " AND NOT EXISTS (SELECT 1 FROM Member_Balance mb WHERE mb.member_id = w.member_id AND mb.balance > %s)"
+_RESERVE_SQL = "INSERT INTO Reservation (book_id, member_id, reservation_date) VALUES (%s, %s, CURDATE())"
+
+
+def _heads(book_id, copies, max_balance):
+    """SQL and params for the first ``copies`` entries, skipping members owing more than ``max_balance``"""
+    if not max_balance:
+        return _HEADS_SQL.format(''), (book_id, copies)
+    return _HEADS_SQL.format(_UNDER_LIMIT), (book_id, decimal.Decimal(str(max_balance)), copies)
+
+
+def _delete_sql(ids):
+    return f"DELETE FROM Waitlist WHERE id IN ({', '.join(['%s'] * len(ids))})"
+
+
+def enqueue(cursor, book_id, member_id):
+    """Adds the member to the book's queue (no-op if already queued); returns their position"""
+    cursor.execute(_ENQUEUE_SQL, (book_id, member_id))
+    return position(cursor, book_id, member_id)
+
+
+def position(cursor, book_id, member_id):
+    """1-based place in the queue, or None when the member is not waiting for the book"""
+    cursor.execute(_ENTRY_SQL, (book_id, member_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute(_POSITION_SQL, (book_id, row[0]))
+    return cursor.fetchone()[0]
+
+
+def leave(cursor, book_id, member_id):
+    cursor.execute("DELETE FROM Waitlist WHERE book_id = %s AND member_id = %s", (book_id, member_id))
+    return cursor.rowcount > 0
+
+
+def promote(cursor, book_id, copies, max_balance=None):
+    """
+    Hands up to ``copies`` returned copies to the front of the queue as
+    reservations; returns the member ids served (the rest go back to stock).
+    ``max_balance`` (``Config.FINE_BLOCK_THRESHOLD``; empty means no limit)
+    skips members who could not reserve the book themselves.
+    """
+    if copies <= 0:
+        return []
+    cursor.execute(*_heads(book_id, copies, max_balance))
+    heads = cursor.fetchall()
+    if not heads:
+        return []
+    ids = [entry_id for entry_id, _ in heads]
+    members = [member_id for _, member_id in heads]
+    cursor.execute(_delete_sql(ids), tuple(ids))
+    cursor.executemany(_RESERVE_SQL, [(book_id, member_id) for member_id in members])
+    counters.bump(cursor, counters.RESERVATIONS, len(members))
+    for member_id in members:
+        counters.bump_member(cursor, member_id, reservations=1)
+    return members
+
+
+async def enqueue_async(cursor, book_id, member_id):
+    """``enqueue`` on an async_db cursor"""
+    await cursor.execute(_ENQUEUE_SQL, (book_id, member_id))
+    return await position_async(cursor, book_id, member_id)
+
+
+async def position_async(cursor, book_id, member_id):
+    """``position`` on an async_db cursor"""
+    await cursor.execute(_ENTRY_SQL, (book_id, member_id))
+    row = await cursor.fetchone()
+    if row is None:
+        return None
+    await cursor.execute(_POSITION_SQL, (book_id, row[0]))
+    return (await cursor.fetchone())[0]
+
+
+async def promote_async(cursor, book_id, copies, max_balance=None):
+    """``promote`` on an async_db cursor"""
+    if copies <= 0:
+        return []
+    await cursor.execute(*_heads(book_id, copies, max_balance))
+    heads = await cursor.fetchall()
+    if not heads:
+        return []
+    ids = [entry_id for entry_id, _ in heads]
+    members = [member_id for _, member_id in heads]
+    await cursor.execute(_delete_sql(ids), tuple(ids))
+    await cursor.executemany(_RESERVE_SQL, [(book_id, member_id) for member_id in members])
+    await counters.bump_async(cursor, counters.RESERVATIONS, len(members))
+    for member_id in members:
+        await counters.bump_member_async(cursor, member_id, reservations=1)
+    return members
+
+
+def for_member(cursor, member_id):
+    """The member's queue entries with their current positions (dictionary cursor)"""
+    cursor.execute("""
+        SELECT w.book_id, b.title, w.created_at,
+               (SELECT COUNT(*) FROM Waitlist q WHERE q.book_id = w.book_id AND q.id <= w.id) AS position
+        FROM Waitlist w
+        JOIN Book b ON b.id = w.book_id
+        WHERE w.member_id = %s
+        ORDER BY w.id
+    """, (member_id,))
+    return cursor.fetchall()